@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""Нагрузочный бенчмарк очереди: Queue API -> воркер -> get_task без внешних сервисов.
+
+Redis заменяется fakeredis (или указывается --redis-url, например, локальный
+redis-server), Langflow - заглушкой stub_langflow, запущенной в том же процессе.
+API вызывается через ASGI-транспорт, воркер - настоящий run_worker. Итог
+выводится в JSON и при --output дописывается строкой в JSONL-файл, чтобы
+сравнивать прогоны между собой.
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+for path in (ROOT / "services", ROOT / "services" / "api", ROOT / "services" / "worker", ROOT / "benchmarks"):
+    sys.path.insert(0, str(path))
+
+from langflow_queue.base import TERMINAL_STATUSES
+
+# Повторные опросы, которыми эмулируется блокирующее чтение в fakeredis: в
+# настоящем Redis это один round-trip, поэтому счётчик их пропускает
+_EMULATED_WAIT = contextvars.ContextVar("emulated_wait", default=False)
+
+
+class RoundTripCounter:
+    """Считает обращения к Redis: отдельная команда или pipeline - один round-trip."""
+
+    def __init__(self) -> None:
+        self.commands: dict[str, int] = {}
+
+    @property
+    def total(self) -> int:
+        return sum(self.commands.values())
+
+    def install(self) -> None:
+        from redis.asyncio.client import Pipeline, Redis
+
+        counter = self
+        execute_command = Redis.execute_command
+        execute_pipeline = Pipeline.execute
+
+        async def counted_command(self, *args, **options):
+            if _EMULATED_WAIT.get():
+                return await execute_command(self, *args, **options)
+            name = str(args[0]).split(" ")[0].lower() if args else "?"
+            counter.commands[name] = counter.commands.get(name, 0) + 1
+            return await execute_command(self, *args, **options)
+
+        async def counted_pipeline(self, *args, **options):
+            counter.commands["pipeline"] = counter.commands.get("pipeline", 0) + 1
+            return await execute_pipeline(self, *args, **options)
+
+        Redis.execute_command = counted_command
+        Pipeline.execute = counted_pipeline
+
+
+def _percentiles(values: list[float]) -> Optional[dict[str, float]]:
+    if not values:
+        return None
+    values = sorted(values)
+
+    def rank(p: float) -> float:
+        return values[min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))]
+
+    return {
+        "p50": rank(50),
+        "p95": rank(95),
+        "p99": rank(99),
+        "mean": sum(values) / len(values),
+        "max": values[-1],
+    }
+
+
+def _interval(record: dict, start: str, end: str) -> Optional[float]:
+    from langflow_queue.metrics import seconds_between
+
+    values = {**record, "created_at": (record.get("request") or {}).get("created_at")}
+    return seconds_between(values.get(start), values.get(end))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def _start_stub(settings) -> tuple[Any, asyncio.Task, str]:
+    import uvicorn
+    from stub_langflow import create_stub_app
+
+    port = _free_port()
+    config = uvicorn.Config(create_stub_app(settings), host="127.0.0.1", port=port, log_level="warning", lifespan="off")
+    server = uvicorn.Server(config)
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server, task, f"http://127.0.0.1:{port}"
+
+
+async def _wait_task(api, task_id: str, deadline: float, include_response: bool) -> dict:
+    while True:
+        wait = max(1, min(30, int(deadline - time.monotonic())))
+        response = await api.get(
+            f"/get_task/{task_id}",
+            params={"wait": wait, "include_response": str(include_response).lower()},
+        )
+        response.raise_for_status()
+        record = response.json()
+        if record.get("status") in TERMINAL_STATUSES:
+            return record
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"Task {task_id} not finished in time")
+
+
+async def _run_request(api, index: int, args) -> dict:
+    """Один запуск flow так, как его выполнил бы клиент, от запроса до результата."""
+    flow_id = f"bench-flow-{index % args.flows}"
+    body = {"inputs": {"input_value": f"benchmark request {index}"}}
+    params: dict[str, str] = {}
+    if args.mode == "chain":
+        params["chain_events"] = "true"
+    elif args.mode == "streaming":
+        params["event_delivery"] = "streaming"
+    if args.sync_timeout:
+        params["sync_timeout"] = str(args.sync_timeout)
+
+    started = time.monotonic()
+    deadline = started + args.timeout
+    response = await api.post(f"/api/v1/build/{flow_id}/flow", params=params, json=body)
+    response.raise_for_status()
+    record = response.json()
+    if record.get("status") not in TERMINAL_STATUSES:
+        record = await _wait_task(api, record["task_id"], deadline, args.mode == "two-step")
+    records = [record]
+
+    if args.mode == "two-step" and records[0]["status"] == "completed":
+        job_id = records[0]["response"]["data"]["data"]["job_id"]
+        response = await api.get(f"/api/v1/build/{job_id}/events", params={"event_delivery": "polling"})
+        response.raise_for_status()
+        records.append(await _wait_task(api, response.json()["task_id"], deadline, False))
+
+    return {"latency": time.monotonic() - started, "records": records}
+
+
+async def _drive(api, args) -> tuple[list[dict], list[str], float]:
+    """Открытая модель нагрузки: запросы отправляются с частотой --rate независимо от ответов."""
+    results: list[dict] = []
+    errors: list[str] = []
+
+    async def one(index: int) -> None:
+        await asyncio.sleep(index / args.rate)
+        try:
+            results.append(await _run_request(api, index, args))
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+
+    started = time.monotonic()
+    await asyncio.gather(*(one(index) for index in range(args.requests)))
+    return results, errors, time.monotonic() - started
+
+
+async def _redis_memory(redis_conn) -> tuple[Optional[int], Optional[int]]:
+    if redis_conn is None:
+        return None, None
+    try:
+        keys = await redis_conn.dbsize()
+    except Exception:
+        keys = None
+    try:
+        used_memory = (await redis_conn.info("memory")).get("used_memory")
+    except Exception:
+        used_memory = None
+    return used_memory, keys
+
+
+def _patch_fakeredis_blmove(fake_redis_cls) -> None:
+    """fakeredis не блокируется в BLMOVE, и воркер без задач крутит холостой цикл.
+
+    BLMOVE RIGHT LEFT - та же операция, что BRPOPLPUSH, которую fakeredis
+    блокирует правильно. Настоящий Redis в замене не нуждается.
+    """
+    blmove = fake_redis_cls.blmove
+
+    async def patched(self, first_list, second_list, timeout, src="LEFT", dest="RIGHT"):
+        if (src, dest) == ("RIGHT", "LEFT"):
+            return await self.brpoplpush(first_list, second_list, timeout)
+        return await blmove(self, first_list, second_list, timeout, src, dest)
+
+    fake_redis_cls.blmove = patched
+
+
+def _patch_fakeredis_xreadgroup(fake_redis_cls, poll_interval: float = 0.01) -> None:
+    """fakeredis не блокируется в XREADGROUP BLOCK; ожидание эмулируется частым опросом."""
+    xreadgroup = fake_redis_cls.xreadgroup
+
+    async def patched(self, groupname, consumername, streams, count=None, block=None, noack=False, **options):
+        response = await xreadgroup(self, groupname, consumername, streams, count=count, noack=noack, **options)
+        if response or not block:
+            return response
+        deadline = time.monotonic() + block / 1000
+        token = _EMULATED_WAIT.set(True)
+        try:
+            while not response and time.monotonic() < deadline:
+                await asyncio.sleep(poll_interval)
+                response = await xreadgroup(self, groupname, consumername, streams, count=count, noack=noack, **options)
+        finally:
+            _EMULATED_WAIT.reset(token)
+        return response
+
+    fake_redis_cls.xreadgroup = patched
+
+
+def _configure_env(args, langflow_urls: list[str]) -> None:
+    os.environ.update(
+        {
+            "LANGFLOW_URLS": ",".join(langflow_urls),
+            "QUEUE_NAME": "bench.queue",
+            "TASK_KEY_PREFIX": "bench",
+            "QUEUE_BACKEND": args.backend,
+            "QUEUE_BATCH_SIZE": str(args.batch_size),
+            "QUEUE_RELIABLE": "true" if args.reliable else "false",
+            "WORKER_CONCURRENCY": str(args.concurrency),
+            "WORKER_CONCURRENCY_MODE": args.concurrency_mode,
+            "WORKER_DEQUEUE_TIMEOUT": "1",
+            "WORKER_METRICS_PORT": "0",
+        }
+    )
+    if args.redis_url:
+        os.environ["REDIS_URL"] = args.redis_url
+
+
+async def run(args) -> dict:
+    import httpx
+    from stub_langflow import StubSettings
+
+    stub = StubSettings(
+        latency=args.latency,
+        jitter=args.jitter,
+        events=args.events,
+        event_size=args.event_size,
+    )
+    # Экземпляры заглушки общие по настройкам и счётчикам запросов, как реплики одного Langflow
+    stubs = [await _start_stub(stub) for _ in range(max(1, args.langflow_replicas))]
+    _configure_env(args, [langflow_url for _, _, langflow_url in stubs])
+
+    from langflow_queue.factory import init_async_redis_queue_connector, init_queue_connector, init_result_cache
+
+    if args.backend == "sqlite":
+        # Каждый воркер и API открывают общий файл базы, как отдельные процессы на одном хосте
+        os.environ["QUEUE_SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-queue-"), "queue.db")
+
+        def make_connector():
+            return init_queue_connector()
+    elif args.redis_url:
+        from redis.asyncio import Redis as AsyncRedis
+
+        def make_connector():
+            return init_async_redis_queue_connector(AsyncRedis.from_url(args.redis_url))
+    else:
+        import fakeredis
+
+        _patch_fakeredis_blmove(fakeredis.FakeAsyncRedis)
+        _patch_fakeredis_xreadgroup(fakeredis.FakeAsyncRedis)
+        fake_server = fakeredis.FakeServer()
+
+        def make_connector():
+            return init_async_redis_queue_connector(fakeredis.FakeAsyncRedis(server=fake_server))
+
+    counter = RoundTripCounter()
+    counter.install()
+
+    import app.main as api_main
+    import worker_runner
+
+    logging.getLogger().setLevel(args.log_level)
+    api_main.queue_connector = make_connector()
+    api_main.result_cache = init_result_cache(getattr(api_main.queue_connector, "redis", None))
+
+    # Воркеры останавливаются событием, а не отменой: fakeredis проглатывает
+    # отмену во время блокирующего ожидания задачи
+    stop = asyncio.Event()
+    workers = []
+    for index in range(args.workers):
+        os.environ["WORKER_ID"] = f"bench-worker-{index}"
+        connector = make_connector()
+        workers.append(asyncio.create_task(worker_runner.run_worker(connector, stop)))
+
+    transport = httpx.ASGITransport(app=api_main.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://queue-api", timeout=args.timeout) as api:
+            results, errors, duration = await _drive(api, args)
+        used_memory, keys = await _redis_memory(getattr(api_main.queue_connector, "redis", None))
+    finally:
+        stop.set()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await api_main.queue_connector.close()
+        for server, _, _ in stubs:
+            server.should_exit = True
+        await asyncio.gather(*(server_task for _, server_task, _ in stubs))
+
+    records = [record for result in results for record in result["records"]]
+    completed = [result for result in results if all(r.get("status") == "completed" for r in result["records"])]
+    tasks = len(records)
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "config": {
+            key: value for key, value in vars(args).items() if key not in ("output", "log_level")
+        } | {"redis": None if args.backend == "sqlite" else "url" if args.redis_url else "fakeredis"},
+        "requests": args.requests,
+        "completed": len(completed),
+        "failed": len(results) - len(completed),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "duration_seconds": duration,
+        "throughput_per_second": len(completed) / duration if duration else 0.0,
+        "latency_seconds": _percentiles([result["latency"] for result in completed]),
+        "stages_seconds": {
+            "queue_wait": _percentiles([v for r in records if (v := _interval(r, "created_at", "dequeued_at")) is not None]),
+            "langflow_first_byte": _percentiles([v for r in records if (v := _interval(r, "started_at", "first_byte_at")) is not None]),
+            "langflow_call": _percentiles([v for r in records if (v := _interval(r, "started_at", "finished_at")) is not None]),
+        },
+        "redis": {
+            "round_trips": counter.total,
+            "round_trips_per_request": counter.total / len(results) if results else None,
+            "round_trips_per_task": counter.total / tasks if tasks else None,
+            "commands": dict(sorted(counter.commands.items(), key=lambda item: -item[1])),
+            "used_memory_bytes": used_memory,
+            "keys": keys,
+        },
+        "process": {
+            # ru_maxrss на Linux - в килобайтах, на macOS - в байтах
+            "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            * (1 if sys.platform == "darwin" else 1024),
+        },
+        "stub_requests": stub.requests,
+        "langflow_backends": dict(Counter(r.get("langflow_backend") for r in records if r.get("langflow_backend"))),
+    }
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="сколько запусков flow выполнить")
+    parser.add_argument("--rate", type=float, default=50.0, help="запусков в секунду")
+    parser.add_argument("--mode", choices=("chain", "streaming", "two-step"), default="chain",
+                        help="chain_events=true, event_delivery=streaming или build + отдельный запрос событий")
+    parser.add_argument("--flows", type=int, default=4, help="число разных flow_id")
+    parser.add_argument("--latency", type=float, default=0.1, help="время выполнения flow в заглушке, секунд")
+    parser.add_argument("--jitter", type=float, default=0.2, help="случайное отклонение задержки, доля от latency")
+    parser.add_argument("--events", type=int, default=10, help="событий на запуск flow")
+    parser.add_argument("--event-size", type=int, default=256, help="размер события, байт")
+    parser.add_argument("--workers", type=int, default=1, help="число воркеров")
+    parser.add_argument("--concurrency", type=int, default=16, help="WORKER_CONCURRENCY каждого воркера")
+    parser.add_argument("--langflow-replicas", type=int, default=1,
+                        help="число экземпляров заглушки Langflow, между которыми балансирует воркер")
+    parser.add_argument("--concurrency-mode", choices=("fixed", "adaptive"), default="fixed")
+    parser.add_argument("--backend", choices=("redis", "redis-streams", "sqlite"), default="redis",
+                        help="бэкенд очереди (QUEUE_BACKEND)")
+    parser.add_argument("--batch-size", type=int, default=10, help="QUEUE_BATCH_SIZE бэкенда redis-streams")
+    parser.add_argument("--reliable", action="store_true", help="надёжный режим очереди (QUEUE_RELIABLE)")
+    parser.add_argument("--redis-url", default=None, help="настоящий Redis вместо fakeredis; база будет изменена")
+    parser.add_argument("--sync-timeout", type=float, default=0.0,
+                        help="ждать результата запуска flow в самом запросе до стольких секунд (sync_timeout)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="максимальное время одного запуска, секунд")
+    parser.add_argument("--output", default=None, help="дописать результат строкой в этот JSONL-файл")
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    line = json.dumps(report, ensure_ascii=False)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as output:
+            output.write(line + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Заглушка Langflow API для бенчмарка: отвечает с заданной задержкой и размером событий."""
+import asyncio
+import json
+import random
+import uuid
+from dataclasses import dataclass, field
+
+from fastapi import FastAPI, Query
+from fastapi.responses import Response, StreamingResponse
+
+
+@dataclass
+class StubSettings:
+    """Поведение заглушки.
+
+    latency - время выполнения flow в секундах (в потоковом режиме делится между
+    событиями), jitter - случайное отклонение задержки в долях от latency,
+    events - число событий выполнения, event_size - размер текста каждого события в байтах.
+    """
+
+    latency: float = 0.1
+    jitter: float = 0.0
+    build_latency: float = 0.005
+    events: int = 10
+    event_size: int = 256
+    requests: dict[str, int] = field(default_factory=dict)
+
+    def run_latency(self) -> float:
+        spread = self.latency * self.jitter
+        return max(0.0, self.latency + random.uniform(-spread, spread))
+
+
+def _events(job_id: str, settings: StubSettings) -> list[str]:
+    text = "x" * settings.event_size
+    lines = [
+        json.dumps({"event": "add_message", "data": {"job_id": job_id, "index": index, "text": text}})
+        for index in range(max(settings.events - 1, 0))
+    ]
+    lines.append(json.dumps({"event": "end", "data": {"job_id": job_id}}))
+    return lines
+
+
+def create_stub_app(settings: StubSettings) -> FastAPI:
+    app = FastAPI(title="Langflow stub")
+
+    def _count(name: str) -> None:
+        settings.requests[name] = settings.requests.get(name, 0) + 1
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.post("/api/v1/build/{flow_id}/flow")
+    async def build_flow(flow_id: str):
+        _count("build")
+        await asyncio.sleep(settings.build_latency)
+        return {"job_id": str(uuid.uuid4())}
+
+    @app.get("/api/v1/build/{job_id}/events")
+    async def build_events(job_id: str, event_delivery: str = Query("polling")):
+        _count(f"events_{event_delivery}")
+        lines = _events(job_id, settings)
+        latency = settings.run_latency()
+
+        if event_delivery != "streaming":
+            await asyncio.sleep(latency)
+            return Response("\n\n".join(lines) + "\n\n", media_type="application/x-ndjson")
+
+        async def stream():
+            step = latency / len(lines)
+            for line in lines:
+                await asyncio.sleep(step)
+                yield line + "\n\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    return app
+
+
+__all__ = ["StubSettings", "create_stub_app"]
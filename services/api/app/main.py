@@ -1,16 +1,61 @@
-from fastapi import FastAPI, HTTPException, Body, Query, Request
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Body, Header, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from datetime import datetime, timezone
 import json
-from pydantic import BaseModel
-from typing import Optional, Any
+import os
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from pydantic import BaseModel, Field
+from typing import AsyncIterator, Optional, Any
 from enum import Enum
 
-from langflow_queue.factory import init_queue_connector
-from .task_utils import build_task_record
+from langflow_queue.base import TERMINAL_STATUSES
+from langflow_queue.events import event_type, parse_event_text, response_status_code, response_text
+from langflow_queue.factory import init_queue_connector, init_result_cache, init_task_archive
+from langflow_queue.metrics import QUEUE_DEPTH, SYNC_WAITS, TASKS_ENQUEUED, observe_redis
+from .task_utils import build_task_record, request_hash
 
 
 queue_connector = init_queue_connector()
+result_cache = init_result_cache(getattr(queue_connector, "redis", None))
+# Архив задач, перенесённых архиватором из бэкенда очереди; None - архив не подключён
+task_archive = init_task_archive()
 
-app = FastAPI(title="Langflow Queue API")
+# Как долго ждать новых событий задачи, прежде чем отправить клиенту keep-alive
+SSE_KEEPALIVE_MS = 15_000
+
+# Максимальное время ожидания завершения задачи в /get_task, в секундах
+MAX_TASK_WAIT_SECONDS = 60
+
+# Объединять одинаковые запросы, пока ведущая задача ждёт или выполняется
+DEDUP_ENABLED = os.getenv("QUEUE_DEDUP_ENABLED", "").strip().lower() in ("1", "true", "yes", "on")
+
+# Дедлайн задачи по умолчанию в секундах после постановки, если клиент не передал
+# X-Task-Timeout; 0 - без дедлайна
+TASK_DEFAULT_TIMEOUT = float(os.getenv("TASK_DEFAULT_TIMEOUT", "0"))
+
+# Запуск с sync_timeout ждёт результата, только если в его дорожке ожидает не больше
+# задач; 0 - ждать при любой длине очереди
+SYNC_MAX_QUEUE_DEPTH = int(os.getenv("SYNC_MAX_QUEUE_DEPTH", "20"))
+
+# Верхняя граница sync_timeout в секундах: дольше соединение API не держится,
+# сколько бы ни попросил клиент
+SYNC_MAX_TIMEOUT = float(os.getenv("SYNC_MAX_TIMEOUT", "10"))
+
+# Максимальное число запусков или задач в одном пакетном запросе
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "1000"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await queue_connector.close()
+    if task_archive is not None:
+        task_archive.close()
+
+
+app = FastAPI(title="Langflow Queue API", lifespan=lifespan)
 
 
 class TaskRequest(BaseModel):
@@ -28,7 +73,7 @@ class TaskResponse(BaseModel):
 
 
 class EventDeliveryType(str, Enum):
-    # STREAMING = "streaming"
+    STREAMING = "streaming"
     # DIRECT = "direct"
     POLLING = "polling"
 
@@ -52,48 +97,224 @@ class BuildFlowResponse(BaseModel):
     flow_id: str
 
 
+class BuildRunRequest(BaseModel):
+    """Один запуск flow в пакете: тело и query параметры как у /api/v1/build/{flow_id}/flow."""
+
+    flow_id: str
+    body: dict[str, Any] = {}
+    query_params: dict[str, Any] = {}
+    chain_events: bool = False
+    priority: Optional[str] = None
+    timeout: Optional[float] = Field(None, gt=0)
+
+
+class BatchBuildRequest(BaseModel):
+    runs: list[BuildRunRequest] = Field(min_length=1, max_length=BATCH_MAX_SIZE)
+
+
+class BatchTasksRequest(BaseModel):
+    task_ids: list[str] = Field(min_length=1, max_length=BATCH_MAX_SIZE)
+    include_response: bool = True
+
+
 def _parse_response_events(response: Optional[dict[str, Any]]) -> dict[str, Any]:
-    if not isinstance(response, dict):
-        return {"status_code": None, "events": [], "raw_text": None}
-
-    status_code = response.get("data", {}).get("status_code")
-    text = (
-        response.get("data", {})
-        .get("data", {})
-        .get("text")
-        if isinstance(response.get("data"), dict)
-        else None
-    )
+    text = response_text(response)
+    return {
+        "status_code": response_status_code(response),
+        "events": parse_event_text(text),
+        "raw_text": text,
+    }
 
-    events: list[Any] = []
-    if isinstance(text, str):
-        for chunk in text.split("\n\n"):
-            chunk = chunk.strip()
-            if not chunk:
-                continue
-            try:
-                events.append(json.loads(chunk))
-            except json.JSONDecodeError:
-                events.append({"raw": chunk})
 
-    return {"status_code": status_code, "events": events, "raw_text": text}
+async def _load_task(task_id: str, *, include_response: bool = True) -> Optional[dict[str, Any]]:
+    """Читает запись задачи из бэкенда очереди, а если её там уже нет - из архива."""
+    with observe_redis("get_task"):
+        task_record = await queue_connector.get_task(task_id, include_response=include_response)
+    if task_record is None and task_archive is not None:
+        task_record = await asyncio.to_thread(task_archive.get, task_id, include_response=include_response)
+    return task_record
+
+
+def _sse_message(data: Any, *, event_id: Optional[str] = None, event: Optional[str] = None) -> str:
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def _stream_task_events(
+    task_id: str, request: Request, last_event_id: str, stream_task_id: Optional[str] = None
+) -> AsyncIterator[str]:
+    """Отдаёт события из потока stream_task_id: ведущей задачи для ведомой task_id или её самой."""
+    stream_task_id = stream_task_id or task_id
+    while not await request.is_disconnected():
+        entries = await queue_connector.read_events(stream_task_id, last_event_id, block_ms=SSE_KEEPALIVE_MS)
+        if not entries:
+            # Задача могла завершиться, не открыв поток (например, без event_delivery=streaming),
+            # а поток ведущей задачи - удалиться вместе с ней при архивации
+            task_record = await queue_connector.get_task(task_id, include_response=False)
+            status = task_record.get("status") if task_record else None
+            if status is None or status in TERMINAL_STATUSES:
+                yield _sse_message({"status": status}, event="end")
+                return
+            yield ": keep-alive\n\n"
+            continue
+
+        for entry_id, entry in entries:
+            last_event_id = entry_id
+            if "end" in entry:
+                next_stream = await _handed_over_stream(task_id, stream_task_id)
+                if next_stream is None:
+                    yield _sse_message({"status": entry["end"]}, event_id=entry_id, event="end")
+                    return
+                # Ведущую задачу прервали, и ведомая ждёт новую ведущую: читаем её поток с начала
+                stream_task_id, last_event_id = next_stream, "0"
+                break
+            yield _sse_message(entry["event"], event_id=entry_id)
+
+
+async def _task_exists(task_id: str) -> bool:
+    """Есть ли запись задачи в бэкенде очереди (не перенесена в архив и не истекла)."""
+    return await queue_connector.get_task(task_id, include_response=False) is not None
+
+
+async def _handed_over_stream(task_id: str, stream_task_id: str) -> Optional[str]:
+    """Возвращает поток новой ведущей задачи, если ведущую ведомой task_id прервали.
+
+    Отменённая ведущая задача или задача с истёкшим дедлайном передаёт ведомые
+    другой ведущей (или делает одну из них ведущей) раньше, чем закрывает свой поток.
+    """
+    if stream_task_id == task_id:
+        return None
+    task_record = await queue_connector.get_task(task_id, include_response=False)
+    if not task_record or task_record.get("status") in TERMINAL_STATUSES:
+        return None
+    next_stream = task_record.get("leader_task_id") or task_id
+    return next_stream if next_stream != stream_task_id else None
 
 
 @app.get("/get_tasks", tags=["internal"])
-def get_tasks():
-    """Возвращает все известные записи задач из бэкенда очереди."""
-    tasks = queue_connector.list_tasks()
-    return {"tasks": tasks, "count": len(tasks)}
+async def get_tasks(
+    status: Optional[str] = Query(None),
+    flow_id: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    include_response: bool = Query(True),
+):
+    """Возвращает страницу записей задач (новые первыми) из бэкенда очереди."""
+    try:
+        tasks, next_cursor = await queue_connector.list_tasks(
+            status=status,
+            flow_id=flow_id,
+            cursor=cursor,
+            limit=limit,
+            include_response=include_response,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"tasks": tasks, "count": len(tasks), "next_cursor": next_cursor}
+
+
+@app.post("/get_tasks/batch", tags=["internal"])
+async def get_tasks_batch(batch: BatchTasksRequest):
+    """Возвращает записи нескольких задач за одно обращение к бэкенду очереди.
+
+    tasks - найденные записи в порядке task_ids, missing - id задач, которых нет.
+    """
+    with observe_redis("get_tasks"):
+        records = await queue_connector.get_tasks(batch.task_ids, include_response=batch.include_response)
+    missing = [task_id for task_id, record in zip(batch.task_ids, records) if record is None]
+    if missing and task_archive is not None:
+        archived = await asyncio.to_thread(task_archive.get_many, missing, include_response=batch.include_response)
+        found = dict(zip(missing, archived))
+        records = [found.get(task_id) if record is None else record for task_id, record in zip(batch.task_ids, records)]
+    return {
+        "tasks": [record for record in records if record is not None],
+        "missing": [task_id for task_id, record in zip(batch.task_ids, records) if record is None],
+    }
 
 
 @app.get("/get_task/{task_id}", tags=["internal"])
-def get_task(task_id: str):
-    task_record = queue_connector.get_task(task_id)
+async def get_task(
+    task_id: str,
+    wait: float = Query(0, ge=0, le=MAX_TASK_WAIT_SECONDS),
+    include_response: bool = Query(True),
+):
+    """Возвращает запись задачи.
+
+    С параметром wait держит запрос открытым, пока задача не завершится
+    или не истечёт указанное число секунд. include_response=false отдаёт
+    запись без тела ответа - для дешёвой проверки статуса. Задачи, перенесённые
+    в архив, читаются из него (в записи поле archived=true).
+    """
+    if wait:
+        task_record = await queue_connector.wait_for_task(
+            task_id,
+            timeout=wait,
+            statuses=TERMINAL_STATUSES,
+            include_response=include_response,
+        )
+        if task_record is None and task_archive is not None:
+            task_record = await asyncio.to_thread(task_archive.get, task_id, include_response=include_response)
+    else:
+        task_record = await _load_task(task_id, include_response=include_response)
     if not task_record:
         raise HTTPException(status_code=404, detail="Task not found")
     return task_record
 
 
+@app.delete("/get_task/{task_id}", tags=["internal"])
+async def cancel_task(task_id: str):
+    """Отменяет задачу.
+
+    Ожидающую задачу воркер снимет с очереди, не вызывая Langflow; у выполняемой
+    воркер прервёт запрос к Langflow. Завершённую задачу отменить нельзя.
+    """
+    task_record = await _load_task(task_id, include_response=False)
+    if not task_record:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if task_record.get("status") in TERMINAL_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Task already {task_record['status']}")
+    # Задача могла завершиться после проверки выше: бэкенд меняет статус, только
+    # если задача всё ещё не завершена
+    with observe_redis("update_task"):
+        cancelled = await queue_connector.update_task(
+            task_id,
+            {"status": "cancelled", "cancelled_at": datetime.now(timezone.utc).isoformat()},
+            unless_status=TERMINAL_STATUSES,
+        )
+    if not cancelled:
+        raise HTTPException(status_code=409, detail="Task already finished")
+    return TaskResponse(task_id=task_id, status="cancelled", message=f"cancelled: {task_id}")
+
+
+@app.get("/dead_letters", tags=["internal"])
+async def dead_letters(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    include_response: bool = Query(True),
+):
+    """Возвращает страницу задач, исчерпавших повторные попытки (новые первыми).
+
+    total - общее число задач в очереди недоставленных.
+    """
+    tasks, total = await queue_connector.list_dead_letters(
+        offset=offset, limit=limit, include_response=include_response
+    )
+    return {"tasks": tasks, "count": len(tasks), "total": total}
+
+
+@app.post("/dead_letters/{task_id}/replay", tags=["internal"])
+async def replay_dead_letter(task_id: str):
+    """Снова ставит в очередь задачу из очереди недоставленных со сброшенным счётчиком попыток."""
+    if not await queue_connector.replay_dead_letter(task_id):
+        raise HTTPException(status_code=404, detail="Task not found in dead letters")
+    return TaskResponse(task_id=task_id, status="pending", message=f"replayed: {task_id}")
+
+
 @app.post("/api/v1/build/{flow_id}/flow", tags=["langflow"])
 async def build_flow(
     flow_id: str,
@@ -106,8 +327,22 @@ async def build_flow(
     log_builds: bool = Query(True),
     flow_name: Optional[str] = Query(None),
     event_delivery: EventDeliveryType = Query(EventDeliveryType.POLLING),
+    chain_events: bool = Query(False),
+    sync_timeout: float = Query(0, ge=0, le=MAX_TASK_WAIT_SECONDS),
+    priority: Optional[str] = Header(None, alias="X-Task-Priority"),
+    timeout: Optional[float] = Header(None, alias="X-Task-Timeout", gt=0),
 ):
-    """Сохраняет оригинальный запрос как есть для выполнения воркером"""
+    """Сохраняет оригинальный запрос как есть для выполнения воркером
+
+    С chain_events=true воркер сразу после запуска сам забирает события по
+    полученному job_id, и задача завершается с полным результатом выполнения.
+    X-Task-Timeout задаёт дедлайн в секундах: задачу, не выполненную к этому
+    моменту, воркер не запускает или прерывает.
+    С sync_timeout задача ставится в очередь как обычно, но ответ ждёт её
+    завершения до указанного числа секунд (не дольше SYNC_MAX_TIMEOUT):
+    успевшая задача возвращается целиком, как из /get_task, иначе - обычный
+    ответ с task_id.
+    """
     # Захватываем сырое тело запроса для сохрлючая неизвестные ключи)
     body_data: dict[str, Any] = {}
     body_bytes = await request.body()
@@ -131,6 +366,9 @@ async def build_flow(
     query_params: dict[str, Any] = {}
     if request.query_params:
         for key, value in request.query_params.multi_items():
+            # Параметры очереди, Langflow их не ожидает
+            if key in ("chain_events", "sync_timeout"):
+                continue
             if key in query_params:
                 existing = query_params[key]
                 if isinstance(existing, list):
@@ -145,20 +383,206 @@ async def build_flow(
         "query_params": query_params,
     }
 
+    _check_priority(priority)
+    task_record, request_key = _flow_task(
+        flow_id,
+        payload,
+        event_delivery=event_delivery,
+        chain_events=chain_events,
+        priority=priority,
+        timeout=timeout or TASK_DEFAULT_TIMEOUT,
+    )
+
+    if result_cache is not None and request_key:
+        cached_response = await _serve_from_cache(task_record, request_key)
+        if cached_response is not None:
+            if sync_timeout:
+                return await _load_task(cached_response.task_id) or cached_response
+            return cached_response
+
+    task_id = await _enqueue(task_record, dedup_key=request_key if DEDUP_ENABLED else None)
+    if sync_timeout and SYNC_MAX_TIMEOUT > 0:
+        task_result = await _wait_inline(task_record, task_id, min(sync_timeout, SYNC_MAX_TIMEOUT))
+        if task_result is not None:
+            return task_result
+    return _enqueued_response(task_record, task_id)
+
+
+@app.post("/api/v1/build/batch", tags=["langflow"])
+async def build_flow_batch(
+    batch: BatchBuildRequest,
+    priority: Optional[str] = Header(None, alias="X-Task-Priority"),
+    timeout: Optional[float] = Header(None, alias="X-Task-Timeout", gt=0),
+):
+    """Ставит в очередь пакет запусков flow одной транзакцией бэкенда очереди.
+
+    Каждый запуск описывается так же, как запрос к /api/v1/build/{flow_id}/flow:
+    тело, query параметры (включая event_delivery), chain_events, priority
+    и timeout (по умолчанию - из заголовков X-Task-Priority и X-Task-Timeout). Ответы кэша читаются одним
+    MGET, остальные задачи ставятся в очередь одним вызовом enqueue_many.
+    Если хотя бы один запуск некорректен, не ставится ни одна задача.
+    """
+    tasks: list[tuple[dict[str, Any], Optional[str]]] = []
+    for run in batch.runs:
+        try:
+            event_delivery = EventDeliveryType(run.query_params.get("event_delivery", EventDeliveryType.POLLING))
+        except ValueError:
+            raise HTTPException(
+                status_code=400, detail=f"Unknown event_delivery: {run.query_params['event_delivery']}"
+            )
+        run_priority = run.priority or priority
+        _check_priority(run_priority)
+        tasks.append(
+            _flow_task(
+                run.flow_id,
+                {"body": run.body, "query_params": run.query_params},
+                event_delivery=event_delivery,
+                chain_events=run.chain_events,
+                priority=run_priority,
+                timeout=run.timeout or timeout or TASK_DEFAULT_TIMEOUT,
+            )
+        )
+
+    responses: list[Optional[TaskResponse]] = [None] * len(tasks)
+    if result_cache is not None:
+        cacheable = [
+            index
+            for index, (task_record, request_key) in enumerate(tasks)
+            if request_key and result_cache.ttl_for(task_record.get("flow_id")) > 0
+        ]
+        if cacheable:
+            cached = await result_cache.get_many([tasks[index][1] for index in cacheable])
+            for index, value in zip(cacheable, cached):
+                responses[index] = await _store_cached(*tasks[index], value)
+
+    pending = [index for index, response in enumerate(responses) if response is None]
+    if pending:
+        task_records = [tasks[index][0] for index in pending]
+        dedup_keys = [tasks[index][1] if DEDUP_ENABLED else None for index in pending]
+        with observe_redis("enqueue_many"):
+            task_ids = await queue_connector.enqueue_many(task_records, dedup_keys=dedup_keys)
+        for index, task_record, task_id in zip(pending, task_records, task_ids):
+            _count_enqueued(task_record)
+            responses[index] = _enqueued_response(task_record, task_id)
+    return {"tasks": responses, "count": len(responses)}
+
+
+def _flow_task(
+    flow_id: str,
+    payload: dict[str, Any],
+    *,
+    event_delivery: EventDeliveryType,
+    chain_events: bool,
+    priority: Optional[str],
+    timeout: Optional[float],
+) -> tuple[dict[str, Any], Optional[str]]:
+    """Собирает запись задачи запуска flow и ключ запроса для кэша и объединения."""
     task_record = build_task_record(
         endpoint=f"/api/v1/build/{flow_id}/flow",
         method="POST",
         payload=payload,
+        flow_id=flow_id,
+        priority=priority,
+        timeout=timeout,
     )
-    task_id = queue_connector.enqueue(task_record)
+    if chain_events:
+        task_record["chain_events"] = True
+
+    # Кэшировать и раздавать другим задачам можно только результат, содержащий
+    # все события выполнения: job_id Langflow нельзя использовать повторно
+    complete_result = event_delivery == EventDeliveryType.STREAMING or chain_events
+    request_key = None
+    if complete_result and (result_cache is not None or DEDUP_ENABLED):
+        request_key = request_hash(task_record)
+    return task_record, request_key
+
+
+def _enqueued_response(task_record: dict[str, Any], task_id: str) -> TaskResponse:
+    if task_record.get("leader_task_id"):
+        return TaskResponse(
+            task_id=task_id,
+            status="pending",
+            message=f"coalesced with: {task_record['leader_task_id']}",
+        )
     return TaskResponse(task_id=task_id, status="pending", message=f"enqueued: {task_id}")
 
 
+async def _enqueue(task_record: dict[str, Any], *, dedup_key: Optional[str] = None) -> str:
+    """Ставит задачу в очередь и учитывает её в метриках."""
+    with observe_redis("enqueue"):
+        task_id = await queue_connector.enqueue(task_record, dedup_key=dedup_key)
+    _count_enqueued(task_record)
+    return task_id
+
+
+async def _wait_inline(task_record: dict[str, Any], task_id: str, timeout: float) -> Optional[dict[str, Any]]:
+    """Ждёт завершения только что поставленной задачи; None, если не дождались.
+
+    Завершение приходит тем же уведомлением о смене статуса, что и в /get_task
+    с wait. Если в дорожке задачи уже больше SYNC_MAX_QUEUE_DEPTH ожидающих,
+    ответ отдаётся сразу: задача всё равно не успеет выполниться, а соединение
+    лучше не держать.
+    """
+    if SYNC_MAX_QUEUE_DEPTH > 0:
+        lane = task_record.get("priority") or queue_connector.default_lane
+        if (await queue_connector.queue_depths()).get(lane, 0) > SYNC_MAX_QUEUE_DEPTH:
+            SYNC_WAITS.labels("skipped").inc()
+            return None
+    current = await queue_connector.wait_for_task(
+        task_id, timeout=timeout, statuses=TERMINAL_STATUSES, include_response=False
+    )
+    if current is None or current.get("status") not in TERMINAL_STATUSES:
+        SYNC_WAITS.labels("timeout").inc()
+        return None
+    SYNC_WAITS.labels("completed").inc()
+    # Ответ читается один раз, когда задача уже завершена
+    return await _load_task(task_id)
+
+
+def _count_enqueued(task_record: dict[str, Any]) -> None:
+    if not task_record.get("leader_task_id"):
+        TASKS_ENQUEUED.labels(task_record.get("priority") or queue_connector.default_lane).inc()
+
+
+def _check_priority(priority: Optional[str]) -> None:
+    if priority is not None and priority not in queue_connector.lanes:
+        raise HTTPException(status_code=400, detail=f"Unknown priority: {priority}")
+
+
+async def _serve_from_cache(task_record: dict[str, Any], cache_key: str) -> Optional[TaskResponse]:
+    """Сохраняет задачу как уже выполненную, если её результат есть в кэше.
+
+    При промахе помечает запись ключом кэша, чтобы воркер сохранил результат.
+    """
+    if result_cache.ttl_for(task_record.get("flow_id")) <= 0:
+        return None
+    return await _store_cached(task_record, cache_key, await result_cache.get(cache_key))
+
+
+async def _store_cached(task_record: dict[str, Any], cache_key: str, cached: Any) -> Optional[TaskResponse]:
+    """Сохраняет задачу как выполненную из ответа кэша; при промахе помечает её ключом кэша."""
+    if cached is None:
+        task_record["cache_key"] = cache_key
+        return None
+
+    task_record.update(
+        status="completed",
+        response=cached,
+        cache_hit=True,
+        finished_at=datetime.now(timezone.utc).isoformat(),
+    )
+    events = _parse_response_events(cached)["events"]
+    task_id = await queue_connector.store_task(task_record, events=events)
+    return TaskResponse(task_id=task_id, status="completed", message=f"cache hit: {task_id}")
+
+
 @app.get("/api/v1/build/{job_id}/events", tags=["langflow"])
 async def get_build_events(
     job_id: str,
     request: Request,
     event_delivery: EventDeliveryType = Query(EventDeliveryType.POLLING),
+    priority: Optional[str] = Header(None, alias="X-Task-Priority"),
+    timeout: Optional[float] = Header(None, alias="X-Task-Timeout", gt=0),
 ):
     """Сохраняет оригинальный запрос как есть для выполнения воркером."""
     query_params: dict[str, Any] = {}
@@ -179,39 +603,141 @@ async def get_build_events(
         "query_params": query_params,
     }
 
+    _check_priority(priority)
     task_record = build_task_record(
         endpoint=f"/api/v1/build/{job_id}/events",
         method="GET",
         payload=payload,
+        priority=priority,
+        timeout=timeout or TASK_DEFAULT_TIMEOUT,
     )
-    task_id = queue_connector.enqueue(task_record)
+    task_id = await _enqueue(task_record)
     return TaskResponse(task_id=task_id, status="pending", message=f"enqueued: {task_id}")
 
 
 @app.get("/parse_task_events/{task_id}", tags=["internal"])
-def parse_task_events(task_id: str):
-    task_record = queue_connector.get_task(task_id)
+async def parse_task_events(
+    task_id: str,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    types: Optional[str] = Query(None, description="Типы событий через запятую, например end_vertex,end"),
+    include_raw: bool = Query(True),
+):
+    """Отдаёт разобранные события задачи постранично.
+
+    События разбирает воркер один раз при завершении задачи, поэтому чтение
+    страницы не зависит от размера всего ответа. Для задач, сохранённых до
+    появления разбора, события разбираются из ответа при каждом запросе.
+    """
+    task_record = await _load_task(task_id, include_response=include_raw)
     if not task_record:
         raise HTTPException(status_code=404, detail="Task not found")
 
-    parsed_response = _parse_response_events(task_record.get("response"))
+    type_filter = [name.strip() for name in types.split(",") if name.strip()] if types else None
+    summary = task_record.get("events_summary")
+    # Ведомая задача не выполняется сама, её события разобраны у ведущей
+    events_task_id = task_record.get("leader_task_id") or task_id
+    # Разобранные события архивной задачи удалены вместе с ней, их разбираем из ответа;
+    # так же и у ведомой задачи, ведущую которой уже перенесли в архив
+    if (
+        summary is not None
+        and not task_record.get("archived")
+        and (events_task_id == task_id or await _task_exists(events_task_id))
+    ):
+        events, total = await queue_connector.get_events(
+            events_task_id, offset=offset, limit=limit, types=type_filter
+        )
+        status_code = summary.get("status_code")
+        raw_text = response_text(task_record.get("response")) if include_raw else None
+    else:
+        if not include_raw:
+            task_record = await _load_task(task_id) or task_record
+        parsed_response = _parse_response_events(task_record.get("response"))
+        events = parsed_response["events"]
+        if type_filter:
+            events = [event for event in events if event_type(event) in type_filter]
+        total = len(events)
+        events = events[offset:offset + limit] if limit is not None else events[offset:]
+        status_code = parsed_response["status_code"]
+        raw_text = parsed_response["raw_text"] if include_raw else None
 
     return {
         "task_id": task_id,
         "status": task_record.get("status"),
         "request": task_record.get("request"),
         "response": {
-            "status_code": parsed_response["status_code"],
-            "events": parsed_response["events"],
-            "raw_text": parsed_response["raw_text"],
+            "status_code": status_code,
+            "events": events,
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "raw_text": raw_text,
         },
     }
 
 
+@app.get("/stream_task_events/{task_id}", tags=["internal"])
+async def stream_task_events(
+    task_id: str,
+    request: Request,
+    last_event_id: Optional[str] = Query(None),
+):
+    """Отдаёт события задачи как Server-Sent Events по мере их появления.
+
+    Поддерживает возобновление с заголовка Last-Event-ID (или параметра last_event_id).
+    """
+    task_record = await _load_task(task_id, include_response=False)
+    if not task_record:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if task_record.get("archived"):
+        # Поток событий архивной задачи удалён; её события отдаёт /parse_task_events
+        return StreamingResponse(
+            iter([_sse_message({"status": task_record.get("status")}, event="end")]),
+            media_type="text/event-stream",
+        )
+
+    # Ведомая задача не выполняется сама, её события пишет ведущая
+    stream_task_id = task_record.get("leader_task_id") or task_id
+    start_id = request.headers.get("last-event-id") or last_event_id or "0"
+    return StreamingResponse(
+        _stream_task_events(task_id, request, start_id, stream_task_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/cache_stats", tags=["internal"])
+async def cache_stats():
+    """Счётчики кэша результатов: попадания, промахи, вытеснения и занятый объём."""
+    if result_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **await result_cache.stats()}
+
+
+@app.get("/queue_stats", tags=["internal"])
+async def queue_stats():
+    """Число задач в каждой дорожке приоритета и текущие показатели воркеров."""
+    stats = {
+        "lanes": await queue_connector.queue_depths(),
+        "workers": await queue_connector.worker_stats(),
+    }
+    if task_archive is not None:
+        stats["archive"] = await asyncio.to_thread(task_archive.stats)
+    return stats
+
+
+@app.get("/metrics", tags=["internal"])
+async def metrics():
+    """Метрики в формате Prometheus. Глубина очереди читается из бэкенда при каждом запросе."""
+    for lane, depth in (await queue_connector.queue_depths()).items():
+        QUEUE_DEPTH.labels(lane).set(depth)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.get("/health", tags=["internal"])
-def health():
+async def health():
     try:
-        queue_connector.ping()
+        await queue_connector.ping()
         return {"status": "healthy"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
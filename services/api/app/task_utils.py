@@ -1,7 +1,9 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from typing import Any, Mapping, Optional
+import hashlib
+import json
 import uuid
 
 
@@ -16,18 +18,49 @@ def build_task_record(
     *,
     method: str,
     payload: Optional[Mapping[str, Any]] = None,
+    flow_id: Optional[str] = None,
+    priority: Optional[str] = None,
+    timeout: Optional[float] = None,
 ) -> dict[str, Any]:
-    """Возвращает нормализованную запись задачи, готовую для сохранения/постановки в очередь."""
-    return {
+    """Возвращает нормализованную запись задачи, готовую для сохранения/постановки в очередь.
+
+    priority - дорожка приоритета очереди; None означает дорожку по умолчанию.
+    timeout - через сколько секунд после создания результат задачи никому не нужен;
+    момент записывается в поле deadline, None означает задачу без дедлайна.
+    """
+    created_at = datetime.now(timezone.utc)
+    task_record = {
         "task_id": str(uuid.uuid4()),
+        "status": "pending",
+        "flow_id": flow_id,
+        "priority": priority,
         "request": {
             "method": method.upper(),
             "endpoint": endpoint,
             "payload": _filter_none(payload),
-            "created_at": datetime.now(timezone.utc).isoformat(),
+            "created_at": created_at.isoformat(),
         },
         "response": None,
     }
+    if timeout:
+        task_record["deadline"] = (created_at + timedelta(seconds=timeout)).isoformat()
+    return task_record
+
+
+def request_hash(task_record: Mapping[str, Any]) -> str:
+    """Возвращает канонический хэш запроса задачи (метод, endpoint, тело и query параметры)."""
+    request = task_record.get("request") or {}
+    canonical = json.dumps(
+        {
+            "method": request.get("method"),
+            "endpoint": request.get("endpoint"),
+            "payload": request.get("payload"),
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
 
 
-__all__ = ["build_task_record"]
+__all__ = ["build_task_record", "request_hash"]
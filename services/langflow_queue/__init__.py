@@ -1,11 +1,37 @@
-from .base import BaseQueueConnector
-from .redis_connector import RedisQueueConnector, create_redis_queue_connector
-from .factory import init_queue_connector
+from .base import TERMINAL_STATUSES, AsyncBaseQueueConnector
+from .async_redis_connector import AsyncRedisQueueConnector, create_async_redis_queue_connector
+from .async_redis_streams_connector import (
+    AsyncRedisStreamsQueueConnector,
+    create_async_redis_streams_queue_connector,
+)
+from .sqlite_connector import SqliteQueueConnector, create_sqlite_queue_connector
+from .async_sqlite_connector import AsyncSqliteQueueConnector, create_async_sqlite_queue_connector
+from .archive import TaskArchive
+from .cache import ResultCache
+from .codec import Codec
+from .factory import init_langflow_limiter, init_queue_connector, init_result_cache, init_task_archive
+from .limits import LangflowLimiter, Limit
+from .notifications import TaskStatusListener
 
 __all__ = [
-    "BaseQueueConnector",
-    "RedisQueueConnector",
-    "create_redis_queue_connector",
+    "AsyncBaseQueueConnector",
+    "AsyncRedisQueueConnector",
+    "AsyncRedisStreamsQueueConnector",
+    "AsyncSqliteQueueConnector",
+    "Codec",
+    "LangflowLimiter",
+    "Limit",
+    "ResultCache",
+    "SqliteQueueConnector",
+    "TaskArchive",
+    "TERMINAL_STATUSES",
+    "TaskStatusListener",
+    "create_async_redis_queue_connector",
+    "create_async_redis_streams_queue_connector",
+    "create_async_sqlite_queue_connector",
+    "create_sqlite_queue_connector",
+    "init_langflow_limiter",
     "init_queue_connector",
+    "init_result_cache",
+    "init_task_archive",
 ]
-
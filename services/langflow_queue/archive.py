@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS archived (
+    task_id TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    status TEXT,
+    flow_id TEXT,
+    created REAL NOT NULL,
+    archived REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS archived_created ON archived (created);
+CREATE INDEX IF NOT EXISTS archived_flow ON archived (flow_id, created);
+"""
+
+COMPRESSIONS = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+
+class TaskArchive:
+    """Архив завершённых задач в сжатых файлах JSONL на локальном диске.
+
+    Записи раскладываются по часовым разделам по времени создания задачи:
+    <directory>/YYYY/MM/DD/HH/<writer>-<n>.jsonl.gz (или .jsonl.zst). Каждая
+    запись сжата отдельным блоком (член gzip или кадр zstd), поэтому файл
+    целиком читается обычными zcat/zstdcat, а одна запись - по смещению, без
+    распаковки остального файла. Небольшой индекс в SQLite (<directory>/index.db)
+    хранит для каждой задачи файл, смещение и длину блока, а также статус,
+    flow_id и время создания.
+
+    В каталог пишет один архиватор (имя файлов включает writer_id); читать его
+    могут любые процессы, в том числе одновременно с записью. zstandard -
+    необязательная зависимость, нужна только для compression="zstd".
+    """
+
+    # Размер файла раздела, после которого начинается новый файл
+    segment_bytes = 64 * 1024 * 1024
+
+    def __init__(
+        self,
+        directory: str,
+        *,
+        compression: str = "gzip",
+        level: int = 3,
+        writer_id: Optional[str] = None,
+    ) -> None:
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown archive compression: {compression}")
+        self.directory = directory
+        self.compression = compression
+        self.level = level
+        self.writer_id = writer_id or socket.gethostname()
+        self._zstd = self._import("zstandard") if compression == "zstd" else None
+        self._segments: dict[str, str] = {}
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            os.path.join(directory, "index.db"), check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(INDEX_SCHEMA)
+
+    @staticmethod
+    def _import(module: str) -> Any:
+        try:
+            return __import__(module)
+        except ImportError:
+            raise RuntimeError(f"Package {module} is required for this archive setting") from None
+
+    @staticmethod
+    def _created(task_record: dict) -> float:
+        created_at = (task_record.get("request") or {}).get("created_at")
+        try:
+            return datetime.fromisoformat(created_at).timestamp()
+        except (TypeError, ValueError):
+            return time.time()
+
+    def _compress(self, data: bytes) -> bytes:
+        if self._zstd is not None:
+            return self._zstd.ZstdCompressor(level=self.level).compress(data)
+        return gzip.compress(data, compresslevel=self.level)
+
+    def _decompress(self, path: str, data: bytes) -> bytes:
+        if path.endswith(COMPRESSIONS["zstd"]):
+            return (self._zstd or self._import("zstandard")).ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def _segment(self, created: float) -> str:
+        """Относительный путь текущего файла часового раздела этого архиватора."""
+        partition = datetime.fromtimestamp(created, timezone.utc).strftime("%Y/%m/%d/%H")
+        path = self._segments.get(partition)
+        if path is None or self._size(path) >= self.segment_bytes:
+            number = 0
+            while True:
+                path = f"{partition}/{self.writer_id}-{number}{COMPRESSIONS[self.compression]}"
+                if self._size(path) < self.segment_bytes:
+                    break
+                number += 1
+            self._segments[partition] = path
+        return path
+
+    def _size(self, path: str) -> int:
+        try:
+            return os.path.getsize(os.path.join(self.directory, path))
+        except FileNotFoundError:
+            return 0
+
+    def append(self, task_records: list[dict]) -> None:
+        """Дописывает записи задач в файлы их разделов и обновляет индекс.
+
+        Индекс обновляется только после того, как данные сброшены на диск, так
+        что запись из индекса всегда можно прочитать. Повторно заархивированная
+        задача заменяет прежнюю запись индекса.
+        """
+        if not task_records:
+            return
+        entries: dict[str, list[tuple[dict, float, bytes]]] = {}
+        for task_record in task_records:
+            created = self._created(task_record)
+            line = json.dumps(task_record, ensure_ascii=False, default=str).encode("utf-8") + b"\n"
+            entries.setdefault(self._segment(created), []).append((task_record, created, self._compress(line)))
+
+        now = time.time()
+        rows = []
+        for path, blocks in entries.items():
+            full_path = os.path.join(self.directory, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "ab") as segment:
+                offset = segment.tell()
+                for task_record, created, block in blocks:
+                    segment.write(block)
+                    rows.append(
+                        (
+                            task_record["task_id"],
+                            path,
+                            offset,
+                            len(block),
+                            task_record.get("status"),
+                            task_record.get("flow_id"),
+                            created,
+                            now,
+                        )
+                    )
+                    offset += len(block)
+                segment.flush()
+                os.fsync(segment.fileno())
+
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany("INSERT OR REPLACE INTO archived VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def forget(self, task_ids: list[str]) -> None:
+        """Удаляет задачи из индекса; их блоки остаются в файлах, но больше не читаются."""
+        if not task_ids:
+            return
+        with self._lock:
+            self.conn.executemany("DELETE FROM archived WHERE task_id = ?", [(task_id,) for task_id in task_ids])
+
+    def get(self, task_id: str, *, include_response: bool = True) -> Optional[dict]:
+        return self.get_many([task_id], include_response=include_response)[0]
+
+    def get_many(self, task_ids: list[str], *, include_response: bool = True) -> list[Optional[dict]]:
+        """Читает записи задач из архива; для отсутствующих - None."""
+        locations: dict[str, tuple[str, int, int]] = {}
+        with self._lock:
+            # Ограничение SQLite на число параметров запроса
+            for start in range(0, len(task_ids), 500):
+                chunk = task_ids[start:start + 500]
+                locations.update(
+                    (row[0], row[1:])
+                    for row in self.conn.execute(
+                        "SELECT task_id, path, offset, length FROM archived"
+                        f" WHERE task_id IN ({', '.join('?' * len(chunk))})",
+                        chunk,
+                    )
+                )
+
+        records: list[Optional[dict]] = []
+        for task_id in task_ids:
+            location = locations.get(task_id)
+            record = self._read(*location) if location is not None else None
+            if record is not None:
+                record["archived"] = True
+                if not include_response:
+                    record.pop("response", None)
+            records.append(record)
+        return records
+
+    def _read(self, path: str, offset: int, length: int) -> Optional[dict]:
+        try:
+            with open(os.path.join(self.directory, path), "rb") as segment:
+                segment.seek(offset)
+                return json.loads(self._decompress(path, segment.read(length)))
+        except (OSError, ValueError, EOFError):
+            return None
+
+    def stats(self) -> dict[str, Any]:
+        """Число задач в архиве и диапазон времени их создания."""
+        with self._lock:
+            count, oldest, newest = self.conn.execute(
+                "SELECT COUNT(*), MIN(created), MAX(created) FROM archived"
+            ).fetchone()
+        return {"tasks": count, "oldest_created": oldest, "newest_created": newest}
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+
+__all__ = ["TaskArchive"]
@@ -0,0 +1,460 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from typing import Any, Collection, Optional
+
+from redis.asyncio import Redis as AsyncRedis
+
+from .base import AsyncBaseQueueConnector
+from .notifications import TaskStatusListener
+from .redis_connector import RedisQueueBase
+from .scripts import (
+    DELETE_TASK,
+    DEQUEUE_TASK,
+    ENQUEUE_DEDUP,
+    ENQUEUE_TASK,
+    HAND_OVER_DEDUP,
+    LIST_TASKS_PAGE,
+    PAGE_EVENTS,
+    PROMOTE_DELAYED,
+    RECOVER_PROCESSING,
+    RELEASE_DEDUP,
+    REPLAY_DEAD_LETTER,
+    REQUEUE_EXPIRED,
+    UPDATE_TASK,
+)
+
+
+class AsyncRedisQueueConnector(RedisQueueBase, AsyncBaseQueueConnector):
+    """Неблокирующий коннектор очереди на основе redis.asyncio.
+
+    Схема ключей и формат хранения описаны в RedisQueueBase.
+    """
+
+    def __init__(self, *, redis_conn: AsyncRedis, **settings: Any) -> None:
+        super().__init__(**settings)
+        self.redis = redis_conn
+        self._list_page = redis_conn.register_script(LIST_TASKS_PAGE)
+        self._update_task = redis_conn.register_script(UPDATE_TASK)
+        self._requeue_expired = redis_conn.register_script(REQUEUE_EXPIRED)
+        self._recover_processing = redis_conn.register_script(RECOVER_PROCESSING)
+        self._enqueue_dedup = redis_conn.register_script(ENQUEUE_DEDUP)
+        self._release_dedup = redis_conn.register_script(RELEASE_DEDUP)
+        self._hand_over_dedup = redis_conn.register_script(HAND_OVER_DEDUP)
+        self._enqueue_task = redis_conn.register_script(ENQUEUE_TASK)
+        self._dequeue_task = redis_conn.register_script(DEQUEUE_TASK)
+        self._promote_delayed = redis_conn.register_script(PROMOTE_DELAYED)
+        self._replay_dead_letter = redis_conn.register_script(REPLAY_DEAD_LETTER)
+        self._delete_task = redis_conn.register_script(DELETE_TASK)
+        self._page_events = redis_conn.register_script(PAGE_EVENTS)
+        self.status_listener = TaskStatusListener(redis_conn, self._status_channel())
+
+    async def _load(self, task_id: str, *, include_response: bool = True) -> Optional[dict]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            self._add_load_reads(pipe, task_id, include_response)
+            return self._load_results(await pipe.execute(), include_response)[0]
+
+    async def enqueue(self, task_record: dict, *, dedup_key: Optional[str] = None) -> str:
+        """Сохраняет запись задачи, обновляет индексы и ставит её в очередь за один round-trip.
+
+        Задача ставится в дорожку из поля priority записи (по умолчанию - первую).
+        Если передан dedup_key и задача с тем же ключом уже ждёт или выполняется,
+        новая задача не ставится в очередь, а в запись добавляется leader_task_id.
+        """
+        task_id = task_record["task_id"]
+        lane_args = self._prepare_enqueue(task_record, dedup_key)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            self._add_store_writes(pipe, task_record)
+            await self._add_enqueue_call(pipe, task_record, lane_args, dedup_key)
+            leader_task_id = (await pipe.execute())[-1]
+        self._set_leaders([task_record], [dedup_key], [leader_task_id])
+        return task_id
+
+    async def enqueue_many(
+        self,
+        task_records: list[dict],
+        *,
+        dedup_keys: Optional[list[Optional[str]]] = None,
+    ) -> list[str]:
+        """Ставит несколько задач в очередь одной транзакцией (MULTI/EXEC) за один round-trip.
+
+        dedup_keys, если переданы, соответствуют task_records по порядку.
+        Дорожки проверяются до записи: при неизвестной дорожке не ставится ни одна задача.
+        """
+        dedup_keys = self._batch_dedup_keys(task_records, dedup_keys)
+        lane_args = [self._prepare_enqueue(record, key) for record, key in zip(task_records, dedup_keys)]
+        if not task_records:
+            return []
+        positions = []
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for task_record, dedup_key, args in zip(task_records, dedup_keys, lane_args):
+                self._add_store_writes(pipe, task_record)
+                positions.append(len(pipe))
+                await self._add_enqueue_call(pipe, task_record, args, dedup_key)
+            results = await pipe.execute()
+        self._set_leaders(task_records, dedup_keys, [results[position] for position in positions])
+        return [task_record["task_id"] for task_record in task_records]
+
+    async def _add_enqueue_call(
+        self,
+        pipe: Any,
+        task_record: dict,
+        lane_args: list[str],
+        dedup_key: Optional[str],
+    ) -> None:
+        if dedup_key:
+            keys, args = self._enqueue_dedup_args(task_record, lane_args)
+            await self._enqueue_dedup(keys=keys, args=args, client=pipe)
+        else:
+            await self._enqueue_task(args=[*lane_args, task_record["task_id"]], client=pipe)
+
+    async def store_task(self, task_record: dict, *, events: Optional[list] = None) -> str:
+        """Сохраняет готовую запись задачи без постановки в очередь.
+
+        Если переданы events, они записываются в поток событий задачи вместе
+        с маркером конца и в список разобранных событий, как если бы задачу
+        выполнил воркер.
+        """
+        task_id = task_record["task_id"]
+        async with self.redis.pipeline(transaction=False) as pipe:
+            if events is not None:
+                task_record = self._stored_task_record(pipe, task_record, events)
+            self._add_store_writes(pipe, task_record)
+            if events is not None:
+                self._add_replay_writes(pipe, task_record, events)
+            await pipe.execute()
+        return task_id
+
+    async def get_task(self, task_id: str, *, include_response: bool = True) -> Optional[dict]:
+        return await self._load(task_id, include_response=include_response)
+
+    async def get_tasks(self, task_ids: list[str], *, include_response: bool = True) -> list[Optional[dict]]:
+        """Читает несколько записей задач за один round-trip; для отсутствующих - None."""
+        if not task_ids:
+            return []
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for task_id in task_ids:
+                self._add_load_reads(pipe, task_id, include_response)
+            return self._load_results(await pipe.execute(), include_response)
+
+    async def list_tasks(
+        self,
+        *,
+        status: Optional[str] = None,
+        flow_id: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 50,
+        include_response: bool = True,
+    ) -> tuple[list[dict], Optional[str]]:
+        """Возвращает страницу задач (новые первыми) и курсор следующей страницы."""
+        keys, args = self._list_page_args(status=status, flow_id=flow_id, cursor=cursor, limit=limit)
+        task_ids, next_cursor = self._list_page_result(await self._list_page(keys=keys, args=args))
+        if not task_ids:
+            return [], next_cursor
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for task_id in task_ids:
+                self._add_load_reads(pipe, task_id, include_response)
+            results = await pipe.execute()
+        records = [record for record in self._load_results(results, include_response) if record is not None]
+        return records, next_cursor
+
+    async def wait_for_task(
+        self,
+        task_id: str,
+        *,
+        timeout: float,
+        statuses: Collection[str],
+        include_response: bool = True,
+    ) -> Optional[dict]:
+        """Ждёт до timeout секунд, пока задача не перейдёт в один из статусов.
+
+        Возвращает последнюю прочитанную запись задачи (в том числе если время
+        ожидания истекло) или None, если задачи не существует.
+        """
+        record = None
+        try:
+            async with asyncio.timeout(timeout):
+                async with self.status_listener.watch(task_id) as changed:
+                    # Пока ждём, читаем только статус: ответ нужен один раз, в конце
+                    record = await self._load(task_id, include_response=False)
+                    while record is not None and record.get("status") not in statuses:
+                        await changed.wait()
+                        changed.clear()
+                        record = await self._load(task_id, include_response=False)
+        except TimeoutError:
+            pass
+        if include_response or record is None:
+            return await self._load(task_id, include_response=include_response)
+        return record
+
+    async def update_task(
+        self, task_id: str, updates: dict, *, unless_status: Collection[str] = ()
+    ) -> bool:
+        """Обновляет только переданные поля записи за один round-trip.
+
+        Возвращает False, если задачи нет или её текущий статус входит в unless_status.
+        """
+        return bool(await self.update_many([task_id], updates, unless_status=unless_status))
+
+    async def update_many(
+        self, task_ids: list[str], updates: dict, *, unless_status: Collection[str] = ()
+    ) -> list[str]:
+        """Применяет одни и те же обновления к нескольким задачам за один round-trip.
+
+        Задачи, текущий статус которых входит в unless_status, не меняются.
+        Возвращает id обновлённых задач.
+        """
+        if not task_ids or not updates:
+            return []
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for task_id in task_ids:
+                await self._update_task(
+                    keys=[self._key(task_id), self._response_key(task_id)],
+                    args=self._update_args(task_id, updates, unless_status),
+                    client=pipe,
+                )
+            results = await pipe.execute()
+        return [task_id for task_id, updated in zip(task_ids, results) if updated]
+
+    async def release_dedup(self, dedup_key: str, task_id: str) -> list[str]:
+        """Снимает ведущую задачу с ключа объединения и возвращает id её ведомых задач."""
+        followers = await self._release_dedup(keys=self._release_dedup_keys(dedup_key, task_id), args=[task_id])
+        return [self._decode(follower) for follower in followers]
+
+    async def hand_over_dedup(self, dedup_key: str, task_id: str) -> Optional[str]:
+        """Передаёт роль прерванной ведущей задачи первой незавершённой ведомой.
+
+        Новая ведущая задача ставится в голову своей дорожки, остальные ведомые
+        ждут уже её. Возвращает id новой ведущей задачи или None, если ждущих нет.
+        """
+        leader = await self._hand_over_dedup(
+            keys=self._release_dedup_keys(dedup_key, task_id), args=self._hand_over_dedup_args(task_id)
+        )
+        return self._decode(leader) if leader else None
+
+    async def dequeue(self, timeout: int = 0, *, prefetch: int = 1) -> Optional[dict]:
+        """Извлекает задачу из очереди. Возвращает None, если очередь пуста.
+
+        Args:
+            timeout: Таймаут блокировки в секундах. 0 означает неблокирующий режим.
+                    Если > 0, ждёт появления задачи в любой из дорожек.
+            prefetch: Не используется: задачи извлекаются по одной.
+        """
+        task_id = await self._pop_task()
+        if task_id is None and timeout > 0:
+            deadline = time.monotonic() + timeout
+            while task_id is None and (remaining := deadline - time.monotonic()) > 0:
+                # Маркер только ждём, не забирая: задачу вместе с ним извлекает скрипт
+                await self.redis.blmove(self._ready_key(), self._ready_key(), remaining, "RIGHT", "LEFT")
+                task_id = await self._pop_task()
+        if task_id is None:
+            return None
+
+        record = await self._load(task_id, include_response=False)
+        if record is None:
+            # Запись истекла по TTL, пока задача ждала в очереди
+            await self.ack(task_id)
+        return record
+
+    async def _pop_task(self) -> Optional[str]:
+        keys, args = self._dequeue_args()
+        task_id = await self._dequeue_task(keys=keys, args=args)
+        return self._decode(task_id) if task_id else None
+
+    async def queue_depths(self) -> dict[str, int]:
+        """Возвращает число задач, ожидающих в каждой дорожке очереди."""
+        return self._queue_depths(await self.redis.hgetall(self._depth_key()))
+
+    async def report_worker_stats(self, stats: dict) -> None:
+        """Публикует текущие показатели этого воркера (лимит параллелизма и т.п.)."""
+        await self.redis.hset(self._workers_key(), self.worker_id, self._worker_stats_value(stats))
+
+    async def worker_stats(self) -> dict[str, dict]:
+        """Возвращает последние показатели живых воркеров по их worker_id."""
+        stats, stale = self._worker_stats(await self.redis.hgetall(self._workers_key()))
+        if stale:
+            await self.redis.hdel(self._workers_key(), *stale)
+        return stats
+
+    async def ack(self, task_id: str) -> None:
+        """Подтверждает завершение обработки задачи (только в надёжном режиме)."""
+        if not self.reliable:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            self._add_ack_writes(pipe, task_id)
+            await pipe.execute()
+
+    async def defer(self, task_id: str, delay: float) -> None:
+        """Откладывает извлечённую задачу на delay секунд и снимает её с обработки."""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if self.reliable:
+                self._add_ack_writes(pipe, task_id)
+            pipe.zadd(self._delayed_key(), {task_id: time.time() + delay})
+            await pipe.execute()
+
+    async def promote_delayed(self, limit: int = 100) -> list[str]:
+        """Возвращает в очередь отложенные задачи, время которых наступило."""
+        keys, args = self._promote_delayed_args(limit)
+        return [self._decode(task_id) for task_id in await self._promote_delayed(keys=keys, args=args)]
+
+    async def reap_expired(self, limit: int = 100) -> list[str]:
+        """Возвращает в очередь задачи с истёкшим таймаутом видимости."""
+        keys, args = self._requeue_expired_args(limit)
+        return [self._decode(task_id) for task_id in await self._requeue_expired(keys=keys, args=args)]
+
+    async def recover_processing(self) -> int:
+        """Возвращает в очередь задачи, оставшиеся в списке обработки этого воркера."""
+        keys, args = self._recover_processing_args()
+        return await self._recover_processing(keys=keys, args=args)
+
+    async def dead_letter(self, task_id: str) -> None:
+        """Переносит задачу, исчерпавшую повторные попытки, в очередь недоставленных."""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            self._add_dead_letter_writes(pipe, task_id)
+            await pipe.execute()
+
+    async def list_dead_letters(
+        self,
+        *,
+        offset: int = 0,
+        limit: int = 50,
+        include_response: bool = True,
+    ) -> tuple[list[dict], int]:
+        """Возвращает страницу недоставленных задач (новые первыми) и их общее число."""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zrevrange(self._dead_key(), offset, offset + limit - 1)
+            pipe.zcard(self._dead_key())
+            task_ids, total = await pipe.execute()
+        records = await self.get_tasks([self._decode(task_id) for task_id in task_ids], include_response=include_response)
+        return [record for record in records if record is not None], total
+
+    async def replay_dead_letter(self, task_id: str) -> bool:
+        """Снимает задачу из очереди недоставленных и снова ставит её в очередь.
+
+        Возвращает False, если задачи нет в очереди недоставленных.
+        """
+        keys = [
+            self._key(task_id),
+            self._dead_key(),
+            self._delayed_key(),
+            self._response_key(task_id),
+            self._events_key(task_id),
+            self._parsed_events_key(task_id),
+            self._parsed_types_key(task_id),
+        ]
+        return bool(await self._replay_dead_letter(keys=keys, args=self._update_args(task_id, self._replay_fields())))
+
+    async def list_archivable(
+        self,
+        statuses: Collection[str],
+        *,
+        older_than: float,
+        limit: int = 100,
+    ) -> list[dict]:
+        """Возвращает полные записи задач в статусах statuses, завершённых более older_than секунд назад.
+
+        Возраст считается от finished_at; задачи без него не возвращаются. Старые
+        задачи первыми. Задачи из очереди недоставленных не возвращаются: они ждут
+        разбора и повторного запуска.
+        """
+        cutoff = time.time() - older_than
+        archivable: list[str] = []
+        offset = 0
+        # Индексы статусов упорядочены по времени создания, а задача, созданная
+        # давно, могла завершиться недавно: такие пропускаем и читаем дальше
+        while len(archivable) < limit:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                self._add_archivable_reads(pipe, statuses, cutoff, offset, limit)
+                results = await pipe.execute()
+            candidates = self._archivable_candidates(results)
+            if candidates:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for task_id in candidates:
+                        pipe.hget(self._key(task_id), "finished_at")
+                        pipe.zscore(self._dead_key(), task_id)
+                    checks = await pipe.execute()
+                archivable.extend(
+                    task_id
+                    for task_id, finished_at, dead in zip(candidates, checks[::2], checks[1::2])
+                    if dead is None and self._finished_before(finished_at, cutoff)
+                )
+            if all(len(result) < limit for result in results):
+                break
+            offset += limit
+        records = await self.get_tasks(archivable[:limit])
+        return [record for record in records if record is not None]
+
+    async def delete_tasks(self, task_ids: list[str], *, statuses: Collection[str]) -> list[str]:
+        """Удаляет задачи со всеми их данными, если они всё ещё в одном из статусов statuses.
+
+        Возвращает id удалённых задач.
+        """
+        if not task_ids:
+            return []
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for task_id in task_ids:
+                keys, args = self._delete_task_args(task_id, statuses)
+                await self._delete_task(keys=keys, args=args, client=pipe)
+            results = await pipe.execute()
+        return [task_id for task_id, deleted in zip(task_ids, results) if deleted]
+
+    async def append_event(self, task_id: str, event: Any) -> str:
+        """Добавляет событие выполнения в поток событий задачи. Возвращает id записи."""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            self._add_event_writes(pipe, task_id, {"event": json.dumps(event, ensure_ascii=False)})
+            return self._decode((await pipe.execute())[0])
+
+    async def end_events(self, task_id: str, status: str) -> None:
+        """Закрывает поток событий задачи маркером конца с итоговым статусом."""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            self._add_event_writes(pipe, task_id, {"end": status})
+            await pipe.execute()
+
+    async def read_events(
+        self,
+        task_id: str,
+        last_event_id: str = "0",
+        *,
+        block_ms: Optional[int] = None,
+        count: int = 100,
+    ) -> list[tuple[str, dict]]:
+        """Читает события задачи, записанные после last_event_id."""
+        response = await self.redis.xread({self._events_key(task_id): last_event_id}, count=count, block=block_ms)
+        return self._decode_event_entries(response)
+
+    async def store_events(self, task_id: str, events: list, *, status_code: Optional[int] = None) -> dict:
+        """Сохраняет разобранные события задачи, заменяя ранее сохранённые."""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            summary = self._add_parsed_event_writes(pipe, task_id, events, status_code)
+            await pipe.execute()
+        return summary
+
+    async def get_events(
+        self,
+        task_id: str,
+        *,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        types: Optional[list[str]] = None,
+    ) -> tuple[list, int]:
+        """Читает страницу разобранных событий задачи."""
+        keys, args = self._page_events_args(task_id, offset, limit, types)
+        return self._page_events_result(await self._page_events(keys=keys, args=args))
+
+    async def ping(self) -> None:
+        """Проверяет подключение к Redis."""
+        await self.redis.ping()
+
+    async def close(self) -> None:
+        """Возвращает соединения в пул и закрывает его."""
+        await self.status_listener.close()
+        await self.redis.aclose(close_connection_pool=True)
+
+
+def create_async_redis_queue_connector(redis_conn: AsyncRedis, **settings: Any) -> AsyncRedisQueueConnector:
+    return AsyncRedisQueueConnector(redis_conn=redis_conn, **settings)
+
+
+__all__ = ["AsyncRedisQueueConnector", "create_async_redis_queue_connector"]
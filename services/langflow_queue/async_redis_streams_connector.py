@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+from typing import Any, Optional
+
+from redis.asyncio import Redis as AsyncRedis
+from redis.exceptions import ResponseError
+
+from .async_redis_connector import AsyncRedisQueueConnector
+from .redis_streams_connector import RedisStreamsQueueBase
+from .scripts import (
+    STREAM_ENQUEUE_DEDUP,
+    STREAM_ENQUEUE_TASK,
+    STREAM_HAND_OVER_DEDUP,
+    STREAM_PROMOTE_DELAYED,
+    STREAM_RECOVER_PENDING,
+    STREAM_REQUEUE_EXPIRED,
+)
+
+
+class AsyncRedisStreamsQueueConnector(RedisStreamsQueueBase, AsyncRedisQueueConnector):
+    """Асинхронный коннектор очереди на Redis Streams с группой потребителей."""
+
+    def __init__(self, *, redis_conn: AsyncRedis, **settings: Any) -> None:
+        super().__init__(redis_conn=redis_conn, **settings)
+        self._enqueue_task = redis_conn.register_script(STREAM_ENQUEUE_TASK)
+        self._enqueue_dedup = redis_conn.register_script(STREAM_ENQUEUE_DEDUP)
+        self._hand_over_dedup = redis_conn.register_script(STREAM_HAND_OVER_DEDUP)
+        self._promote_delayed = redis_conn.register_script(STREAM_PROMOTE_DELAYED)
+        self._requeue_expired = redis_conn.register_script(STREAM_REQUEUE_EXPIRED)
+        self._recover_processing = redis_conn.register_script(STREAM_RECOVER_PENDING)
+
+    async def _ensure_groups(self) -> None:
+        if self._groups_ready:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            self._add_group_writes(pipe)
+            self._check_group_results(await pipe.execute(raise_on_error=False))
+
+    async def dequeue(self, timeout: int = 0, *, prefetch: int = 1) -> Optional[dict]:
+        """Извлекает задачу из очереди. Возвращает None, если очередь пуста.
+
+        Args:
+            timeout: Таймаут блокировки в секундах. 0 означает неблокирующий режим.
+                    Если > 0, ждёт появления задачи в любой из дорожек.
+            prefetch: Сколько задач воркер готов взять в работу прямо сейчас;
+                    из Redis забирается не больше min(prefetch, batch_size) задач.
+        """
+        if not self._buffer:
+            await self._fill_buffer(timeout, min(max(1, prefetch), self.batch_size))
+        return self._buffer.popleft()[1] if self._buffer else None
+
+    async def _fill_buffer(self, timeout: int, limit: int) -> None:
+        await self._ensure_groups()
+        try:
+            entries = await self._read_lanes(limit)
+            if not entries and timeout > 0 and await self._wait_for_entries(timeout):
+                entries = await self._read_lanes(limit)
+        except ResponseError as e:
+            if not self._is_missing_group(e):
+                raise
+            # Поток удалён вместе с группой: создадим её заново при следующем вызове
+            self._groups_ready = False
+            return
+        if not entries:
+            return
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for _, _, task_id in entries:
+                self._add_load_reads(pipe, task_id, False)
+            self._add_claim_writes(pipe, entries)
+            records = self._load_results((await pipe.execute())[: len(entries)], False)
+        for (stream, _, task_id), record in zip(entries, records):
+            if record is None:
+                # Запись истекла по TTL, пока задача ждала в очереди
+                await self.ack(task_id)
+            else:
+                self._buffer.append((stream, record))
+
+    async def _read_lanes(self, limit: int) -> list[tuple[str, str, str]]:
+        """Забирает из дорожек до limit записей по их долям, добирая недобор пустых дорожек."""
+        quotas = self._lane_quotas(limit, list(self.lanes), self._lane_credits)
+        entries = await self._read_quotas(quotas)
+        short = limit - len(entries)
+        if short > 0:
+            lanes = self._refill_lanes(quotas, entries)
+            entries += await self._read_quotas(self._lane_quotas(short, lanes, {}))
+        return entries
+
+    async def _read_quotas(self, quotas: dict[str, int]) -> list[tuple[str, str, str]]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for lane, count in quotas.items():
+                if count:
+                    pipe.xreadgroup(streams={self._stream_key(lane): ">"}, count=count, **self._read_args())
+            return [entry for response in await pipe.execute() for entry in self._stream_entries(response)]
+
+    async def _wait_for_entries(self, timeout: int) -> bool:
+        """Ждёт до timeout секунд новых для группы записей в дорожках, не забирая их.
+
+        Возвращает False, если за это время записи не появились.
+        """
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for stream in self._stream_keys():
+                pipe.xinfo_groups(stream)
+            last_ids = self._last_delivered_ids(await pipe.execute(raise_on_error=False))
+        return bool(await self.redis.xread(streams=last_ids, count=1, block=int(timeout * 1000)))
+
+    async def queue_depths(self) -> dict[str, int]:
+        """Возвращает число задач, ожидающих в каждой дорожке очереди."""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for stream in self._stream_keys():
+                pipe.xlen(stream)
+                pipe.xinfo_groups(stream)
+            return self._stream_depths(await pipe.execute(raise_on_error=False))
+
+    async def reap_expired(self, limit: int = 100) -> list[str]:
+        """Возвращает в очередь задачи с истёкшим таймаутом видимости и убирает ушедших потребителей."""
+        await self._ensure_groups()
+        args = [self.consumer_group, self.worker_id, self.visibility_timeout * 1000, limit]
+        requeued = await self._requeue_expired(keys=self._stream_keys(), args=args)
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for stream in self._stream_keys():
+                pipe.xinfo_consumers(stream, self.consumer_group)
+            stale = self._stale_consumers(await pipe.execute(raise_on_error=False))
+        if stale:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for stream, consumer in stale:
+                    pipe.xgroup_delconsumer(stream, self.consumer_group, consumer)
+                await pipe.execute()
+        return [self._decode(task_id) for task_id in requeued]
+
+    async def recover_processing(self) -> int:
+        """Возвращает в очередь задачи, числящиеся за этим воркером в группе потребителей."""
+        await self._ensure_groups()
+        self._buffer.clear()
+        self._claimed.clear()
+        return await self._recover_processing(keys=self._stream_keys(), args=[self.consumer_group, self.worker_id])
+
+    async def close(self) -> None:
+        """Возвращает в очередь полученные, но не выданные задачи и закрывает соединения."""
+        if self._buffer:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                for stream, record in self._buffer:
+                    self._add_requeue_writes(pipe, stream, record["task_id"])
+                await pipe.execute()
+            self._buffer.clear()
+        await super().close()
+
+
+def create_async_redis_streams_queue_connector(
+    redis_conn: AsyncRedis, **settings: Any
+) -> AsyncRedisStreamsQueueConnector:
+    return AsyncRedisStreamsQueueConnector(redis_conn=redis_conn, **settings)
+
+
+__all__ = ["AsyncRedisStreamsQueueConnector", "create_async_redis_streams_queue_connector"]
@@ -0,0 +1,298 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Collection, Optional
+
+from .base import AsyncBaseQueueConnector
+from .sqlite_connector import SqliteQueueConnector
+
+
+class AsyncSqliteQueueConnector(AsyncBaseQueueConnector):
+    """Асинхронный коннектор очереди на встроенной базе SQLite.
+
+    Операции выполняет SqliteQueueConnector в отдельном потоке, чтобы запросы
+    к базе не блокировали event loop; один поток на коннектор сохраняет
+    порядок операций. Ожидания (dequeue с таймаутом, wait_for_task, чтение
+    событий) выполняются в event loop: записи этого процесса будят их сразу,
+    записи других процессов замечаются с задержкой не более poll_interval.
+    """
+
+    def __init__(self, **settings: Any) -> None:
+        self.store = SqliteQueueConnector(**settings)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-queue")
+        self._changed = asyncio.Condition()
+
+    @property
+    def lanes(self) -> dict[str, int]:
+        return self.store.lanes
+
+    @property
+    def default_lane(self) -> str:
+        return self.store.default_lane
+
+    @property
+    def reliable(self) -> bool:
+        return self.store.reliable
+
+    @property
+    def worker_id(self) -> str:
+        return self.store.worker_id
+
+    async def _call(self, method: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(method, *args, **kwargs))
+
+    async def _write(self, method: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        result = await self._call(method, *args, **kwargs)
+        await self._notify()
+        return result
+
+    async def _notify(self) -> None:
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def _wait_changed(self, timeout: float) -> None:
+        # asyncio.timeout, а не wait_for: wait_for может проглотить отмену
+        # ожидающего, если она совпала с пробуждением
+        try:
+            async with asyncio.timeout(min(timeout, self.store.poll_interval)):
+                async with self._changed:
+                    await self._changed.wait()
+        except TimeoutError:
+            pass
+
+    async def enqueue(self, task_record: dict, *, dedup_key: Optional[str] = None) -> str:
+        """Сохраняет запись задачи и добавляет её в очередь."""
+        return await self._write(self.store.enqueue, task_record, dedup_key=dedup_key)
+
+    async def enqueue_many(
+        self,
+        task_records: list[dict],
+        *,
+        dedup_keys: Optional[list[Optional[str]]] = None,
+    ) -> list[str]:
+        """Ставит несколько задач в очередь одной транзакцией."""
+        return await self._write(self.store.enqueue_many, task_records, dedup_keys=dedup_keys)
+
+    async def store_task(self, task_record: dict, *, events: Optional[list] = None) -> str:
+        """Сохраняет готовую запись задачи без постановки в очередь."""
+        return await self._write(self.store.store_task, task_record, events=events)
+
+    async def get_task(self, task_id: str, *, include_response: bool = True) -> Optional[dict]:
+        return await self._call(self.store.get_task, task_id, include_response=include_response)
+
+    async def get_tasks(self, task_ids: list[str], *, include_response: bool = True) -> list[Optional[dict]]:
+        """Читает несколько записей задач одним запросом; для отсутствующих - None."""
+        return await self._call(self.store.get_tasks, task_ids, include_response=include_response)
+
+    async def list_tasks(
+        self,
+        *,
+        status: Optional[str] = None,
+        flow_id: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 50,
+        include_response: bool = True,
+    ) -> tuple[list[dict], Optional[str]]:
+        """Возвращает страницу задач (новые первыми) и курсор следующей страницы."""
+        return await self._call(
+            self.store.list_tasks,
+            status=status,
+            flow_id=flow_id,
+            cursor=cursor,
+            limit=limit,
+            include_response=include_response,
+        )
+
+    async def wait_for_task(
+        self,
+        task_id: str,
+        *,
+        timeout: float,
+        statuses: Collection[str],
+        include_response: bool = True,
+    ) -> Optional[dict]:
+        """Ждёт до timeout секунд, пока задача не перейдёт в один из статусов.
+
+        Возвращает последнюю прочитанную запись задачи (в том числе если время
+        ожидания истекло) или None, если задачи не существует.
+        """
+        deadline = time.monotonic() + timeout
+        # Пока ждём, читаем только статус: ответ нужен один раз, в конце
+        record = await self.get_task(task_id, include_response=False)
+        while record is not None and record.get("status") not in statuses:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await self._wait_changed(remaining)
+            record = await self.get_task(task_id, include_response=False)
+        if include_response or record is None:
+            return await self.get_task(task_id, include_response=include_response)
+        return record
+
+    async def update_task(
+        self, task_id: str, updates: dict, *, unless_status: Collection[str] = ()
+    ) -> bool:
+        """Обновляет только переданные поля записи, если её статус не входит в unless_status."""
+        return await self._write(self.store.update_task, task_id, updates, unless_status=unless_status)
+
+    async def update_many(
+        self, task_ids: list[str], updates: dict, *, unless_status: Collection[str] = ()
+    ) -> list[str]:
+        """Применяет одни и те же обновления к нескольким задачам одной транзакцией.
+
+        Возвращает id обновлённых задач.
+        """
+        return await self._write(self.store.update_many, task_ids, updates, unless_status=unless_status)
+
+    async def release_dedup(self, dedup_key: str, task_id: str) -> list[str]:
+        """Снимает ведущую задачу с ключа объединения и возвращает id её ведомых задач."""
+        return await self._write(self.store.release_dedup, dedup_key, task_id)
+
+    async def hand_over_dedup(self, dedup_key: str, task_id: str) -> Optional[str]:
+        """Передаёт роль прерванной ведущей задачи первой незавершённой ведомой."""
+        return await self._write(self.store.hand_over_dedup, dedup_key, task_id)
+
+    async def dequeue(self, timeout: int = 0, *, prefetch: int = 1) -> Optional[dict]:
+        """Извлекает задачу из очереди. Возвращает None, если очередь пуста.
+
+        Args:
+            timeout: Таймаут блокировки в секундах. 0 означает неблокирующий режим.
+                    Если > 0, ждёт появления задачи в любой из дорожек.
+            prefetch: Не используется: задачи извлекаются по одной.
+        """
+        deadline = time.monotonic() + timeout
+        # Пустой результат ничего не меняет: будить им других ожидающих нельзя,
+        # иначе простаивающие dequeue этого процесса будили бы друг друга по кругу
+        while (record := await self._call(self.store.dequeue)) is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await self._wait_changed(remaining)
+        if record is not None:
+            await self._notify()
+        return record
+
+    async def queue_depths(self) -> dict[str, int]:
+        """Возвращает число задач, ожидающих в каждой дорожке очереди."""
+        return await self._call(self.store.queue_depths)
+
+    async def report_worker_stats(self, stats: dict) -> None:
+        """Публикует текущие показатели этого воркера (лимит параллелизма и т.п.)."""
+        await self._write(self.store.report_worker_stats, stats)
+
+    async def worker_stats(self) -> dict[str, dict]:
+        """Возвращает последние показатели живых воркеров по их worker_id."""
+        return await self._call(self.store.worker_stats)
+
+    async def ack(self, task_id: str) -> None:
+        """Подтверждает завершение обработки задачи (только в надёжном режиме)."""
+        await self._write(self.store.ack, task_id)
+
+    async def defer(self, task_id: str, delay: float) -> None:
+        """Откладывает извлечённую задачу на delay секунд и снимает её с обработки."""
+        await self._write(self.store.defer, task_id, delay)
+
+    async def promote_delayed(self, limit: int = 100) -> list[str]:
+        """Возвращает в очередь отложенные задачи, время которых наступило."""
+        return await self._write(self.store.promote_delayed, limit)
+
+    async def reap_expired(self, limit: int = 100) -> list[str]:
+        """Возвращает в очередь задачи с истёкшим таймаутом видимости."""
+        return await self._write(self.store.reap_expired, limit)
+
+    async def recover_processing(self) -> int:
+        """Возвращает в очередь задачи, числящиеся в обработке у этого воркера."""
+        return await self._write(self.store.recover_processing)
+
+    async def dead_letter(self, task_id: str) -> None:
+        """Переносит задачу, исчерпавшую повторные попытки, в очередь недоставленных."""
+        await self._write(self.store.dead_letter, task_id)
+
+    async def list_dead_letters(
+        self,
+        *,
+        offset: int = 0,
+        limit: int = 50,
+        include_response: bool = True,
+    ) -> tuple[list[dict], int]:
+        """Возвращает страницу недоставленных задач (новые первыми) и их общее число."""
+        return await self._call(
+            self.store.list_dead_letters, offset=offset, limit=limit, include_response=include_response
+        )
+
+    async def replay_dead_letter(self, task_id: str) -> bool:
+        """Снимает задачу из очереди недоставленных и снова ставит её в очередь."""
+        return await self._write(self.store.replay_dead_letter, task_id)
+
+    async def list_archivable(
+        self,
+        statuses: Collection[str],
+        *,
+        older_than: float,
+        limit: int = 100,
+    ) -> list[dict]:
+        """Возвращает полные записи задач в статусах statuses, завершённых более older_than секунд назад."""
+        return await self._call(self.store.list_archivable, statuses, older_than=older_than, limit=limit)
+
+    async def delete_tasks(self, task_ids: list[str], *, statuses: Collection[str]) -> list[str]:
+        """Удаляет задачи, всё ещё находящиеся в одном из статусов statuses. Возвращает id удалённых."""
+        return await self._write(self.store.delete_tasks, task_ids, statuses=statuses)
+
+    async def append_event(self, task_id: str, event: Any) -> str:
+        """Добавляет событие выполнения в поток событий задачи. Возвращает id записи."""
+        return await self._write(self.store.append_event, task_id, event)
+
+    async def end_events(self, task_id: str, status: str) -> None:
+        """Закрывает поток событий задачи маркером конца с итоговым статусом."""
+        await self._write(self.store.end_events, task_id, status)
+
+    async def read_events(
+        self,
+        task_id: str,
+        last_event_id: str = "0",
+        *,
+        block_ms: Optional[int] = None,
+        count: int = 100,
+    ) -> list[tuple[str, dict]]:
+        """Читает события задачи, записанные после last_event_id."""
+        deadline = time.monotonic() + (block_ms or 0) / 1000
+        while not (entries := await self._call(self.store.read_events, task_id, last_event_id, count=count)):
+            remaining = deadline - time.monotonic()
+            if not block_ms or remaining <= 0:
+                break
+            await self._wait_changed(remaining)
+        return entries
+
+    async def store_events(self, task_id: str, events: list, *, status_code: Optional[int] = None) -> dict:
+        """Сохраняет разобранные события задачи, заменяя ранее сохранённые."""
+        return await self._write(self.store.store_events, task_id, events, status_code=status_code)
+
+    async def get_events(
+        self,
+        task_id: str,
+        *,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        types: Optional[list[str]] = None,
+    ) -> tuple[list, int]:
+        """Читает страницу разобранных событий задачи."""
+        return await self._call(self.store.get_events, task_id, offset=offset, limit=limit, types=types)
+
+    async def ping(self) -> None:
+        """Проверяет доступность базы."""
+        await self._call(self.store.ping)
+
+    async def close(self) -> None:
+        """Закрывает соединение с базой и останавливает поток коннектора."""
+        await self._call(self.store.close)
+        self._executor.shutdown(wait=False)
+
+
+def create_async_sqlite_queue_connector(**settings: Any) -> AsyncSqliteQueueConnector:
+    return AsyncSqliteQueueConnector(**settings)
+
+
+__all__ = ["AsyncSqliteQueueConnector", "create_async_sqlite_queue_connector"]
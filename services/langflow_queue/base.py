@@ -1,40 +1,212 @@
 from __future__ import annotations
 
-from typing import Optional, Protocol, runtime_checkable
+from typing import Any, Collection, Optional, Protocol, runtime_checkable
+
+# Статусы, из которых задача уже не переходит ни в какой другой
+TERMINAL_STATUSES = frozenset({"completed", "failed", "cancelled", "expired"})
 
 
 @runtime_checkable
-class BaseQueueConnector(Protocol):
-    """Общий интерфейс для бэкендов очередей."""
+class AsyncBaseQueueConnector(Protocol):
+    """Общий интерфейс бэкендов очередей (неблокирующий, для event loop)."""
 
-    def enqueue(self, task_record: dict) -> str:
+    async def enqueue(self, task_record: dict, *, dedup_key: Optional[str] = None) -> str:
         """Сохраняет и ставит задачу в очередь. Возвращает сгенерированный task_id."""
         ...
 
-    def get_task(self, task_id: str) -> Optional[dict]:
+    async def enqueue_many(
+        self,
+        task_records: list[dict],
+        *,
+        dedup_keys: Optional[list[Optional[str]]] = None,
+    ) -> list[str]:
+        """Сохраняет и ставит в очередь несколько задач одной операцией бэкенда."""
+        ...
+
+    async def store_task(self, task_record: dict, *, events: Optional[list] = None) -> str:
+        """Сохраняет готовую запись задачи без постановки в очередь."""
+        ...
+
+    async def get_task(self, task_id: str, *, include_response: bool = True) -> Optional[dict]:
         """Получает ранее сохранённую запись задачи."""
         ...
 
-    def list_tasks(self) -> list[dict]:
-        """Возвращает все известные записи задач."""
+    async def get_tasks(self, task_ids: list[str], *, include_response: bool = True) -> list[Optional[dict]]:
+        """Получает несколько записей задач одной операцией бэкенда."""
+        ...
+
+    async def list_tasks(
+        self,
+        *,
+        status: Optional[str] = None,
+        flow_id: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 50,
+        include_response: bool = True,
+    ) -> tuple[list[dict], Optional[str]]:
+        """Возвращает страницу записей задач (новые первыми) и курсор следующей страницы."""
+        ...
+
+    async def wait_for_task(
+        self,
+        task_id: str,
+        *,
+        timeout: float,
+        statuses: Collection[str],
+        include_response: bool = True,
+    ) -> Optional[dict]:
+        """Ждёт до timeout секунд, пока задача не перейдёт в один из статусов.
+
+        Возвращает последнюю прочитанную запись задачи или None, если её не существует.
+        """
         ...
 
-    def update_task(self, task_id: str, updates: dict) -> None:
-        """Применяет обновления (статус, результат, ошибка и т.д.) к записи задачи."""
+    async def update_task(
+        self, task_id: str, updates: dict, *, unless_status: Collection[str] = ()
+    ) -> bool:
+        """Применяет обновления (статус, результат, ошибка и т.д.) к записи задачи.
+
+        Проверка статуса и запись атомарны: если текущий статус задачи входит
+        в unless_status или задачи нет, запись не меняется и возвращается False.
+        """
         ...
 
-    def dequeue(self, timeout: int = 0) -> Optional[dict]:
+    async def update_many(
+        self, task_ids: list[str], updates: dict, *, unless_status: Collection[str] = ()
+    ) -> list[str]:
+        """Применяет одни и те же обновления к нескольким задачам.
+
+        Возвращает id задач, к которым обновления применены (см. update_task).
+        """
+        ...
+
+    async def release_dedup(self, dedup_key: str, task_id: str) -> list[str]:
+        """Снимает завершённую ведущую задачу с ключа объединения и возвращает id ведомых задач."""
+        ...
+
+    async def hand_over_dedup(self, dedup_key: str, task_id: str) -> Optional[str]:
+        """Делает ведущей первую незавершённую ведомую задачу прерванной ведущей и ставит её в очередь.
+
+        Возвращает id новой ведущей задачи или None, если ждущих ведомых нет.
+        """
+        ...
+
+    async def dequeue(self, timeout: int = 0, *, prefetch: int = 1) -> Optional[dict]:
         """Извлекает задачу из очереди. Возвращает None, если очередь пуста.
-        
+
         Args:
             timeout: Таймаут блокировки в секундах. 0 означает неблокирующий режим.
+            prefetch: Сколько задач вызывающий готов взять в работу прямо сейчас.
+                    Бэкенд, забирающий задачи пачками, не держит за воркером больше.
         """
         ...
 
-    def ping(self) -> None:
+    async def queue_depths(self) -> dict[str, int]:
+        """Возвращает число задач, ожидающих в каждой дорожке приоритета."""
+        ...
+
+    async def report_worker_stats(self, stats: dict) -> None:
+        """Публикует текущие показатели воркера, от имени которого работает коннектор."""
+        ...
+
+    async def worker_stats(self) -> dict[str, dict]:
+        """Возвращает последние показатели живых воркеров по их worker_id."""
+        ...
+
+    async def ack(self, task_id: str) -> None:
+        """Подтверждает, что обработка извлечённой задачи завершена."""
+        ...
+
+    async def defer(self, task_id: str, delay: float) -> None:
+        """Откладывает извлечённую задачу на delay секунд, не считая её обработанной."""
+        ...
+
+    async def promote_delayed(self, limit: int = 100) -> list[str]:
+        """Возвращает в очередь отложенные задачи, время которых наступило."""
+        ...
+
+    async def reap_expired(self, limit: int = 100) -> list[str]:
+        """Возвращает в очередь задачи с истёкшим таймаутом видимости."""
+        ...
+
+    async def recover_processing(self) -> int:
+        """Возвращает в очередь задачи, не подтверждённые этим воркером до перезапуска."""
+        ...
+
+    async def dead_letter(self, task_id: str) -> None:
+        """Переносит задачу, исчерпавшую повторные попытки, в очередь недоставленных."""
+        ...
+
+    async def list_dead_letters(
+        self,
+        *,
+        offset: int = 0,
+        limit: int = 50,
+        include_response: bool = True,
+    ) -> tuple[list[dict], int]:
+        """Возвращает страницу недоставленных задач (новые первыми) и их общее число."""
+        ...
+
+    async def replay_dead_letter(self, task_id: str) -> bool:
+        """Снимает задачу из очереди недоставленных и снова ставит её в очередь."""
+        ...
+
+    async def list_archivable(
+        self,
+        statuses: Collection[str],
+        *,
+        older_than: float,
+        limit: int = 100,
+    ) -> list[dict]:
+        """Возвращает полные записи задач в статусах statuses, завершённых более older_than секунд назад."""
+        ...
+
+    async def delete_tasks(self, task_ids: list[str], *, statuses: Collection[str]) -> list[str]:
+        """Удаляет задачи, всё ещё находящиеся в одном из статусов statuses. Возвращает id удалённых."""
+        ...
+
+    async def append_event(self, task_id: str, event: Any) -> str:
+        """Добавляет событие выполнения в поток событий задачи. Возвращает id записи."""
+        ...
+
+    async def end_events(self, task_id: str, status: str) -> None:
+        """Закрывает поток событий задачи маркером конца с итоговым статусом."""
+        ...
+
+    async def read_events(
+        self,
+        task_id: str,
+        last_event_id: str = "0",
+        *,
+        block_ms: Optional[int] = None,
+        count: int = 100,
+    ) -> list[tuple[str, dict]]:
+        """Читает события задачи, записанные после last_event_id."""
+        ...
+
+    async def store_events(self, task_id: str, events: list, *, status_code: Optional[int] = None) -> dict:
+        """Сохраняет разобранные события завершённой задачи для постраничного чтения."""
+        ...
+
+    async def get_events(
+        self,
+        task_id: str,
+        *,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        types: Optional[list[str]] = None,
+    ) -> tuple[list, int]:
+        """Читает страницу разобранных событий задачи."""
+        ...
+
+    async def ping(self) -> None:
         """Проверяет подключение к базовому бэкенду очереди."""
         ...
 
+    async def close(self) -> None:
+        """Закрывает соединения с бэкендом очереди."""
+        ...
+
 
-__all__ = ["BaseQueueConnector"]
+__all__ = ["AsyncBaseQueueConnector", "TERMINAL_STATUSES"]
 
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import time
+from typing import Any, Mapping, Optional
+
+from redis.asyncio import Redis as AsyncRedis
+
+from .codec import Codec
+from .scripts import CACHE_SET
+
+
+class ResultCache:
+    """Кэш результатов выполнения flow, адресуемый хэшем запроса.
+
+    Значения хранятся в Redis с TTL, который можно задать отдельно для каждого
+    flow (0 отключает кэширование flow). Суммарный размер значений ограничен
+    max_bytes: при превышении вытесняются записи, к которым дольше всего не
+    обращались. Счётчики попаданий и промахов хранятся в Redis и общие для
+    всех процессов. Значения кодируются тем же кодеком, что и ответы задач.
+    """
+
+    def __init__(
+        self,
+        redis_conn: AsyncRedis,
+        *,
+        key_prefix: str = "task:cache",
+        ttl_seconds: int = 60 * 60,
+        flow_ttls: Optional[Mapping[str, int]] = None,
+        max_bytes: int = 100 * 1024 * 1024,
+        codec: Optional[Codec] = None,
+    ) -> None:
+        self.redis = redis_conn
+        self.key_prefix = key_prefix.rstrip(":")
+        self.ttl_seconds = ttl_seconds
+        self.flow_ttls = dict(flow_ttls or {})
+        self.max_bytes = max_bytes
+        self.codec = codec or Codec()
+        self._set = redis_conn.register_script(CACHE_SET)
+
+    def _key(self, cache_key: str) -> str:
+        return f"{self.key_prefix}:entry:{cache_key}"
+
+    def _meta_key(self, name: str) -> str:
+        return f"{self.key_prefix}:{name}"
+
+    def ttl_for(self, flow_id: Optional[str]) -> int:
+        """Возвращает TTL кэша для flow. 0 означает, что результаты flow не кэшируются."""
+        if flow_id is not None and flow_id in self.flow_ttls:
+            return self.flow_ttls[flow_id]
+        return self.ttl_seconds
+
+    async def get(self, cache_key: str) -> Optional[Any]:
+        """Возвращает закэшированный результат и учитывает попадание или промах."""
+        key = self._key(cache_key)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.get(key)
+            pipe.zadd(self._meta_key("lru"), {key: time.time()}, xx=True)
+            raw, _ = await pipe.execute()
+
+        try:
+            value = self.codec.loads(raw) if raw is not None else None
+        except (ValueError, OSError):
+            value = None
+        await self.redis.hincrby(self._meta_key("stats"), "misses" if value is None else "hits", 1)
+        return value
+
+    async def get_many(self, cache_keys: list[str]) -> list[Optional[Any]]:
+        """Возвращает закэшированные результаты нескольких запросов одним MGET.
+
+        Returns:
+            Значения в порядке cache_keys; None на месте промахов.
+        """
+        if not cache_keys:
+            return []
+        keys = [self._key(cache_key) for cache_key in cache_keys]
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.mget(keys)
+            pipe.zadd(self._meta_key("lru"), {key: time.time() for key in keys}, xx=True)
+            raws, _ = await pipe.execute()
+
+        values = []
+        for raw in raws:
+            try:
+                values.append(self.codec.loads(raw) if raw is not None else None)
+            except (ValueError, OSError):
+                values.append(None)
+        hits = sum(value is not None for value in values)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hincrby(self._meta_key("stats"), "hits", hits)
+            pipe.hincrby(self._meta_key("stats"), "misses", len(values) - hits)
+            await pipe.execute()
+        return values
+
+    async def set(self, cache_key: str, value: Any, *, flow_id: Optional[str] = None) -> None:
+        """Сохраняет результат с TTL flow и вытесняет старые записи сверх лимита размера."""
+        ttl = self.ttl_for(flow_id)
+        if ttl <= 0:
+            return
+        await self._set(
+            keys=[
+                self._key(cache_key),
+                self._meta_key("lru"),
+                self._meta_key("sizes"),
+                self._meta_key("bytes"),
+                self._meta_key("stats"),
+            ],
+            args=[self.codec.dumps(value), ttl, time.time(), self.max_bytes],
+        )
+
+    async def stats(self) -> dict[str, int]:
+        """Возвращает счётчики попаданий, промахов, вытеснений и текущий объём кэша."""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(self._meta_key("stats"))
+            pipe.get(self._meta_key("bytes"))
+            pipe.zcard(self._meta_key("lru"))
+            counters, size, entries = await pipe.execute()
+
+        counters = {
+            (name.decode() if isinstance(name, bytes) else name): int(value)
+            for name, value in counters.items()
+        }
+        return {
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "evictions": counters.get("evictions", 0),
+            "entries": entries,
+            "bytes": int(size or 0),
+            "max_bytes": self.max_bytes,
+        }
+
+
+__all__ = ["ResultCache"]
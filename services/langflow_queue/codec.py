@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import gzip
+import json
+from typing import Any, Union
+
+# Значение с заголовком: MAGIC, формат сериализации и способ сжатия.
+# JSON-текст не может начинаться с нулевого байта, поэтому значения, записанные
+# без заголовка (в том числе до появления кодека), читаются как обычный JSON.
+MAGIC = b"\x00"
+
+SERIALIZERS = ("json", "orjson", "msgpack")
+COMPRESSIONS = ("none", "gzip", "zstd")
+
+
+class Codec:
+    """Кодирование значений задач для хранения в Redis.
+
+    Небольшие поля записи всегда хранятся в JSON: их читают и пишут Lua-скрипты
+    (статус, дорожка, flow_id). Для них serializer="orjson" лишь ускоряет
+    кодирование. Крупные значения (ответ Langflow, записи кэша результатов)
+    кодируются выбранным сериализатором и сжимаются, если превышают threshold
+    байт. orjson, msgpack и zstandard - необязательные зависимости, которые
+    нужны только при выборе соответствующего формата.
+    """
+
+    def __init__(
+        self,
+        *,
+        serializer: str = "json",
+        compression: str = "gzip",
+        threshold: int = 4096,
+        level: int = 3,
+    ) -> None:
+        if serializer not in SERIALIZERS:
+            raise ValueError(f"Unknown serializer: {serializer}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression: {compression}")
+        self.serializer = serializer
+        self.compression = compression
+        self.threshold = threshold
+        self.level = level
+
+        self._orjson = self._import("orjson") if serializer == "orjson" else None
+        self._msgpack = self._import("msgpack") if serializer == "msgpack" else None
+        self._zstd = self._import("zstandard") if compression == "zstd" else None
+
+    @staticmethod
+    def _import(module: str) -> Any:
+        try:
+            return __import__(module)
+        except ImportError:
+            raise RuntimeError(f"Package {module} is required for this codec setting") from None
+
+    def dumps_field(self, value: Any) -> Union[str, bytes]:
+        """Кодирует поле записи задачи в JSON, совместимый с Lua cjson."""
+        if self._orjson is not None:
+            return self._orjson.dumps(value)
+        return json.dumps(value, ensure_ascii=False)
+
+    def loads_field(self, raw: Union[str, bytes]) -> Any:
+        if self._orjson is not None:
+            return self._orjson.loads(raw)
+        return json.loads(raw)
+
+    def dumps(self, value: Any) -> bytes:
+        """Кодирует крупное значение, сжимая его сверх порога размера."""
+        if self._msgpack is not None:
+            data, fmt = self._msgpack.packb(value, use_bin_type=True), b"m"
+        else:
+            data, fmt = self.dumps_field(value), b"j"
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+
+        if self.compression == "none" or len(data) < self.threshold:
+            return MAGIC + fmt + b"-" + data
+        if self._zstd is not None:
+            return MAGIC + fmt + b"s" + self._zstd.ZstdCompressor(level=self.level).compress(data)
+        return MAGIC + fmt + b"g" + gzip.compress(data, compresslevel=self.level)
+
+    def loads(self, raw: Union[str, bytes]) -> Any:
+        """Декодирует значение, записанное dumps() с любыми настройками или обычным JSON."""
+        if isinstance(raw, str):
+            raw = raw.encode("utf-8")
+        if not raw.startswith(MAGIC):
+            return self.loads_field(raw)
+
+        fmt, compression, data = raw[1:2], raw[2:3], raw[3:]
+        if compression == b"g":
+            data = gzip.decompress(data)
+        elif compression == b"s":
+            data = (self._zstd or self._import("zstandard")).ZstdDecompressor().decompress(data)
+
+        if fmt == b"m":
+            return (self._msgpack or self._import("msgpack")).unpackb(data, raw=False)
+        return self.loads_field(data)
+
+
+__all__ = ["Codec"]
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Optional
+
+
+def response_text(response: Optional[dict]) -> Optional[str]:
+    """Достаёт сырой текст событий Langflow из ответа задачи."""
+    if not isinstance(response, dict) or not isinstance(response.get("data"), dict):
+        return None
+    data = response["data"].get("data")
+    if not isinstance(data, dict):
+        return None
+    text = data.get("text")
+    return text if isinstance(text, str) else None
+
+
+def response_status_code(response: Optional[dict]) -> Optional[int]:
+    if not isinstance(response, dict) or not isinstance(response.get("data"), dict):
+        return None
+    return response["data"].get("status_code")
+
+
+def parse_event_text(text: Optional[str]) -> list[Any]:
+    """Разбирает текст событий Langflow (JSON-объекты, разделённые пустой строкой)."""
+    events: list[Any] = []
+    if not isinstance(text, str):
+        return events
+    for chunk in text.split("\n\n"):
+        chunk = chunk.strip()
+        if not chunk:
+            continue
+        try:
+            events.append(json.loads(chunk))
+        except json.JSONDecodeError:
+            events.append({"raw": chunk})
+    return events
+
+
+def event_type(event: Any) -> str:
+    """Тип события Langflow (поле event); для нераспознанных событий - "raw"."""
+    if isinstance(event, dict) and isinstance(event.get("event"), str):
+        return event["event"]
+    return "raw"
+
+
+__all__ = ["event_type", "parse_event_text", "response_status_code", "response_text"]
@@ -1,31 +1,206 @@
 from __future__ import annotations
 
 import os
+from typing import Any, Callable, Optional
 
-from redis import Redis
+from redis.asyncio import BlockingConnectionPool, Redis as AsyncRedis
 
-from .base import BaseQueueConnector
-from .redis_connector import create_redis_queue_connector, RedisQueueConnector
+from .async_redis_connector import AsyncRedisQueueConnector, create_async_redis_queue_connector
+from .archive import TaskArchive
+from .async_redis_streams_connector import create_async_redis_streams_queue_connector
+from .base import AsyncBaseQueueConnector
+from .cache import ResultCache
+from .codec import Codec
+from .limits import LangflowLimiter, Limit
+from .async_sqlite_connector import AsyncSqliteQueueConnector, create_async_sqlite_queue_connector
 
+# Значения QUEUE_BACKEND: очередь на списках Redis, на Redis Streams и во встроенной SQLite
+QUEUE_BACKENDS = {
+    "redis": "redis",
+    "redis-streams": "redis-streams",
+    "streams": "redis-streams",
+    "sqlite": "sqlite",
+}
 
-def init_queue_connector() -> BaseQueueConnector:
-    """Инициализирует коннектор очереди."""
-    return init_redis_queue_connector()
 
+def init_queue_connector() -> AsyncBaseQueueConnector:
+    """Инициализирует коннектор очереди по QUEUE_BACKEND."""
+    if _queue_backend() == "sqlite":
+        return init_sqlite_queue_connector()
+    return init_async_redis_queue_connector()
 
-def init_redis_queue_connector() -> RedisQueueConnector:
-    """Создаёт коннектор очереди на основе Redis."""
-    redis_url = os.getenv("REDIS_URL", "redis://redis:6379/0")
-    queue_name = os.getenv("QUEUE_NAME", "langflow.queue")
-    task_key_prefix = os.getenv("TASK_KEY_PREFIX", "task")
-    ttl_seconds = int(os.getenv("TASK_TTL_SECONDS", "86400"))
 
-    redis_conn = Redis.from_url(redis_url)
-    return create_redis_queue_connector(
-        redis_conn=redis_conn,
-        queue_name=queue_name,
-        task_key_prefix=task_key_prefix,
-        ttl_seconds=ttl_seconds,
+def _env_flag(name: str, default: bool = False) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def init_codec() -> Codec:
+    """Создаёт кодек хранения ответов задач и записей кэша."""
+    return Codec(
+        serializer=os.getenv("TASK_SERIALIZER", "json"),
+        compression=os.getenv("TASK_COMPRESSION", "gzip"),
+        threshold=int(os.getenv("TASK_COMPRESSION_THRESHOLD", "4096")),
+    )
+
+
+def _queue_backend() -> str:
+    backend = os.getenv("QUEUE_BACKEND", "redis").strip().lower()
+    if backend not in QUEUE_BACKENDS:
+        raise ValueError(f"Unknown QUEUE_BACKEND: {backend}")
+    return QUEUE_BACKENDS[backend]
+
+
+def _queue_settings() -> dict:
+    return {
+        "ttl_seconds": int(os.getenv("TASK_TTL_SECONDS", "86400")),
+        "reliable": _env_flag("QUEUE_RELIABLE"),
+        "visibility_timeout": int(os.getenv("QUEUE_VISIBILITY_TIMEOUT", "900")),
+        "worker_id": os.getenv("WORKER_ID") or None,
+        "dedup_ttl": int(os.getenv("QUEUE_DEDUP_TTL_SECONDS", "900")),
+        "lanes": _parse_number_map(os.getenv("QUEUE_LANES", "")) or None,
+        "codec": init_codec(),
+    }
+
+
+def _redis_settings() -> dict:
+    return {
+        "queue_name": os.getenv("QUEUE_NAME", "langflow.queue"),
+        "task_key_prefix": os.getenv("TASK_KEY_PREFIX", "task"),
+        **_queue_settings(),
+    }
+
+
+def _streams_settings() -> dict:
+    return {"batch_size": int(os.getenv("QUEUE_BATCH_SIZE", "10"))}
+
+
+def init_async_redis_queue_connector(redis_conn: Optional[AsyncRedis] = None) -> AsyncRedisQueueConnector:
+    """Создаёт асинхронный коннектор очереди с общим пулом соединений Redis.
+
+    Args:
+        redis_conn: Готовое подключение вместо создаваемого по REDIS_URL
+            (например, fakeredis в бенчмарке). Остальные настройки берутся из окружения.
+    """
+    backend = _queue_backend()
+    if redis_conn is None:
+        redis_url = os.getenv("REDIS_URL", "redis://redis:6379/0")
+        pool = BlockingConnectionPool.from_url(
+            redis_url,
+            max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "50")),
+            timeout=int(os.getenv("REDIS_POOL_TIMEOUT", "20")),
+        )
+        redis_conn = AsyncRedis(connection_pool=pool)
+    if backend == "redis-streams":
+        return create_async_redis_streams_queue_connector(
+            redis_conn=redis_conn, **_redis_settings(), **_streams_settings()
+        )
+    return create_async_redis_queue_connector(redis_conn=redis_conn, **_redis_settings())
+
+
+def init_sqlite_queue_connector() -> AsyncSqliteQueueConnector:
+    """Создаёт коннектор очереди на встроенной базе SQLite (QUEUE_SQLITE_PATH)."""
+    settings = {
+        "path": os.getenv("QUEUE_SQLITE_PATH", "langflow_queue.db"),
+        "poll_interval": float(os.getenv("QUEUE_SQLITE_POLL_INTERVAL", "0.05")),
+        **_queue_settings(),
+    }
+    return create_async_sqlite_queue_connector(**settings)
+
+
+def _parse_number_map(value: str, cast: Callable[[str], Any] = int) -> dict[str, Any]:
+    """Разбирает строку вида "a=600,b=0" в словарь с сохранением порядка ключей."""
+    result: dict[str, Any] = {}
+    for item in value.split(","):
+        name, _, number = item.strip().partition("=")
+        if name and number:
+            result[name] = cast(number)
+    return result
+
+
+def init_result_cache(redis_conn: Optional[AsyncRedis]) -> Optional[ResultCache]:
+    """Создаёт кэш результатов, если он включён через RESULT_CACHE_ENABLED.
+
+    Кэш хранится в Redis; с бэкендом очереди без Redis (redis_conn=None) он недоступен.
+    """
+    if not _env_flag("RESULT_CACHE_ENABLED"):
+        return None
+    if redis_conn is None:
+        raise ValueError("RESULT_CACHE_ENABLED requires a Redis queue backend")
+    task_key_prefix = os.getenv("TASK_KEY_PREFIX", "task").rstrip(":")
+    return ResultCache(
+        redis_conn,
+        key_prefix=f"{task_key_prefix}:cache",
+        ttl_seconds=int(os.getenv("RESULT_CACHE_TTL_SECONDS", "3600")),
+        flow_ttls=_parse_number_map(os.getenv("RESULT_CACHE_FLOW_TTLS", "")),
+        max_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", str(100 * 1024 * 1024))),
+        codec=init_codec(),
+    )
+
+
+def init_langflow_limiter(redis_conn: Optional[AsyncRedis]) -> Optional[LangflowLimiter]:
+    """Создаёт ограничитель нагрузки на Langflow, если задан хотя бы один лимит.
+
+    Лимиты общие для всех воркеров и хранятся в Redis; с бэкендом очереди без
+    Redis (redis_conn=None) они недоступны.
+    """
+    flow_concurrency = _parse_number_map(os.getenv("FLOW_CONCURRENCY_LIMITS", ""))
+    flow_rates = _parse_number_map(os.getenv("FLOW_RATE_LIMITS", ""), float)
+    default_flow_limit = Limit(
+        concurrency=int(os.getenv("FLOW_MAX_CONCURRENCY", "0")),
+        rate=float(os.getenv("FLOW_RATE_LIMIT", "0")),
+    )
+    flow_limits = {
+        flow_id: Limit(
+            concurrency=flow_concurrency.get(flow_id, default_flow_limit.concurrency),
+            rate=flow_rates.get(flow_id, default_flow_limit.rate),
+        )
+        for flow_id in (*flow_concurrency, *flow_rates)
+    }
+    burst = os.getenv("LANGFLOW_RATE_BURST")
+    endpoint_limit = Limit(
+        concurrency=int(os.getenv("LANGFLOW_MAX_CONCURRENCY", "0")),
+        rate=float(os.getenv("LANGFLOW_RATE_LIMIT", "0")),
+        burst=float(burst) if burst else None,
+    )
+    if endpoint_limit.unlimited and default_flow_limit.unlimited and not flow_limits:
+        return None
+    if redis_conn is None:
+        raise ValueError("Langflow limits require a Redis queue backend")
+
+    task_key_prefix = os.getenv("TASK_KEY_PREFIX", "task").rstrip(":")
+    return LangflowLimiter(
+        redis_conn,
+        key_prefix=f"{task_key_prefix}:limits",
+        endpoint_limit=endpoint_limit,
+        default_flow_limit=default_flow_limit,
+        flow_limits=flow_limits,
+        lease_seconds=int(os.getenv("QUEUE_VISIBILITY_TIMEOUT", "900")),
+        retry_delay=float(os.getenv("LIMITS_RETRY_DELAY", "1")),
     )
 
-__all__ = ["init_queue_connector", "init_redis_queue_connector"]
+
+def init_task_archive() -> Optional[TaskArchive]:
+    """Создаёт архив завершённых задач в каталоге ARCHIVE_DIR; без него архив отключён."""
+    directory = os.getenv("ARCHIVE_DIR")
+    if not directory:
+        return None
+    return TaskArchive(
+        directory,
+        compression=os.getenv("ARCHIVE_COMPRESSION", "gzip"),
+        level=int(os.getenv("ARCHIVE_COMPRESSION_LEVEL", "3")),
+        writer_id=os.getenv("WORKER_ID") or None,
+    )
+
+
+__all__ = [
+    "init_codec",
+    "init_langflow_limiter",
+    "init_queue_connector",
+    "init_result_cache",
+    "init_task_archive",
+    "init_async_redis_queue_connector",
+    "init_sqlite_queue_connector",
+]
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Mapping, Optional
+
+from redis.asyncio import Redis as AsyncRedis
+
+from .scripts import ACQUIRE_LIMITS
+
+
+@dataclass(frozen=True)
+class Limit:
+    """Ограничения одной области. 0 отключает соответствующее ограничение.
+
+    concurrency - сколько задач области могут выполняться одновременно,
+    rate - сколько задач в секунду можно запускать в среднем,
+    burst - сколько задач можно запустить подряд сверх средней скорости
+    (по умолчанию max(1, rate)).
+    """
+
+    concurrency: int = 0
+    rate: float = 0.0
+    burst: Optional[float] = None
+
+    @property
+    def unlimited(self) -> bool:
+        return self.concurrency <= 0 and self.rate <= 0
+
+    def args(self) -> list[float]:
+        burst = self.burst if self.burst is not None else max(1.0, self.rate)
+        return [max(self.concurrency, 0), max(self.rate, 0.0), burst]
+
+
+class LangflowLimiter:
+    """Общие для всех воркеров ограничения нагрузки на Langflow.
+
+    Ограничения действуют в двух областях: endpoint Langflow целиком и
+    отдельный flow. В каждой области можно задать лимит одновременно
+    выполняемых задач (слоты с арендой, которая истекает сама, если воркер
+    упал) и скорость запуска (корзина токенов). Состояние хранится в Redis,
+    поэтому лимиты соблюдаются суммарно по всем процессам воркеров.
+    """
+
+    def __init__(
+        self,
+        redis_conn: AsyncRedis,
+        *,
+        key_prefix: str = "task:limits",
+        endpoint_limit: Limit = Limit(),
+        default_flow_limit: Limit = Limit(),
+        flow_limits: Optional[Mapping[str, Limit]] = None,
+        lease_seconds: int = 15 * 60,
+        retry_delay: float = 1.0,
+    ) -> None:
+        self.redis = redis_conn
+        self.key_prefix = key_prefix.rstrip(":")
+        self.endpoint_limit = endpoint_limit
+        self.default_flow_limit = default_flow_limit
+        self.flow_limits = dict(flow_limits or {})
+        self.lease_seconds = lease_seconds
+        self.retry_delay = retry_delay
+        self._acquire = redis_conn.register_script(ACQUIRE_LIMITS)
+
+    def limit_for_flow(self, flow_id: str) -> Limit:
+        return self.flow_limits.get(flow_id, self.default_flow_limit)
+
+    def _scopes(self, task_record: dict, endpoint: str) -> list[tuple[str, Limit]]:
+        scopes = [(f"{self.key_prefix}:endpoint:{endpoint}", self.endpoint_limit)]
+        flow_id = task_record.get("flow_id")
+        if flow_id:
+            scopes.append((f"{self.key_prefix}:flow:{flow_id}", self.limit_for_flow(flow_id)))
+        return [(key, limit) for key, limit in scopes if not limit.unlimited]
+
+    async def acquire(self, task_record: dict, endpoint: str) -> float:
+        """Пытается занять слоты и токены задачи во всех её областях.
+
+        Returns:
+            0, если задачу можно выполнять, иначе через сколько секунд стоит
+            повторить попытку. Занятые слоты нужно вернуть через release().
+        """
+        scopes = self._scopes(task_record, endpoint)
+        if not scopes:
+            return 0.0
+        keys: list[str] = []
+        args: list[object] = [task_record["task_id"], self.lease_seconds, self.retry_delay]
+        for key, limit in scopes:
+            keys.extend((f"{key}:slots", f"{key}:bucket"))
+            args.extend(limit.args())
+        wait = await self._acquire(keys=keys, args=args)
+        return float(wait.decode() if isinstance(wait, bytes) else wait)
+
+    async def release(self, task_record: dict, endpoint: str) -> None:
+        """Освобождает слоты, занятые задачей."""
+        scopes = [key for key, limit in self._scopes(task_record, endpoint) if limit.concurrency > 0]
+        if not scopes:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key in scopes:
+                pipe.zrem(f"{key}:slots", task_record["task_id"])
+            await pipe.execute()
+
+
+__all__ = ["LangflowLimiter", "Limit"]
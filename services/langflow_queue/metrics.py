@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Задачи Langflow (LLM) выполняются от долей секунды до нескольких минут
+TASK_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+REDIS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+QUEUE_DEPTH = Gauge(
+    "langflow_queue_depth",
+    "Число задач в очереди по дорожкам приоритета",
+    ["lane"],
+)
+TASKS_ENQUEUED = Counter(
+    "langflow_queue_enqueued_total",
+    "Задачи, поставленные в очередь",
+    ["lane"],
+)
+TASKS_FINISHED = Counter(
+    "langflow_queue_tasks_total",
+    "Задачи, обработанные воркером, по итоговому статусу",
+    ["status"],
+)
+TASKS_RETRIED = Counter(
+    "langflow_queue_task_retries_total",
+    "Повторные попытки задач после временных ошибок Langflow, по причине (код ответа или тип ошибки)",
+    ["reason"],
+)
+TASKS_ARCHIVED = Counter(
+    "langflow_queue_archived_total",
+    "Завершённые задачи, перенесённые из бэкенда очереди в архив",
+)
+SYNC_WAITS = Counter(
+    "langflow_queue_sync_waits_total",
+    "Запуски flow с sync_timeout по исходу ожидания: completed - результат отдан сразу, timeout - время вышло, skipped - очередь была слишком длинной",
+    ["result"],
+)
+QUEUE_WAIT = Histogram(
+    "langflow_queue_wait_seconds",
+    "Время от создания задачи до её извлечения воркером",
+    buckets=TASK_BUCKETS,
+)
+LANGFLOW_CALL = Histogram(
+    "langflow_call_duration_seconds",
+    "Длительность запросов к Langflow",
+    ["mode"],
+    buckets=TASK_BUCKETS,
+)
+TASK_DURATION = Histogram(
+    "langflow_queue_task_duration_seconds",
+    "Время от создания задачи до её завершения",
+    ["status"],
+    buckets=TASK_BUCKETS,
+)
+REDIS_OP = Histogram(
+    "langflow_queue_redis_op_seconds",
+    "Длительность операций с бэкендом очереди",
+    ["op"],
+    buckets=REDIS_BUCKETS,
+)
+WORKER_CONCURRENCY_LIMIT = Gauge(
+    "langflow_worker_concurrency_limit",
+    "Текущий лимит одновременно выполняемых задач воркера",
+)
+WORKER_IN_FLIGHT = Gauge(
+    "langflow_worker_tasks_in_flight",
+    "Число задач, выполняемых воркером",
+)
+LANGFLOW_BACKEND_IN_FLIGHT = Gauge(
+    "langflow_backend_requests_in_flight",
+    "Число запросов воркера, выполняемых экземпляром Langflow",
+    ["backend"],
+)
+LANGFLOW_BACKEND_HEALTHY = Gauge(
+    "langflow_backend_healthy",
+    "Находится ли экземпляр Langflow в ротации воркера (1 - да, 0 - исключён проверкой здоровья)",
+    ["backend"],
+)
+
+
+@contextmanager
+def observe_redis(op: str) -> Iterator[None]:
+    """Измеряет длительность операции с бэкендом очереди."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        REDIS_OP.labels(op).observe(time.perf_counter() - started)
+
+
+def seconds_between(start: Optional[str], end: Optional[str]) -> Optional[float]:
+    """Интервал между двумя метками времени записи задачи в формате ISO 8601."""
+    if not start or not end:
+        return None
+    try:
+        return (datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds()
+    except (TypeError, ValueError):
+        return None
+
+
+__all__ = [
+    "LANGFLOW_BACKEND_HEALTHY",
+    "LANGFLOW_BACKEND_IN_FLIGHT",
+    "LANGFLOW_CALL",
+    "QUEUE_DEPTH",
+    "QUEUE_WAIT",
+    "REDIS_OP",
+    "SYNC_WAITS",
+    "TASKS_ARCHIVED",
+    "TASKS_ENQUEUED",
+    "TASKS_FINISHED",
+    "TASKS_RETRIED",
+    "TASK_DURATION",
+    "WORKER_CONCURRENCY_LIMIT",
+    "WORKER_IN_FLIGHT",
+    "observe_redis",
+    "seconds_between",
+]
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from redis.asyncio import Redis as AsyncRedis
+
+logger = logging.getLogger(__name__)
+
+
+class TaskStatusListener:
+    """Мультиплексирует ожидание смены статуса задач поверх одной подписки pub/sub.
+
+    Подписка на канал статусов открывается при первом ожидании и живёт до close().
+    Каждый ожидающий получает asyncio.Event, который взводится при уведомлении
+    о его задаче; сами уведомления не содержат записи, её перечитывает ожидающий.
+    """
+
+    # Пауза перед повторной подпиской после потери соединения, в секундах
+    reconnect_delay = 1.0
+
+    def __init__(self, redis_conn: AsyncRedis, channel: str) -> None:
+        self.redis = redis_conn
+        self.channel = channel
+        self._waiters: dict[str, set[asyncio.Event]] = {}
+        self._listener: Optional[asyncio.Task] = None
+        self._subscribed = asyncio.Event()
+
+    async def _ensure_started(self) -> None:
+        if self._listener is None or self._listener.done():
+            self._subscribed.clear()
+            self._listener = asyncio.create_task(self._listen())
+        await self._subscribed.wait()
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                self._subscribed.set()
+                # Уведомления, пришедшие до переподписки, могли быть потеряны
+                self._wake_all()
+                async for message in pubsub.listen():
+                    self._dispatch(message.get("data"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Task status subscription lost: {e}")
+                await asyncio.sleep(self.reconnect_delay)
+            finally:
+                await pubsub.aclose()
+
+    def _dispatch(self, data: object) -> None:
+        try:
+            task_id = json.loads(data)["task_id"]
+        except (TypeError, ValueError, KeyError):
+            return
+        for event in self._waiters.get(task_id, ()):
+            event.set()
+
+    def _wake_all(self) -> None:
+        for events in self._waiters.values():
+            for event in events:
+                event.set()
+
+    @asynccontextmanager
+    async def watch(self, task_id: str) -> AsyncIterator[asyncio.Event]:
+        """Регистрирует ожидающего задачи на время контекста.
+
+        Регистрация происходит до выхода из __aenter__, поэтому запись задачи,
+        прочитанная внутри контекста, не может пропустить уведомление.
+        """
+        await self._ensure_started()
+        event = asyncio.Event()
+        self._waiters.setdefault(task_id, set()).add(event)
+        try:
+            yield event
+        finally:
+            waiters = self._waiters.get(task_id)
+            if waiters is not None:
+                waiters.discard(event)
+                if not waiters:
+                    del self._waiters[task_id]
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+
+__all__ = ["TaskStatusListener"]
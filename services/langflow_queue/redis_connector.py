@@ -1,124 +1,570 @@
 from __future__ import annotations
 
 import json
-from typing import Any, Iterable, Optional
+import socket
+import time
+from datetime import datetime, timezone
+from typing import Any, Collection, Mapping, Optional
 
-from redis import Redis
+from .base import TERMINAL_STATUSES
+from .codec import Codec
+from .events import event_type, response_status_code
 
-from .base import BaseQueueConnector
 
+class RedisQueueBase:
+    """Общая схема ключей и формат хранения коннекторов очереди на Redis.
 
-class RedisQueueConnector(BaseQueueConnector):
-    """Коннектор очереди на основе хранилища Redis."""
+    Каждая задача хранится в отдельном хэше: поле на каждый ключ верхнего уровня
+    записи, значение закодировано в JSON. Благодаря этому статус и метки времени
+    обновляются независимо, без перезаписи всей записи. Ответ Langflow, который
+    может занимать сотни килобайт, хранится отдельным ключом в формате кодека
+    (codec) и читается только тогда, когда он нужен (include_response=True).
+
+    Помимо самих записей поддерживаются вторичные индексы (ZSET, score = время
+    создания): общий, по статусу и по flow_id. Они обновляются при каждой записи
+    и позволяют листать задачи страницами, не сканируя всё пространство ключей.
+
+    Очередь разделена на дорожки приоритета (lanes: имя -> вес), дорожка задачи
+    берётся из поля priority записи. Извлечение выбирает дорожку взвешенным
+    round-robin, так что дорожка с весом 10 получает в 10 раз больше задач, чем
+    дорожка с весом 1, но и она не простаивает. Внутри дорожки задачи разложены
+    по спискам flow, которые обслуживаются по кругу: тяжёлый flow не может занять
+    все воркеры, а внутри одного flow сохраняется порядок FIFO.
+
+    В надёжном режиме (reliable=True) извлечённая задача атомарно переносится
+    в список обработки воркера и регистрируется с дедлайном видимости. После
+    ack() она удаляется оттуда, а задачи с истёкшим дедлайном reap_expired()
+    возвращает в голову списка их flow.
+
+    Задачу, которую пока нельзя выполнять, defer() откладывает в ZSET отложенных
+    задач, откуда promote_delayed() возвращает её в очередь в назначенное время.
+
+    При постановке с dedup_key одинаковые запросы объединяются: пока ведущая
+    задача не завершена, новые задачи с тем же ключом не попадают в очередь,
+    а ждут её результата (release_dedup() возвращает их для раздачи результата).
+    Если ведущую задачу отменили или истёк её дедлайн, hand_over_dedup() делает
+    ведущей одну из ещё не завершённых ведомых задач.
+
+    Каждая смена статуса публикуется в канал статусов (pub/sub), что позволяет
+    ждать завершения задачи без опроса.
+
+    События выполнения задачи в потоковом режиме пишутся в отдельный Redis
+    Stream задачи, откуда их можно читать по мере поступления. После
+    завершения задачи её события один раз разбираются и сохраняются списком
+    (task:<id>:parsed), из которого их читают постранично.
+    """
+
+    # Во сколько раз больше элементов, чем размер страницы, можно просмотреть
+    # при фильтрации по двум индексам за один запрос.
+    list_scan_factor = 10
+
+    # Примерная максимальная длина потока событий одной задачи
+    events_maxlen = 10_000
+
+    # Сколько разобранных событий записывать одной командой RPUSH
+    parsed_events_chunk = 500
+
+    # Через сколько секунд без обновления статистика воркера считается устаревшей
+    worker_stats_ttl = 60
+
+    # Дорожки приоритета и их веса по умолчанию; первая - дорожка по умолчанию
+    default_lanes = {"interactive": 10, "batch": 1}
 
     def __init__(
         self,
         *,
-        redis_conn: Redis,
         queue_name: str = "langflow.queue",
         task_key_prefix: str = "task",
         ttl_seconds: int = 60 * 60 * 24,
+        reliable: bool = False,
+        visibility_timeout: int = 15 * 60,
+        worker_id: Optional[str] = None,
+        dedup_ttl: int = 15 * 60,
+        lanes: Optional[Mapping[str, int]] = None,
+        codec: Optional[Codec] = None,
     ) -> None:
-        self.redis = redis_conn
         self.queue_name = queue_name
         self.task_key_prefix = task_key_prefix.rstrip(":")
         self.ttl_seconds = ttl_seconds
+        self.reliable = reliable
+        self.visibility_timeout = visibility_timeout
+        # Должен быть стабильным между перезапусками воркера, иначе
+        # recover_processing() не найдёт задачи, оставшиеся от прошлого запуска
+        self.worker_id = worker_id or socket.gethostname()
+        self.dedup_ttl = dedup_ttl
+        self.lanes = dict(lanes or self.default_lanes)
+        if any(weight < 1 for weight in self.lanes.values()):
+            raise ValueError("Lane weights must be positive integers")
+        self.default_lane = next(iter(self.lanes))
+        self.codec = codec or Codec()
 
     def _key(self, task_id: str) -> str:
         return f"{self.task_key_prefix}:{task_id}"
 
-    def _store(self, task_record: dict) -> None:
-        task_id = task_record["task_id"]
-        self.redis.setex(
+    def _response_key(self, task_id: str) -> str:
+        return f"{self._key(task_id)}:response"
+
+    def _processing_prefix(self) -> str:
+        return f"{self.queue_name}:processing:"
+
+    def _processing_key(self) -> str:
+        return f"{self._processing_prefix()}{self.worker_id}"
+
+    def _inflight_key(self) -> str:
+        return f"{self.queue_name}:inflight"
+
+    def _owners_key(self) -> str:
+        return f"{self.queue_name}:owners"
+
+    def _ready_key(self) -> str:
+        return f"{self.queue_name}:ready"
+
+    def _depth_key(self) -> str:
+        return f"{self.queue_name}:depth"
+
+    def _delayed_key(self) -> str:
+        return f"{self.queue_name}:delayed"
+
+    def _dead_key(self) -> str:
+        return f"{self.queue_name}:dead"
+
+    def _workers_key(self) -> str:
+        return f"{self.queue_name}:workers"
+
+    def _lane_weights_key(self) -> str:
+        return f"{self.queue_name}:lane_weights"
+
+    def _lanes_arg(self) -> str:
+        return json.dumps(list(self.lanes))
+
+    def _assign_lane(self, task_record: dict) -> list[str]:
+        """Проставляет дорожку задачи по умолчанию и возвращает аргументы постановки в неё."""
+        lane = task_record.get("priority") or self.default_lane
+        if lane not in self.lanes:
+            raise ValueError(f"Unknown priority: {lane}")
+        task_record["priority"] = lane
+        return [self.queue_name, lane, task_record.get("flow_id") or ""]
+
+    def _prepare_enqueue(self, task_record: dict, dedup_key: Optional[str]) -> list[str]:
+        """Дополняет запись перед постановкой в очередь и возвращает аргументы постановки в дорожку."""
+        task_record.setdefault("status", "pending")
+        lane_args = self._assign_lane(task_record)
+        if dedup_key:
+            task_record["dedup_key"] = dedup_key
+        return lane_args
+
+    @staticmethod
+    def _batch_dedup_keys(task_records: list[dict], dedup_keys: Optional[list[Optional[str]]]) -> list[Optional[str]]:
+        if dedup_keys is None:
+            return [None] * len(task_records)
+        if len(dedup_keys) != len(task_records):
+            raise ValueError("dedup_keys must have one entry per task record")
+        return list(dedup_keys)
+
+    def _set_leaders(self, task_records: list[dict], dedup_keys: list[Optional[str]], results: list[Any]) -> None:
+        """Проставляет leader_task_id задачам, объединённым с уже поставленными."""
+        for task_record, dedup_key, leader_task_id in zip(task_records, dedup_keys, results):
+            if dedup_key and leader_task_id:
+                task_record["leader_task_id"] = self._decode(leader_task_id)
+
+    def _dequeue_args(self) -> tuple[list[str], list[Any]]:
+        keys = [
+            self.queue_name,
+            self._lane_weights_key(),
+            self._processing_key(),
+            self._inflight_key(),
+            self._owners_key(),
+        ]
+        args: list[Any] = [
+            self.queue_name,
+            int(self.reliable),
+            time.time() + self.visibility_timeout,
+            self.worker_id,
+        ]
+        for lane, weight in self.lanes.items():
+            args.extend((lane, weight))
+        return keys, args
+
+    def _worker_stats_value(self, stats: dict) -> str:
+        return json.dumps({**stats, "updated_at": time.time()}, ensure_ascii=False)
+
+    def _worker_stats(self, raw: dict) -> tuple[dict[str, dict], list[str]]:
+        """Разбирает хэш статистики воркеров, отделяя давно не обновлявшиеся записи."""
+        stats: dict[str, dict] = {}
+        stale: list[str] = []
+        cutoff = time.time() - self.worker_stats_ttl
+        for worker_id, value in raw.items():
+            worker_id = self._decode(worker_id)
+            try:
+                entry = json.loads(value)
+            except json.JSONDecodeError:
+                entry = {}
+            if entry.get("updated_at", 0) < cutoff:
+                stale.append(worker_id)
+            else:
+                stats[worker_id] = entry
+        return stats, stale
+
+    def _queue_depths(self, raw: dict) -> dict[str, int]:
+        depths = {self._decode(lane): int(depth) for lane, depth in raw.items()}
+        return {lane: depths.get(lane, 0) for lane in self.lanes}
+
+    def _add_ack_writes(self, pipe: Any, task_id: str) -> None:
+        pipe.lrem(self._processing_key(), 1, task_id)
+        pipe.zrem(self._inflight_key(), task_id)
+        pipe.hdel(self._owners_key(), task_id)
+
+    def _add_dead_letter_writes(self, pipe: Any, task_id: str) -> None:
+        now = time.time()
+        pipe.zadd(self._dead_key(), {task_id: now})
+        # Записи старше TTL уже удалены из Redis
+        pipe.zremrangebyscore(self._dead_key(), "-inf", now - self.ttl_seconds)
+        pipe.expire(self._dead_key(), self.ttl_seconds)
+
+    def _add_archivable_reads(
+        self, pipe: Any, statuses: Collection[str], cutoff: float, offset: int, limit: int
+    ) -> None:
+        for status in statuses:
+            pipe.zrangebyscore(self._status_index(status), "-inf", cutoff, start=offset, num=limit, withscores=True)
+
+    def _archivable_candidates(self, results: list[Any]) -> list[str]:
+        """Объединяет id задач из индексов статусов, старые первыми."""
+        scored = sorted((score, self._decode(task_id)) for result in results for task_id, score in result)
+        return list(dict.fromkeys(task_id for _, task_id in scored))
+
+    def _finished_before(self, raw_finished_at: Any, cutoff: float) -> bool:
+        """Завершилась ли задача раньше cutoff.
+
+        Задача без finished_at ещё не завершена окончательно: например, отменённую
+        через API воркер ещё может прерывать, и отметит её завершение сам.
+        """
+        if raw_finished_at is None:
+            return False
+        try:
+            return datetime.fromisoformat(self.codec.loads_field(raw_finished_at)).timestamp() <= cutoff
+        except (TypeError, ValueError):
+            return False
+
+    def _delete_task_args(self, task_id: str, statuses: Collection[str]) -> tuple[list[str], list[Any]]:
+        keys = [
             self._key(task_id),
+            self._response_key(task_id),
+            self._events_key(task_id),
+            self._parsed_events_key(task_id),
+            self._parsed_types_key(task_id),
+            self._dead_key(),
+        ]
+        return keys, [self._index_key(), task_id, *statuses]
+
+    @staticmethod
+    def _replay_fields() -> dict:
+        """Поля записи, сбрасываемые при повторном запуске задачи из очереди недоставленных."""
+        return {
+            "status": "pending",
+            "attempts": 0,
+            "error": None,
+            "deadline": None,
+            "retry_at": None,
+            "events_summary": None,
+            "replayed_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+    def _requeue_expired_args(self, limit: int) -> tuple[list[str], list[Any]]:
+        keys = [self._inflight_key(), self._owners_key()]
+        args = [
+            time.time(),
+            self._processing_prefix(),
+            limit,
+            self.queue_name,
+            self.task_key_prefix,
+            self._lanes_arg(),
+        ]
+        return keys, args
+
+    def _promote_delayed_args(self, limit: int) -> tuple[list[str], list[Any]]:
+        keys = [self._delayed_key()]
+        return keys, [time.time(), limit, self.queue_name, self.task_key_prefix, self._lanes_arg()]
+
+    def _recover_processing_args(self) -> tuple[list[str], list[Any]]:
+        keys = [self._processing_key(), self._inflight_key(), self._owners_key()]
+        return keys, [self.queue_name, self.task_key_prefix, self._lanes_arg()]
+
+    def _dedup_key(self, dedup_key: str) -> str:
+        return f"{self.task_key_prefix}:inflight:{dedup_key}"
+
+    def _followers_prefix(self) -> str:
+        return f"{self.task_key_prefix}:followers:"
+
+    def _enqueue_dedup_args(self, task_record: dict, lane_args: list[str]) -> tuple[list[str], list[Any]]:
+        task_id = task_record["task_id"]
+        keys = [self._dedup_key(task_record["dedup_key"]), self._key(task_id)]
+        return keys, [task_id, self.dedup_ttl, self._followers_prefix(), *lane_args]
+
+    def _release_dedup_keys(self, dedup_key: str, task_id: str) -> list[str]:
+        return [self._dedup_key(dedup_key), f"{self._followers_prefix()}{task_id}"]
+
+    def _hand_over_dedup_args(self, task_id: str) -> list[Any]:
+        return [
+            task_id,
+            self.dedup_ttl,
+            self._followers_prefix(),
+            self.queue_name,
+            self.task_key_prefix,
+            self._lanes_arg(),
+            json.dumps(sorted(TERMINAL_STATUSES)),
+        ]
+
+    def _status_channel(self) -> str:
+        return f"{self.task_key_prefix}:status"
+
+    def _index_key(self, *parts: str) -> str:
+        return ":".join((self.task_key_prefix, "index", *parts))
+
+    def _created_index(self) -> str:
+        return self._index_key("created")
+
+    def _status_index(self, status: str) -> str:
+        return self._index_key("status", status)
+
+    def _flow_index(self, flow_id: str) -> str:
+        return self._index_key("flow", flow_id)
+
+    @staticmethod
+    def _created_score(task_record: dict) -> float:
+        created_at = (task_record.get("request") or {}).get("created_at")
+        try:
+            return datetime.fromisoformat(created_at).timestamp()
+        except (TypeError, ValueError):
+            return time.time()
+
+    def _add_store_writes(self, pipe: Any, task_record: dict) -> None:
+        """Добавляет в pipeline сохранение новой записи задачи и её индексов."""
+        task_id = task_record["task_id"]
+        status = task_record.get("status") or "pending"
+        score = self._created_score(task_record)
+
+        fields = self._add_response_writes(pipe, task_id, task_record)
+        pipe.hset(self._key(task_id), mapping=self._encode_fields(fields))
+        pipe.expire(self._key(task_id), self.ttl_seconds)
+
+        keys = [self._created_index(), self._status_index(status)]
+        if task_record.get("flow_id"):
+            keys.append(self._flow_index(task_record["flow_id"]))
+
+        # Записи старше TTL уже удалены из Redis, поэтому их вычищаем из индексов
+        cutoff = time.time() - self.ttl_seconds
+        for key in keys:
+            pipe.zadd(key, {task_id: score})
+            pipe.zremrangebyscore(key, "-inf", cutoff)
+            pipe.expire(key, self.ttl_seconds)
+
+    def _list_page_args(
+        self,
+        *,
+        status: Optional[str],
+        flow_id: Optional[str],
+        cursor: Optional[str],
+        limit: int,
+    ) -> tuple[list[str], list[Any]]:
+        if flow_id:
+            keys = [self._flow_index(flow_id)]
+            if status:
+                keys.append(self._status_index(status))
+        elif status:
+            keys = [self._status_index(status)]
+        else:
+            keys = [self._created_index()]
+
+        cursor_score, cursor_skip = "+inf", 0
+        if cursor:
+            try:
+                cursor_score, raw_skip = cursor.rsplit(":", 1)
+                float(cursor_score)
+                cursor_skip = int(raw_skip)
+            except ValueError:
+                raise ValueError(f"Invalid cursor: {cursor}") from None
+        return keys, [cursor_score, cursor_skip, limit, limit * self.list_scan_factor]
+
+    def _list_page_result(self, result: list[Any]) -> tuple[list[str], Optional[str]]:
+        raw_ids, cursor_score, cursor_skip, exhausted = result
+        task_ids = [self._decode(task_id) for task_id in raw_ids]
+        if exhausted:
+            return task_ids, None
+        return task_ids, f"{self._decode(cursor_score)}:{cursor_skip}"
+
+    def _add_response_writes(self, pipe: Any, task_id: str, values: dict) -> dict:
+        """Добавляет в pipeline запись ответа задачи отдельным ключом.
+
+        Возвращает остальные поля, которые хранятся в хэше задачи.
+        """
+        if "response" not in values:
+            return values
+        fields = dict(values)
+        response = fields.pop("response")
+        if response is None:
+            pipe.delete(self._response_key(task_id))
+        else:
+            pipe.set(self._response_key(task_id), self.codec.dumps(response), ex=self.ttl_seconds)
+        return fields
+
+    def _add_load_reads(self, pipe: Any, task_id: str, include_response: bool) -> None:
+        pipe.hgetall(self._key(task_id))
+        if include_response:
+            pipe.get(self._response_key(task_id))
+
+    def _load_results(self, results: list[Any], include_response: bool) -> list[Optional[dict]]:
+        """Собирает записи задач из результатов чтений, добавленных _add_load_reads()."""
+        step = 2 if include_response else 1
+        records = []
+        for i in range(0, len(results), step):
+            record = self._decode_fields(results[i])
+            if record is not None and include_response:
+                raw_response = results[i + 1]
+                if raw_response is not None:
+                    record["response"] = self.codec.loads(raw_response)
+                else:
+                    # Записи, сохранённые до выноса ответа, хранят его в хэше
+                    record.setdefault("response", None)
+            elif record is not None:
+                record.pop("response", None)
+            records.append(record)
+        return records
+
+    def _update_args(self, task_id: str, updates: dict, unless_status: Collection[str] = ()) -> list[Any]:
+        """Аргументы UPDATE_TASK; ответ из updates записывается самим скриптом."""
+        fields = dict(updates)
+        response_action, response = "", ""
+        if "response" in fields:
+            value = fields.pop("response")
+            response_action, response = ("del", "") if value is None else ("set", self.codec.dumps(value))
+        args: list[Any] = [
             self.ttl_seconds,
-            json.dumps(task_record, ensure_ascii=False),
-        )
+            self._index_key(),
+            task_id,
+            time.time(),
+            self._status_channel(),
+            json.dumps(list(unless_status)),
+            response_action,
+            response,
+        ]
+        for field, value in self._encode_fields(fields).items():
+            args.extend((field, value))
+        return args
+
+    def _encode_fields(self, values: dict) -> dict[str, Any]:
+        return {field: self.codec.dumps_field(value) for field, value in values.items()}
 
-    def _load(self, task_id: str) -> Optional[dict]:
-        raw = self.redis.get(self._key(task_id))
+    def _decode_fields(self, raw: Optional[dict]) -> Optional[dict]:
         if not raw:
             return None
-        try:
-            return json.loads(raw)
-        except json.JSONDecodeError:
-            return None
+        record: dict[str, Any] = {}
+        for field, value in raw.items():
+            try:
+                record[self._decode(field)] = self.codec.loads_field(value)
+            except ValueError:
+                continue
+        return record
+
+    @staticmethod
+    def _decode(value: Any) -> str:
+        return value.decode() if isinstance(value, bytes) else value
 
-    def _scan_keys(self) -> Iterable[str]:
-        pattern = f"{self.task_key_prefix}:*"
-        return self.redis.scan_iter(match=pattern)
+    def _events_key(self, task_id: str) -> str:
+        return f"{self._key(task_id)}:events"
 
-    def enqueue(self, task_record: dict) -> str:
-        """Сохраняет запись задачи в Redis и добавляет в очередь."""
+    def _add_event_writes(self, pipe: Any, task_id: str, fields: dict[str, str]) -> None:
+        key = self._events_key(task_id)
+        pipe.xadd(key, fields, maxlen=self.events_maxlen, approximate=True)
+        pipe.expire(key, self.ttl_seconds)
+
+    def _add_replay_writes(self, pipe: Any, task_record: dict, events: list) -> None:
         task_id = task_record["task_id"]
-        self._store(task_record)
-        self.redis.lpush(self.queue_name, task_id)
-        return task_id
-
-    def get_task(self, task_id: str) -> Optional[dict]:
-        return self._load(task_id)
-
-    def list_tasks(self) -> list[dict]:
-        records: list[dict] = []
-        for key in self._scan_keys():
-            raw = self.redis.get(key)
-            if not raw:
-                continue
+        for event in events:
+            self._add_event_writes(pipe, task_id, {"event": json.dumps(event, ensure_ascii=False)})
+        self._add_event_writes(pipe, task_id, {"end": task_record.get("status") or "completed"})
+
+    def _parsed_events_key(self, task_id: str) -> str:
+        return f"{self._key(task_id)}:parsed"
+
+    def _parsed_types_key(self, task_id: str) -> str:
+        return f"{self._key(task_id)}:parsed:types"
+
+    def _add_parsed_event_writes(
+        self,
+        pipe: Any,
+        task_id: str,
+        events: list,
+        status_code: Optional[int] = None,
+    ) -> dict:
+        """Добавляет в pipeline сохранение разобранных событий задачи.
+
+        События хранятся списком в порядке выполнения, рядом - список их типов
+        для фильтрации. Returns: сводка для поля events_summary записи задачи.
+        """
+        key, types_key = self._parsed_events_key(task_id), self._parsed_types_key(task_id)
+        pipe.delete(key, types_key)
+        types = [event_type(event) for event in events]
+        for start in range(0, len(events), self.parsed_events_chunk):
+            chunk = events[start:start + self.parsed_events_chunk]
+            pipe.rpush(key, *(json.dumps(event, ensure_ascii=False) for event in chunk))
+            pipe.rpush(types_key, *types[start:start + self.parsed_events_chunk])
+        pipe.expire(key, self.ttl_seconds)
+        pipe.expire(types_key, self.ttl_seconds)
+
+        counts: dict[str, int] = {}
+        for name in types:
+            counts[name] = counts.get(name, 0) + 1
+        return {"count": len(events), "types": counts, "status_code": status_code}
+
+    def _page_events_args(
+        self,
+        task_id: str,
+        offset: int,
+        limit: Optional[int],
+        types: Optional[list[str]],
+    ) -> tuple[list[str], list[Any]]:
+        keys = [self._parsed_events_key(task_id), self._parsed_types_key(task_id)]
+        return keys, [max(offset, 0), -1 if limit is None else max(limit, 0), *(types or [])]
+
+    @classmethod
+    def _page_events_result(cls, raw: Any) -> tuple[list, int]:
+        total, page = raw
+        events = []
+        for value in page:
             try:
-                records.append(json.loads(raw))
+                events.append(json.loads(value))
             except json.JSONDecodeError:
-                continue
-        records.sort(key=lambda item: item.get("created_at", ""), reverse=True)
-        return records
+                events.append({"raw": cls._decode(value)})
+        return events, int(total)
+
+    def _stored_task_record(self, pipe: Any, task_record: dict, events: list) -> dict:
+        """Добавляет в pipeline разобранные события готовой задачи и их сводку в запись."""
+        summary = self._add_parsed_event_writes(
+            pipe, task_record["task_id"], events, response_status_code(task_record.get("response"))
+        )
+        return {**task_record, "events_summary": summary}
 
-    def update_task(self, task_id: str, updates: dict) -> None:
-        existing = self._load(task_id)
-        if not existing:
-            return
-        existing.update(updates)
-        self._store(existing)
-
-    def dequeue(self, timeout: int = 0) -> Optional[dict]:
-        """Извлекает задачу из очереди. Возвращает None, если очередь пуста.
-        
-        Args:
-            timeout: Таймаут блокировки в секундах. 0 означает неблокирующий режим.
-                    Если > 0, использует BLPOP (блокирующее извлечение).
+    @classmethod
+    def _decode_event_entries(cls, response: Any) -> list[tuple[str, dict]]:
+        """Преобразует ответ XREAD в список (id, событие).
+
+        Обычное событие возвращается как {"event": ...}, маркер конца потока -
+        как {"end": <итоговый статус задачи>}.
         """
-        if timeout > 0:
-            result = self.redis.blpop(self.queue_name, timeout=timeout)
-            if result is None:
-                return None
-            task_id = result[1].decode() if isinstance(result[1], bytes) else result[1]
-        else:
-            task_id = self.redis.rpop(self.queue_name)
-            if task_id is None:
-                return None
-            if isinstance(task_id, bytes):
-                task_id = task_id.decode()
-        
-        # Получаем полную запись задачи по task_id
-        return self._load(task_id)
-
-    def ping(self) -> None:
-        """Проверяет подключение к Redis."""
-        self.redis.ping()
-
-
-def create_redis_queue_connector(
-    redis_conn: Redis,
-    *,
-    queue_name: str = "langflow.queue",
-    task_key_prefix: str = "task",
-    ttl_seconds: int = 60 * 60 * 24,
-) -> RedisQueueConnector:
-    return RedisQueueConnector(
-        redis_conn=redis_conn,
-        queue_name=queue_name,
-        task_key_prefix=task_key_prefix,
-        ttl_seconds=ttl_seconds,
-    )
-
-
-__all__ = ["RedisQueueConnector", "create_redis_queue_connector"]
+        entries: list[tuple[str, dict]] = []
+        streams = response.items() if isinstance(response, dict) else (response or [])
+        for _, stream_entries in streams:
+            for entry_id, fields in stream_entries:
+                fields = {cls._decode(key): cls._decode(value) for key, value in fields.items()}
+                if "end" in fields:
+                    entries.append((cls._decode(entry_id), {"end": fields["end"]}))
+                    continue
+                try:
+                    event = json.loads(fields.get("event", "null"))
+                except json.JSONDecodeError:
+                    event = {"raw": fields.get("event")}
+                entries.append((cls._decode(entry_id), {"event": event}))
+        return entries
+
 
+__all__ = ["RedisQueueBase"]
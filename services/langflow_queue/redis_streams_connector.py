@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+from collections import Counter, deque
+from typing import Any, Collection
+
+from redis.exceptions import ResponseError
+
+from .redis_connector import RedisQueueBase
+
+
+class RedisStreamsQueueBase(RedisQueueBase):
+    """Очередь на Redis Streams с группой потребителей: общая часть коннектора.
+
+    Записи задач, индексы, события и дедупликация хранятся так же, как в очереди
+    на списках; отличается только доставка задач воркерам. Каждая дорожка
+    приоритета - поток <queue>:stream:<lane>, который воркеры читают через общую
+    группу потребителей (XREADGROUP), потребитель - worker_id.
+
+    Воркер забирает задачи пачками за один round-trip, но не больше batch_size
+    и не больше, чем у него свободных слотов (prefetch в dequeue()): дорожки
+    читаются одним pipeline, доли пачки делятся между ними плавным взвешенным
+    round-robin, а недобор пустых дорожек достаётся остальным вторым чтением.
+    Записи пачки загружаются следующим pipeline и отдаются из dequeue() по
+    одной; невыданные задачи close() возвращает в очередь. Порядок внутри
+    дорожки - FIFO, обслуживания flow по кругу нет.
+
+    В надёжном режиме задача остаётся в списке ожидающих подтверждения (PEL)
+    группы, пока ack() не выполнит XACK; reap_expired() через XAUTOCLAIM
+    возвращает в очередь задачи, которые воркер держит дольше таймаута
+    видимости. Без надёжного режима записи читаются с NOACK и сразу удаляются.
+    Подтверждённые записи удаляются из потока (XDEL), поэтому поток не растёт.
+    """
+
+    consumer_group = "workers"
+
+    def __init__(self, *, batch_size: int = 10, **settings: Any) -> None:
+        super().__init__(**settings)
+        self.batch_size = max(1, batch_size)
+        # Полученные, но ещё не отданные из dequeue() записи задач вместе с их потоками
+        self._buffer: deque[tuple[str, dict]] = deque()
+        # Текущие веса плавного взвешенного round-robin по дорожкам
+        self._lane_credits = dict.fromkeys(self.lanes, 0)
+        # task_id -> (поток, id записи) задач, ожидающих ack()
+        self._claimed: dict[str, tuple[str, str]] = {}
+        self._groups_ready = False
+
+    def _stream_key(self, lane: str) -> str:
+        return f"{self.queue_name}:stream:{lane}"
+
+    def _stream_keys(self) -> list[str]:
+        return [self._stream_key(lane) for lane in self.lanes]
+
+    def _lane_quotas(self, limit: int, lanes: Collection[str], credits: dict[str, int]) -> dict[str, int]:
+        """Делит limit задач между дорожками lanes плавным взвешенным round-robin.
+
+        credits - текущие веса дорожек; сохраняясь между вызовами, они делают
+        обслуживание дорожек пропорциональным весам и при пачках из одной задачи.
+        """
+        quotas = dict.fromkeys(lanes, 0)
+        if not quotas:
+            return quotas
+        total = sum(self.lanes[lane] for lane in quotas)
+        for _ in range(limit):
+            for lane in quotas:
+                credits[lane] = credits.get(lane, 0) + self.lanes[lane]
+            lane = max(quotas, key=credits.__getitem__)
+            credits[lane] -= total
+            quotas[lane] += 1
+        return quotas
+
+    def _refill_lanes(self, quotas: dict[str, int], entries: list[tuple[str, str, str]]) -> list[str]:
+        """Дорожки, из которых можно добрать недостающее.
+
+        Это дорожки, отдавшие свою долю целиком или не получившие доли: дорожка,
+        отдавшая меньше своей доли, пуста.
+        """
+        read = Counter(stream for stream, _, _ in entries)
+        return [lane for lane, quota in quotas.items() if read[self._stream_key(lane)] >= quota]
+
+    def _read_args(self) -> dict[str, Any]:
+        return {"groupname": self.consumer_group, "consumername": self.worker_id, "noack": not self.reliable}
+
+    def _stream_entries(self, response: Any) -> list[tuple[str, str, str]]:
+        """Разбирает ответ XREADGROUP в список (поток, id записи, task_id)."""
+        entries: list[tuple[str, str, str]] = []
+        streams = response.items() if isinstance(response, dict) else (response or [])
+        for stream, stream_entries in streams:
+            # В RESP3 ответ - словарь поток -> [записи]
+            if stream_entries and isinstance(stream_entries[0], list) and len(stream_entries) == 1:
+                stream_entries = stream_entries[0]
+            for entry_id, fields in stream_entries:
+                fields = {self._decode(key): self._decode(value) for key, value in (fields or {}).items()}
+                if fields.get("task_id"):
+                    entries.append((self._decode(stream), self._decode(entry_id), fields["task_id"]))
+        return entries
+
+    def _add_claim_writes(self, pipe: Any, entries: list[tuple[str, str, str]]) -> None:
+        """Запоминает полученные записи; без надёжного режима сразу удаляет их из потоков."""
+        for stream, entry_id, task_id in entries:
+            if self.reliable:
+                self._claimed[task_id] = (stream, entry_id)
+            else:
+                pipe.xdel(stream, entry_id)
+
+    def _add_requeue_writes(self, pipe: Any, stream: str, task_id: str) -> None:
+        """Возвращает полученную, но не выданную задачу в конец её дорожки."""
+        claimed = self._claimed.pop(task_id, None)
+        if claimed is not None:
+            pipe.xack(stream, self.consumer_group, claimed[1])
+            pipe.xdel(stream, claimed[1])
+        pipe.xadd(stream, {"task_id": task_id})
+
+    def _add_ack_writes(self, pipe: Any, task_id: str) -> None:
+        claimed = self._claimed.pop(task_id, None)
+        if claimed is not None:
+            stream, entry_id = claimed
+            pipe.xack(stream, self.consumer_group, entry_id)
+            pipe.xdel(stream, entry_id)
+
+    def _add_group_writes(self, pipe: Any) -> None:
+        for stream in self._stream_keys():
+            pipe.xgroup_create(stream, self.consumer_group, id="0", mkstream=True)
+
+    def _check_group_results(self, results: list[Any]) -> None:
+        for result in results:
+            if isinstance(result, Exception) and "BUSYGROUP" not in str(result):
+                raise result
+        self._groups_ready = True
+
+    def _stream_depths(self, results: list[Any]) -> dict[str, int]:
+        """Глубина дорожек по парам результатов XLEN и XINFO GROUPS."""
+        depths: dict[str, int] = {}
+        for index, lane in enumerate(self.lanes):
+            length, groups = results[2 * index], results[2 * index + 1]
+            if isinstance(length, Exception):
+                length = 0
+            pending = 0
+            if not isinstance(groups, Exception):
+                for group in groups or []:
+                    if self._decode(group.get("name")) == self.consumer_group:
+                        pending = int(group.get("pending") or 0)
+            depths[lane] = max(int(length) - pending, 0)
+        return depths
+
+    def _last_delivered_ids(self, results: list[Any]) -> dict[str, str]:
+        """Последние выданные группе id записей потоков по результатам XINFO GROUPS."""
+        ids: dict[str, str] = {}
+        for stream, groups in zip(self._stream_keys(), results):
+            ids[stream] = "0"
+            if isinstance(groups, Exception):
+                continue
+            for group in groups or []:
+                if self._decode(group.get("name")) == self.consumer_group:
+                    ids[stream] = self._decode(group.get("last-delivered-id")) or "0"
+        return ids
+
+    def _stale_consumers(self, results: list[Any]) -> list[tuple[str, str]]:
+        """Потребители без задач, давно не обращавшиеся к группе (воркеры, которых уже нет)."""
+        stale: list[tuple[str, str]] = []
+        for stream, consumers in zip(self._stream_keys(), results):
+            if isinstance(consumers, Exception):
+                continue
+            for consumer in consumers or []:
+                name = self._decode(consumer.get("name"))
+                idle = int(consumer.get("idle") or 0)
+                if name != self.worker_id and not consumer.get("pending") and idle > self.visibility_timeout * 1000:
+                    stale.append((stream, name))
+        return stale
+
+    @staticmethod
+    def _is_missing_group(error: ResponseError) -> bool:
+        return "NOGROUP" in str(error)
+
+
+__all__ = ["RedisStreamsQueueBase"]
@@ -0,0 +1,840 @@
+"""Lua-скрипты коннекторов очереди на Redis."""
+
+# Постраничный обход индекса задач в порядке убывания времени создания.
+#
+# KEYS[1] - основной индекс (ZSET, score = created_at)
+# KEYS[2] - необязательный индекс-фильтр (ZSET), членство в котором проверяется
+# ARGV[1] - верхняя граница score курсора ("+inf" для первой страницы)
+# ARGV[2] - сколько элементов с score == ARGV[1] уже было выдано
+# ARGV[3] - размер страницы
+# ARGV[4] - максимальное число просматриваемых элементов основного индекса
+#
+# Возвращает {ids, cursor_score, cursor_skip, exhausted}.
+LIST_TASKS_PAGE = """
+local cursor_score = ARGV[1]
+local cursor_value = tonumber(cursor_score)
+local cursor_skip = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local budget = tonumber(ARGV[4])
+local ids = {}
+local scanned = 0
+
+while scanned < budget do
+    local batch = redis.call(
+        'ZREVRANGEBYSCORE', KEYS[1], cursor_score, '-inf',
+        'WITHSCORES', 'LIMIT', cursor_skip, limit
+    )
+    if #batch == 0 then
+        return {ids, cursor_score, cursor_skip, 1}
+    end
+    for i = 1, #batch, 2 do
+        local task_id = batch[i]
+        local score = batch[i + 1]
+        local value = tonumber(score)
+        if value == cursor_value then
+            cursor_skip = cursor_skip + 1
+        else
+            cursor_score = score
+            cursor_value = value
+            cursor_skip = 1
+        end
+        scanned = scanned + 1
+        if #KEYS < 2 or redis.call('ZSCORE', KEYS[2], task_id) then
+            ids[#ids + 1] = task_id
+        end
+        if #ids >= limit or scanned >= budget then
+            return {ids, cursor_score, cursor_skip, 0}
+        end
+    end
+end
+
+return {ids, cursor_score, cursor_skip, 0}
+"""
+
+
+# Атомарное обновление отдельных полей задачи, хранящейся в виде хэша.
+# Значения полей закодированы в JSON. При смене статуса задача переносится
+# между индексами статусов, а в канал статусов публикуется уведомление
+# {"task_id": ..., "status": ...} в том же вызове. Если текущий статус задачи
+# входит в ARGV[6], запись не меняется: так отмена не затирает результат
+# завершившейся задачи, а результат - отмену. Ответ пишется тем же вызовом,
+# раньше уведомления, и только если обновление применено.
+#
+# KEYS[1] - хэш задачи
+# KEYS[2] - ключ ответа задачи (используется только при ARGV[7] = set или del)
+# ARGV[1] - TTL записи в секундах
+# ARGV[2] - префикс ключей индексов
+# ARGV[3] - task_id
+# ARGV[4] - текущее время (unix timestamp)
+# ARGV[5] - канал уведомлений о смене статуса
+# ARGV[6] - JSON-список статусов, в которых задачу обновлять нельзя
+# ARGV[7] - действие с ответом: "" - не трогать, set - записать ARGV[8], del - удалить
+# ARGV[8] - закодированный ответ
+# ARGV[9...] - пары поле/значение
+#
+# Возвращает 1, если задача обновлена, и 0, если её не существует или её
+# статус не позволяет обновление.
+UPDATE_TASK = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+
+local function status_of(raw)
+    if raw then
+        local ok, value = pcall(cjson.decode, raw)
+        if ok and type(value) == 'string' and value ~= '' then
+            return value
+        end
+    end
+    return 'pending'
+end
+
+local ttl = tonumber(ARGV[1])
+local index_prefix = ARGV[2]
+local task_id = ARGV[3]
+local now = tonumber(ARGV[4])
+local channel = ARGV[5]
+
+local new_status = nil
+for i = 9, #ARGV, 2 do
+    if ARGV[i] == 'status' then
+        new_status = status_of(ARGV[i + 1])
+    end
+end
+local previous_status = status_of(redis.call('HGET', KEYS[1], 'status'))
+for _, status in ipairs(cjson.decode(ARGV[6])) do
+    if status == previous_status then
+        return 0
+    end
+end
+
+if ARGV[7] == 'set' then
+    redis.call('SET', KEYS[2], ARGV[8], 'EX', ttl)
+elseif ARGV[7] == 'del' then
+    redis.call('DEL', KEYS[2])
+end
+if #ARGV >= 9 then
+    redis.call('HSET', KEYS[1], unpack(ARGV, 9))
+end
+redis.call('EXPIRE', KEYS[1], ttl)
+
+if new_status and new_status ~= previous_status then
+    local score = redis.call('ZSCORE', index_prefix .. ':created', task_id) or now
+    local status_index = index_prefix .. ':status:' .. new_status
+    redis.call('ZREM', index_prefix .. ':status:' .. previous_status, task_id)
+    redis.call('ZADD', status_index, score, task_id)
+    redis.call('ZREMRANGEBYSCORE', status_index, '-inf', now - ttl)
+    redis.call('EXPIRE', status_index, ttl)
+    redis.call('PUBLISH', channel, cjson.encode({task_id = task_id, status = new_status}))
+end
+
+return 1
+"""
+
+
+# Возвращает задачу из очереди недоставленных: снимает её оттуда, удаляет результат
+# и события прошлого запуска, обновляет запись так же, как UPDATE_TASK, и ставит
+# в отложенные с текущим временем, откуда её вернёт в дорожку promote_delayed().
+# Всё атомарно, чтобы задачу нельзя было запустить дважды или извлечь раньше,
+# чем обновится её запись.
+# KEYS[1] - запись задачи, KEYS[2] - очередь недоставленных, KEYS[3] - отложенные задачи
+# KEYS[4...] - ключи результата и событий задачи
+# ARGV - как у UPDATE_TASK (без действия с ответом: KEYS[2] здесь - другой ключ)
+REPLAY_DEAD_LETTER = """
+if redis.call('ZREM', KEYS[2], ARGV[3]) == 0 then
+    return 0
+end
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('DEL', unpack(KEYS, 4))
+    redis.call('ZADD', KEYS[3], ARGV[4], ARGV[3])
+end
+""" + UPDATE_TASK
+
+# Удаляет запись задачи со всеми её ключами и индексами, если задача всё ещё
+# в одном из переданных статусов и не числится в очереди недоставленных.
+# KEYS: задача, ответ, поток событий, разобранные события, их типы, недоставленные
+# ARGV: префикс индексов, task_id, статусы...
+DELETE_TASK = """
+local raw_status = redis.call('HGET', KEYS[1], 'status')
+if not raw_status then
+    return 0
+end
+local ok, status = pcall(cjson.decode, raw_status)
+if not ok or type(status) ~= 'string' then
+    return 0
+end
+local allowed = false
+for i = 3, #ARGV do
+    if ARGV[i] == status then
+        allowed = true
+        break
+    end
+end
+if not allowed or redis.call('ZSCORE', KEYS[6], ARGV[2]) then
+    return 0
+end
+
+local index_prefix = ARGV[1]
+local raw_flow = redis.call('HGET', KEYS[1], 'flow_id')
+redis.call('DEL', unpack(KEYS, 1, 5))
+redis.call('ZREM', index_prefix .. ':created', ARGV[2])
+redis.call('ZREM', index_prefix .. ':status:' .. status, ARGV[2])
+if raw_flow then
+    local flow_ok, flow_id = pcall(cjson.decode, raw_flow)
+    if flow_ok and type(flow_id) == 'string' then
+        redis.call('ZREM', index_prefix .. ':flow:' .. flow_id, ARGV[2])
+    end
+end
+return 1
+"""
+
+# Общие функции скриптов, работающих с дорожками приоритета очереди, которые
+# не зависят от того, как устроена сама дорожка.
+_LANE_HELPERS = """
+local function json_string(raw)
+    if raw then
+        local ok, value = pcall(cjson.decode, raw)
+        if ok and type(value) == 'string' then
+            return value
+        end
+    end
+    return nil
+end
+
+-- Множество дорожек из JSON-списка имён; первая дорожка - дорожка по умолчанию
+local function lane_set(raw)
+    local names = cjson.decode(raw)
+    local lanes = {}
+    for _, lane in ipairs(names) do
+        lanes[lane] = true
+    end
+    return lanes, names[1]
+end
+
+-- Дорожка и flow задачи по её записи; неизвестная дорожка заменяется дорожкой по умолчанию
+local function task_lane(task_key, lanes, default_lane)
+    local fields = redis.call('HMGET', task_key, 'priority', 'flow_id')
+    local lane = json_string(fields[1])
+    if not lane or not lanes[lane] then
+        lane = default_lane
+    end
+    return lane, json_string(fields[2]) or ''
+end
+"""
+
+
+# Дорожки на списках. Дорожка <queue>:lane:<lane> состоит из списков задач
+# отдельных flow (<...>:flow:<flow_id>) и кольца flow с непустыми списками
+# (<...>:flows), по которому задачи дорожки выдаются по очереди. <queue>:depth
+# хранит глубину каждой дорожки, а <queue>:ready - по маркеру на каждую задачу
+# в дорожках, появления которого ждут воркеры.
+_LANES = _LANE_HELPERS + """
+local function lane_key(queue, lane)
+    return queue .. ':lane:' .. lane
+end
+
+local function push_task(queue, lane, flow, task_id, to_head)
+    local prefix = lane_key(queue, lane)
+    local flow_key = prefix .. ':flow:' .. flow
+    local length
+    if to_head then
+        length = redis.call('RPUSH', flow_key, task_id)
+    else
+        length = redis.call('LPUSH', flow_key, task_id)
+    end
+    if length == 1 then
+        if to_head then
+            redis.call('LPUSH', prefix .. ':flows', flow)
+        else
+            redis.call('RPUSH', prefix .. ':flows', flow)
+        end
+    end
+    redis.call('HINCRBY', queue .. ':depth', lane, 1)
+    redis.call('LPUSH', queue .. ':ready', 1)
+end
+"""
+
+
+# Дорожки на Redis Streams: дорожка - поток <queue>:stream:<lane>, из которого
+# воркеры читают через группу потребителей. Поток только дописывается, поэтому
+# возвращаемые в очередь задачи попадают в его конец, а не в голову.
+_STREAM_LANES = _LANE_HELPERS + """
+local function push_task(queue, lane, flow, task_id, to_head)
+    redis.call('XADD', queue .. ':stream:' .. lane, '*', 'task_id', task_id)
+end
+"""
+
+
+# Постановка задачи в конец списка её flow в дорожке приоритета.
+#
+# ARGV[1] - имя очереди
+# ARGV[2] - дорожка
+# ARGV[3] - flow_id ("" для задач без flow)
+# ARGV[4] - task_id
+_ENQUEUE_TASK = """
+push_task(ARGV[1], ARGV[2], ARGV[3], ARGV[4], false)
+return 1
+"""
+ENQUEUE_TASK = _LANES + _ENQUEUE_TASK
+STREAM_ENQUEUE_TASK = _STREAM_LANES + _ENQUEUE_TASK
+
+
+# Извлечение следующей задачи. Дорожка выбирается плавным взвешенным
+# round-robin среди непустых дорожек, внутри дорожки flow обслуживаются по кругу,
+# а внутри flow задачи выдаются в порядке FIFO. Когда дорожки пусты, задачи
+# забираются из общего списка очереди, оставшегося от версии без дорожек.
+# В надёжном режиме задача в том же вызове регистрируется как находящаяся
+# в обработке у воркера.
+#
+# KEYS[1] - общий список очереди
+# KEYS[2] - хэш текущих весов дорожек
+# KEYS[3] - список обработки воркера
+# KEYS[4] - ZSET задач в обработке (score = дедлайн видимости)
+# KEYS[5] - хэш task_id -> worker_id
+# ARGV[1] - имя очереди
+# ARGV[2] - "1" в надёжном режиме
+# ARGV[3] - дедлайн видимости (unix timestamp)
+# ARGV[4] - worker_id
+# ARGV[5...] - пары дорожка/вес
+#
+# Возвращает task_id или false, если очередь пуста.
+DEQUEUE_TASK = _LANES + """
+local queue = ARGV[1]
+local active = {}
+local total = 0
+local best = nil
+
+for i = 5, #ARGV, 2 do
+    local lane = ARGV[i]
+    local weight = tonumber(ARGV[i + 1])
+    if redis.call('LLEN', lane_key(queue, lane) .. ':flows') > 0 then
+        local current = tonumber(redis.call('HGET', KEYS[2], lane) or '0') + weight
+        active[lane] = current
+        total = total + weight
+        if not best or current > active[best] then
+            best = lane
+        end
+    else
+        redis.call('HDEL', KEYS[2], lane)
+    end
+end
+
+local task_id = false
+if best then
+    active[best] = active[best] - total
+    for lane, current in pairs(active) do
+        redis.call('HSET', KEYS[2], lane, current)
+    end
+
+    local ring = lane_key(queue, best) .. ':flows'
+    while not task_id do
+        local flow = redis.call('LPOP', ring)
+        if not flow then
+            break
+        end
+        local flow_key = lane_key(queue, best) .. ':flow:' .. flow
+        task_id = redis.call('RPOP', flow_key)
+        if redis.call('LLEN', flow_key) > 0 then
+            redis.call('RPUSH', ring, flow)
+        end
+    end
+    if task_id then
+        redis.call('HINCRBY', queue .. ':depth', best, -1)
+        redis.call('RPOP', queue .. ':ready')
+    end
+end
+
+if not task_id then
+    task_id = redis.call('RPOP', KEYS[1])
+end
+if not task_id then
+    -- Маркеры без задач не должны будить воркеры впустую
+    redis.call('DEL', queue .. ':ready')
+    return false
+end
+
+if ARGV[2] == '1' then
+    redis.call('LPUSH', KEYS[3], task_id)
+    redis.call('ZADD', KEYS[4], ARGV[3], task_id)
+    redis.call('HSET', KEYS[5], task_id, ARGV[4])
+end
+return task_id
+"""
+
+
+# Возврат в очередь задач, у которых истёк таймаут видимости. Задачи кладутся
+# в голову списка своего flow, а flow - в начало кольца дорожки.
+#
+# KEYS[1] - ZSET задач в обработке (score = дедлайн видимости)
+# KEYS[2] - хэш task_id -> worker_id
+# ARGV[1] - текущее время (unix timestamp)
+# ARGV[2] - префикс ключей списков обработки воркеров
+# ARGV[3] - максимальное число задач за вызов
+# ARGV[4] - имя очереди
+# ARGV[5] - префикс ключей записей задач
+# ARGV[6] - JSON-список дорожек
+#
+# Возвращает список возвращённых в очередь task_id.
+REQUEUE_EXPIRED = _LANES + """
+local lanes, default_lane = lane_set(ARGV[6])
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[3]))
+-- Самую старую задачу кладём последней, чтобы она оказалась ближе всех к голове
+for i = #expired, 1, -1 do
+    local task_id = expired[i]
+    local owner = redis.call('HGET', KEYS[2], task_id)
+    if owner then
+        redis.call('LREM', ARGV[2] .. owner, 1, task_id)
+    end
+    local lane, flow = task_lane(ARGV[5] .. ':' .. task_id, lanes, default_lane)
+    push_task(ARGV[4], lane, flow, task_id, true)
+    redis.call('ZREM', KEYS[1], task_id)
+    redis.call('HDEL', KEYS[2], task_id)
+end
+return expired
+"""
+
+
+# Возврат в очередь отложенных задач, время которых наступило. Задачи
+# кладутся в голову списка своего flow, как и после истечения видимости
+# (в очереди на потоках - в конец потока дорожки).
+#
+# KEYS[1] - ZSET отложенных задач (score = время, когда задачу можно выполнять)
+# ARGV[1] - текущее время (unix timestamp)
+# ARGV[2] - максимальное число задач за вызов
+# ARGV[3] - имя очереди
+# ARGV[4] - префикс ключей записей задач
+# ARGV[5] - JSON-список дорожек
+#
+# Возвращает список возвращённых в очередь task_id.
+_PROMOTE_DELAYED = """
+local lanes, default_lane = lane_set(ARGV[5])
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for i = #due, 1, -1 do
+    local task_id = due[i]
+    local lane, flow = task_lane(ARGV[4] .. ':' .. task_id, lanes, default_lane)
+    push_task(ARGV[3], lane, flow, task_id, true)
+    redis.call('ZREM', KEYS[1], task_id)
+end
+return due
+"""
+PROMOTE_DELAYED = _LANES + _PROMOTE_DELAYED
+STREAM_PROMOTE_DELAYED = _STREAM_LANES + _PROMOTE_DELAYED
+
+
+# Возврат в очередь всех задач из списка обработки воркера (после его рестарта).
+#
+# KEYS[1] - список обработки воркера
+# KEYS[2] - ZSET задач в обработке
+# KEYS[3] - хэш task_id -> worker_id
+# ARGV[1] - имя очереди
+# ARGV[2] - префикс ключей записей задач
+# ARGV[3] - JSON-список дорожек
+#
+# Возвращает число возвращённых задач.
+RECOVER_PROCESSING = _LANES + """
+local lanes, default_lane = lane_set(ARGV[3])
+local count = 0
+while true do
+    -- Начинаем с самой новой задачи, чтобы самая старая оказалась ближе всех к голове
+    local task_id = redis.call('LPOP', KEYS[1])
+    if not task_id then
+        break
+    end
+    local lane, flow = task_lane(ARGV[2] .. ':' .. task_id, lanes, default_lane)
+    push_task(ARGV[1], lane, flow, task_id, true)
+    redis.call('ZREM', KEYS[2], task_id)
+    redis.call('HDEL', KEYS[3], task_id)
+    count = count + 1
+end
+return count
+"""
+
+
+# Постановка задачи в очередь с объединением одинаковых запросов в полёте.
+# Первая задача с данным ключом становится ведущей и попадает в очередь,
+# последующие (пока ведущая не завершена) становятся ведомыми: они не ставятся
+# в очередь, а ждут результата ведущей. Запись задачи должна быть уже сохранена.
+#
+# KEYS[1] - ключ ведущей задачи для хэша запроса
+# KEYS[2] - хэш задачи
+# ARGV[1] - task_id
+# ARGV[2] - TTL ключа ведущей задачи и списка ведомых в секундах
+# ARGV[3] - префикс ключей списков ведомых задач
+# ARGV[4] - имя очереди
+# ARGV[5] - дорожка
+# ARGV[6] - flow_id ("" для задач без flow)
+#
+# Возвращает task_id ведущей задачи или false, если задача сама стала ведущей.
+_ENQUEUE_DEDUP = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'EX', tonumber(ARGV[2])) then
+    push_task(ARGV[4], ARGV[5], ARGV[6], ARGV[1], false)
+    return false
+end
+
+local leader = redis.call('GET', KEYS[1])
+local followers = ARGV[3] .. leader
+redis.call('RPUSH', followers, ARGV[1])
+redis.call('EXPIRE', followers, tonumber(ARGV[2]))
+redis.call('HSET', KEYS[2], 'leader_task_id', cjson.encode(leader))
+return leader
+"""
+ENQUEUE_DEDUP = _LANES + _ENQUEUE_DEDUP
+STREAM_ENQUEUE_DEDUP = _STREAM_LANES + _ENQUEUE_DEDUP
+
+
+# Снятие ведущей задачи по завершении: следующие одинаковые запросы снова
+# пойдут в очередь, а накопленные ведомые задачи возвращаются для раздачи результата.
+#
+# KEYS[1] - ключ ведущей задачи для хэша запроса
+# KEYS[2] - список ведомых задач
+# ARGV[1] - task_id ведущей задачи
+#
+# Возвращает список task_id ведомых задач.
+RELEASE_DEDUP = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+end
+local followers = redis.call('LRANGE', KEYS[2], 0, -1)
+redis.call('DEL', KEYS[2])
+return followers
+"""
+
+
+# Передача ведущей роли, когда ведущую задачу отменили или истёк её дедлайн:
+# её итог не относится к ведомым задачам, поэтому первая ещё не завершённая
+# ведомая становится ведущей и ставится в голову своей дорожки, а остальные
+# переходят к ней. Если таких нет, ключ ведущей задачи снимается. Ключ не
+# трогается, если его уже заняла другая задача.
+#
+# KEYS[1] - ключ ведущей задачи для хэша запроса
+# KEYS[2] - список ведомых задач
+# ARGV[1] - task_id ведущей задачи
+# ARGV[2] - TTL ключа ведущей задачи и списка ведомых в секундах
+# ARGV[3] - префикс ключей списков ведомых задач
+# ARGV[4] - имя очереди
+# ARGV[5] - префикс ключей записей задач
+# ARGV[6] - JSON-список дорожек
+# ARGV[7] - JSON-список завершённых статусов
+#
+# Возвращает task_id новой ведущей задачи или false, если её нет.
+_HAND_OVER_DEDUP = """
+local lanes, default_lane = lane_set(ARGV[6])
+local terminal = {}
+for _, status in ipairs(cjson.decode(ARGV[7])) do
+    terminal[status] = true
+end
+
+local leader = nil
+local rest = {}
+for _, task_id in ipairs(redis.call('LRANGE', KEYS[2], 0, -1)) do
+    local status = json_string(redis.call('HGET', ARGV[5] .. ':' .. task_id, 'status'))
+    if status and not terminal[status] then
+        if leader then
+            table.insert(rest, task_id)
+        else
+            leader = task_id
+        end
+    end
+end
+redis.call('DEL', KEYS[2])
+
+local current = redis.call('GET', KEYS[1])
+local owned = not current or current == ARGV[1]
+if not leader then
+    if current == ARGV[1] then
+        redis.call('DEL', KEYS[1])
+    end
+    return false
+end
+
+local ttl = tonumber(ARGV[2])
+if owned then
+    redis.call('SET', KEYS[1], leader, 'EX', ttl)
+end
+redis.call('HDEL', ARGV[5] .. ':' .. leader, 'leader_task_id')
+if #rest > 0 then
+    local followers = ARGV[3] .. leader
+    redis.call('RPUSH', followers, unpack(rest))
+    redis.call('EXPIRE', followers, ttl)
+    for _, task_id in ipairs(rest) do
+        redis.call('HSET', ARGV[5] .. ':' .. task_id, 'leader_task_id', cjson.encode(leader))
+    end
+end
+local lane, flow = task_lane(ARGV[5] .. ':' .. leader, lanes, default_lane)
+push_task(ARGV[4], lane, flow, leader, true)
+return leader
+"""
+HAND_OVER_DEDUP = _LANES + _HAND_OVER_DEDUP
+STREAM_HAND_OVER_DEDUP = _STREAM_LANES + _HAND_OVER_DEDUP
+
+
+# Разбор записи потока дорожки: task_id из плоского списка полей XRANGE/XAUTOCLAIM.
+_STREAM_ENTRIES = """
+local function entry_task_id(fields)
+    if not fields then
+        return nil
+    end
+    for i = 1, #fields, 2 do
+        if fields[i] == 'task_id' then
+            return fields[i + 1]
+        end
+    end
+    return nil
+end
+
+-- Снимает запись с обработки и дописывает её задачу в конец потока
+local function requeue_entry(stream, group, id, fields)
+    redis.call('XACK', stream, group, id)
+    redis.call('XDEL', stream, id)
+    local task_id = entry_task_id(fields)
+    if task_id then
+        redis.call('XADD', stream, '*', 'task_id', task_id)
+    end
+    return task_id
+end
+"""
+
+
+# Возврат в очередь задач, которые потребители группы держат дольше таймаута
+# видимости (воркер упал или завис). Записи забираются XAUTOCLAIM и
+# дописываются в конец своего потока, чтобы их мог получить любой воркер.
+#
+# KEYS - потоки дорожек
+# ARGV[1] - группа потребителей
+# ARGV[2] - имя потребителя, от которого выполняется XAUTOCLAIM
+# ARGV[3] - таймаут видимости в миллисекундах
+# ARGV[4] - максимальное число задач за вызов
+#
+# Возвращает список возвращённых в очередь task_id.
+STREAM_REQUEUE_EXPIRED = _STREAM_ENTRIES + """
+local requeued = {}
+local limit = tonumber(ARGV[4])
+for _, stream in ipairs(KEYS) do
+    if #requeued >= limit then
+        break
+    end
+    local claimed = redis.call('XAUTOCLAIM', stream, ARGV[1], ARGV[2], ARGV[3], '0-0', 'COUNT', limit - #requeued)
+    for _, entry in ipairs(claimed[2]) do
+        local task_id = requeue_entry(stream, ARGV[1], entry[1], entry[2])
+        if task_id then
+            requeued[#requeued + 1] = task_id
+        end
+    end
+end
+return requeued
+"""
+
+
+# Возврат в очередь всех задач, числящихся за потребителем (после рестарта
+# воркера с тем же worker_id).
+#
+# KEYS - потоки дорожек
+# ARGV[1] - группа потребителей
+# ARGV[2] - имя потребителя
+#
+# Возвращает число возвращённых задач.
+STREAM_RECOVER_PENDING = _STREAM_ENTRIES + """
+local count = 0
+for _, stream in ipairs(KEYS) do
+    while true do
+        local pending = redis.call('XPENDING', stream, ARGV[1], '-', '+', 100, ARGV[2])
+        if #pending == 0 then
+            break
+        end
+        for _, item in ipairs(pending) do
+            local entry = redis.call('XRANGE', stream, item[1], item[1])[1]
+            if requeue_entry(stream, ARGV[1], item[1], entry and entry[2]) then
+                count = count + 1
+            end
+        end
+    end
+end
+return count
+"""
+
+
+# Захват слотов и токенов сразу во всех областях ограничений (Langflow целиком,
+# отдельный flow). Задача получает всё или ничего: если хотя бы одна область
+# исчерпана, ничего не списывается. Время берётся из Redis, чтобы у всех
+# воркеров были одни часы.
+#
+# Для каждой области i:
+# KEYS[2i-1] - ZSET держателей слотов (score = время истечения аренды)
+# KEYS[2i] - хэш корзины токенов {tokens, ts}
+# ARGV[1] - id держателя (task_id)
+# ARGV[2] - длительность аренды слота в секундах
+# ARGV[3] - через сколько секунд повторить попытку, если нет свободного слота
+# ARGV[3i+1], ARGV[3i+2], ARGV[3i+3] - лимит слотов, скорость пополнения токенов
+#     в секунду и размер корзины; 0 отключает соответствующее ограничение
+#
+# Возвращает "0", если слоты и токены получены, иначе через сколько секунд
+# стоит повторить попытку (строкой, чтобы не терять дробную часть).
+ACQUIRE_LIMITS = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local holder = ARGV[1]
+local lease = tonumber(ARGV[2])
+local wait = 0
+local tokens = {}
+
+for i = 1, #KEYS / 2 do
+    local slots = KEYS[2 * i - 1]
+    local bucket = KEYS[2 * i]
+    local concurrency = tonumber(ARGV[3 * i + 1])
+    local rate = tonumber(ARGV[3 * i + 2])
+    local burst = tonumber(ARGV[3 * i + 3])
+
+    if concurrency > 0 then
+        -- Аренды упавших воркеров истекают сами
+        redis.call('ZREMRANGEBYSCORE', slots, '-inf', now)
+        if not redis.call('ZSCORE', slots, holder) and redis.call('ZCARD', slots) >= concurrency then
+            wait = math.max(wait, tonumber(ARGV[3]))
+        end
+    end
+
+    if rate > 0 then
+        local state = redis.call('HMGET', bucket, 'tokens', 'ts')
+        local available = tonumber(state[1]) or burst
+        local updated_at = tonumber(state[2]) or now
+        available = math.min(burst, available + math.max(0, now - updated_at) * rate)
+        tokens[i] = available
+        if available < 1 then
+            wait = math.max(wait, (1 - available) / rate)
+        end
+    end
+end
+
+if wait > 0 then
+    return tostring(wait)
+end
+
+for i = 1, #KEYS / 2 do
+    local concurrency = tonumber(ARGV[3 * i + 1])
+    local rate = tonumber(ARGV[3 * i + 2])
+    local burst = tonumber(ARGV[3 * i + 3])
+    if concurrency > 0 then
+        redis.call('ZADD', KEYS[2 * i - 1], now + lease, holder)
+        redis.call('EXPIRE', KEYS[2 * i - 1], math.ceil(lease))
+    end
+    if rate > 0 then
+        redis.call('HSET', KEYS[2 * i], 'tokens', tokens[i] - 1, 'ts', now)
+        redis.call('EXPIRE', KEYS[2 * i], math.ceil(burst / rate) + 1)
+    end
+end
+return '0'
+"""
+
+
+# Запись в кэш результатов с учётом суммарного размера значений и вытеснением
+# записей, к которым дольше всего не обращались.
+#
+# KEYS[1] - ключ записи
+# KEYS[2] - ZSET ключей записей (score = время последнего обращения)
+# KEYS[3] - хэш ключ записи -> размер значения
+# KEYS[4] - счётчик суммарного размера значений
+# KEYS[5] - хэш счётчиков кэша
+# ARGV[1] - значение
+# ARGV[2] - TTL записи в секундах
+# ARGV[3] - текущее время (unix timestamp)
+# ARGV[4] - максимальный суммарный размер значений в байтах
+#
+# Возвращает число вытесненных записей.
+CACHE_SET = """
+local previous = redis.call('HGET', KEYS[3], KEYS[1])
+if previous then
+    redis.call('DECRBY', KEYS[4], previous)
+end
+
+local size = string.len(ARGV[1])
+redis.call('SET', KEYS[1], ARGV[1], 'EX', tonumber(ARGV[2]))
+redis.call('HSET', KEYS[3], KEYS[1], size)
+redis.call('INCRBY', KEYS[4], size)
+redis.call('ZADD', KEYS[2], ARGV[3], KEYS[1])
+
+-- Истёкшие по TTL записи тоже оказываются среди самых старых и вычищаются здесь
+local max_bytes = tonumber(ARGV[4])
+local evicted = 0
+while tonumber(redis.call('GET', KEYS[4]) or '0') > max_bytes do
+    local oldest = redis.call('ZRANGE', KEYS[2], 0, 0)[1]
+    if not oldest then
+        break
+    end
+    local oldest_size = redis.call('HGET', KEYS[3], oldest)
+    redis.call('DEL', oldest)
+    redis.call('ZREM', KEYS[2], oldest)
+    redis.call('HDEL', KEYS[3], oldest)
+    if oldest_size then
+        redis.call('DECRBY', KEYS[4], oldest_size)
+    end
+    evicted = evicted + 1
+end
+
+if evicted > 0 then
+    redis.call('HINCRBY', KEYS[5], 'evictions', evicted)
+end
+return evicted
+"""
+
+
+# Страница разобранных событий задачи. KEYS[1] - список событий, KEYS[2] -
+# параллельный список их типов. Фильтр по типам просматривает только короткие
+# строки типов, а сами события читаются лишь для запрошенной страницы.
+PAGE_EVENTS = """
+local offset = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+
+if #ARGV < 3 then
+    local stop = -1
+    if limit >= 0 then
+        stop = offset + limit - 1
+    end
+    local page = {}
+    if limit ~= 0 then
+        page = redis.call('LRANGE', KEYS[1], offset, stop)
+    end
+    return {redis.call('LLEN', KEYS[1]), page}
+end
+
+local wanted = {}
+for i = 3, #ARGV do
+    wanted[ARGV[i]] = true
+end
+
+local total = 0
+local page = {}
+local types = redis.call('LRANGE', KEYS[2], 0, -1)
+for i, event_type in ipairs(types) do
+    if wanted[event_type] then
+        if total >= offset and (limit < 0 or #page < limit) then
+            page[#page + 1] = redis.call('LINDEX', KEYS[1], i - 1)
+        end
+        total = total + 1
+    end
+end
+return {total, page}
+"""
+
+
+__all__ = [
+    "ACQUIRE_LIMITS",
+    "CACHE_SET",
+    "DELETE_TASK",
+    "DEQUEUE_TASK",
+    "ENQUEUE_DEDUP",
+    "ENQUEUE_TASK",
+    "HAND_OVER_DEDUP",
+    "LIST_TASKS_PAGE",
+    "PAGE_EVENTS",
+    "PROMOTE_DELAYED",
+    "RECOVER_PROCESSING",
+    "RELEASE_DEDUP",
+    "REPLAY_DEAD_LETTER",
+    "REQUEUE_EXPIRED",
+    "STREAM_ENQUEUE_DEDUP",
+    "STREAM_ENQUEUE_TASK",
+    "STREAM_HAND_OVER_DEDUP",
+    "STREAM_PROMOTE_DELAYED",
+    "STREAM_RECOVER_PENDING",
+    "STREAM_REQUEUE_EXPIRED",
+    "UPDATE_TASK",
+]
@@ -0,0 +1,929 @@
+from __future__ import annotations
+
+import json
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Collection, Iterator, Mapping, Optional
+
+from .base import TERMINAL_STATUSES
+from .codec import Codec
+from .events import event_type, response_status_code
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    flow_id TEXT,
+    created REAL NOT NULL,
+    expires REAL NOT NULL,
+    fields BLOB NOT NULL,
+    response BLOB
+);
+CREATE INDEX IF NOT EXISTS tasks_created ON tasks (created, task_id);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, created, task_id);
+CREATE INDEX IF NOT EXISTS tasks_flow ON tasks (flow_id, created, task_id);
+CREATE INDEX IF NOT EXISTS tasks_expires ON tasks (expires);
+
+CREATE TABLE IF NOT EXISTS queue (
+    task_id TEXT PRIMARY KEY,
+    lane TEXT NOT NULL,
+    flow_id TEXT NOT NULL,
+    position REAL NOT NULL,
+    state TEXT NOT NULL,
+    due REAL,
+    owner TEXT
+);
+CREATE INDEX IF NOT EXISTS queue_ready ON queue (state, lane, flow_id, position);
+CREATE INDEX IF NOT EXISTS queue_due ON queue (state, due);
+CREATE INDEX IF NOT EXISTS queue_owner ON queue (owner);
+CREATE INDEX IF NOT EXISTS queue_position ON queue (position);
+
+CREATE TABLE IF NOT EXISTS flow_turns (
+    lane TEXT NOT NULL,
+    flow_id TEXT NOT NULL,
+    turn INTEGER NOT NULL,
+    PRIMARY KEY (lane, flow_id)
+);
+CREATE INDEX IF NOT EXISTS flow_turns_turn ON flow_turns (lane, turn);
+
+CREATE TABLE IF NOT EXISTS lane_credits (
+    lane TEXT PRIMARY KEY,
+    credit INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS dedup (
+    dedup_key TEXT PRIMARY KEY,
+    task_id TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS followers (
+    leader_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS followers_leader ON followers (leader_id);
+
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_task ON events (task_id, id);
+
+CREATE TABLE IF NOT EXISTS parsed_events (
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    event TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (task_id, idx)
+);
+CREATE INDEX IF NOT EXISTS parsed_events_type ON parsed_events (task_id, type, idx);
+
+CREATE TABLE IF NOT EXISTS dead_letters (
+    task_id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dead_letters_created ON dead_letters (created);
+
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    stats TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+
+class SqliteQueueConnector:
+    """Хранилище очереди на встроенной базе SQLite для развёртывания на одном хосте.
+
+    Синхронная реализация, которую AsyncSqliteQueueConnector выполняет в
+    отдельном потоке; напрямую из event loop её не вызывают.
+
+    API и воркеры, работающие на одной машине, используют общий файл базы в
+    режиме WAL: читатели не блокируют писателя, а каждая операция - локальный
+    вызов без сетевого round-trip. path=":memory:" держит очередь в памяти
+    процесса, что удобно для изолированных тестов API и воркера.
+
+    Семантика совпадает с коннектором Redis: записи задач с TTL, индексированный
+    постраничный список (по времени создания, статусу и flow_id), дорожки
+    приоритета со взвешенным round-robin и обслуживанием flow по кругу, надёжный
+    режим с таймаутом видимости, отложенные задачи, объединение одинаковых
+    запросов, потоки событий и разобранные события. Записи с истёкшим TTL
+    удаляются периодически из promote_delayed(), который регулярно вызывает воркер.
+
+    Блокирующие ожидания (dequeue с таймаутом, чтение событий) внутри процесса
+    просыпаются сразу после записи, а изменения из других процессов замечают
+    с задержкой не более poll_interval.
+    """
+
+    # Через сколько секунд без обновления статистика воркера считается устаревшей
+    worker_stats_ttl = 60
+
+    # Как часто вычищать записи с истёкшим TTL, в секундах
+    purge_interval = 60
+
+    # Дорожки приоритета и их веса по умолчанию; первая - дорожка по умолчанию
+    default_lanes = {"interactive": 10, "batch": 1}
+
+    def __init__(
+        self,
+        *,
+        path: str = "langflow_queue.db",
+        ttl_seconds: int = 60 * 60 * 24,
+        reliable: bool = False,
+        visibility_timeout: int = 15 * 60,
+        worker_id: Optional[str] = None,
+        dedup_ttl: int = 15 * 60,
+        lanes: Optional[Mapping[str, int]] = None,
+        codec: Optional[Codec] = None,
+        poll_interval: float = 0.05,
+    ) -> None:
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.reliable = reliable
+        self.visibility_timeout = visibility_timeout
+        # Должен быть стабильным между перезапусками воркера, иначе
+        # recover_processing() не найдёт задачи, оставшиеся от прошлого запуска
+        self.worker_id = worker_id or socket.gethostname()
+        self.dedup_ttl = dedup_ttl
+        self.lanes = dict(lanes or self.default_lanes)
+        if any(weight < 1 for weight in self.lanes.values()):
+            raise ValueError("Lane weights must be positive integers")
+        self.default_lane = next(iter(self.lanes))
+        self.codec = codec or Codec()
+        self.poll_interval = poll_interval
+
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        self._purged_at = 0.0
+        # Транзакции открываются явно (BEGIN IMMEDIATE), чтобы запись из
+        # нескольких процессов не упиралась в повышение блокировки чтения
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            self._changed.notify_all()
+
+    def _wait_changed(self, timeout: float) -> None:
+        with self._changed:
+            self._changed.wait(min(timeout, self.poll_interval))
+
+    def _assign_lane(self, task_record: dict) -> str:
+        lane = task_record.get("priority") or self.default_lane
+        if lane not in self.lanes:
+            raise ValueError(f"Unknown priority: {lane}")
+        task_record["priority"] = lane
+        return lane
+
+    @staticmethod
+    def _created_score(task_record: dict) -> float:
+        created_at = (task_record.get("request") or {}).get("created_at")
+        try:
+            return datetime.fromisoformat(created_at).timestamp()
+        except (TypeError, ValueError):
+            return time.time()
+
+    def _insert_task(self, conn: sqlite3.Connection, task_record: dict) -> None:
+        fields = dict(task_record)
+        response = fields.pop("response", None)
+        conn.execute(
+            "INSERT OR REPLACE INTO tasks (task_id, status, flow_id, created, expires, fields, response)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                task_record["task_id"],
+                task_record.get("status") or "pending",
+                task_record.get("flow_id"),
+                self._created_score(task_record),
+                time.time() + self.ttl_seconds,
+                self.codec.dumps_field(fields),
+                None if response is None else self.codec.dumps(response),
+            ),
+        )
+
+    def _record(self, row: Optional[tuple], include_response: bool) -> Optional[dict]:
+        """Собирает запись задачи из строки (fields, response) таблицы tasks."""
+        if row is None:
+            return None
+        record = self.codec.loads_field(row[0])
+        if include_response:
+            record["response"] = None if row[1] is None else self.codec.loads(row[1])
+        else:
+            record.pop("response", None)
+        return record
+
+    def _push_task(self, conn: sqlite3.Connection, task_id: str, lane: str, flow_id: str, to_head: bool) -> None:
+        """Ставит задачу в дорожку: в конец (или голову) очереди её flow и кольца flow."""
+        if to_head:
+            position = conn.execute("SELECT COALESCE(MIN(position), 0) - 1 FROM queue").fetchone()[0]
+            turn_sql = "SELECT COALESCE(MIN(turn), 0) - 1 FROM flow_turns WHERE lane = ?"
+        else:
+            position = conn.execute("SELECT COALESCE(MAX(position), 0) + 1 FROM queue").fetchone()[0]
+            turn_sql = "SELECT COALESCE(MAX(turn), 0) + 1 FROM flow_turns WHERE lane = ?"
+        conn.execute(
+            "INSERT OR REPLACE INTO queue (task_id, lane, flow_id, position, state, due, owner)"
+            " VALUES (?, ?, ?, ?, 'ready', NULL, NULL)",
+            (task_id, lane, flow_id, position),
+        )
+        # Flow, уже стоящий в кольце, сохраняет своё место
+        conn.execute(
+            f"INSERT OR IGNORE INTO flow_turns (lane, flow_id, turn) VALUES (?, ?, ({turn_sql}))",
+            (lane, flow_id, lane),
+        )
+
+    def _requeue(self, conn: sqlite3.Connection, task_ids: list[str]) -> None:
+        """Возвращает задачи в голову очереди их flow (в обратном порядке, чтобы первая оказалась первой)."""
+        for task_id in reversed(task_ids):
+            lane, flow_id = conn.execute("SELECT lane, flow_id FROM queue WHERE task_id = ?", (task_id,)).fetchone()
+            self._push_task(conn, task_id, lane, flow_id, True)
+
+    def _pick_lane(self, conn: sqlite3.Connection) -> Optional[str]:
+        """Выбирает дорожку плавным взвешенным round-robin среди непустых дорожек."""
+        active = {
+            lane for (lane,) in conn.execute("SELECT DISTINCT lane FROM queue WHERE state = 'ready'") if lane in self.lanes
+        }
+        credits = dict(conn.execute("SELECT lane, credit FROM lane_credits").fetchall())
+        conn.execute("DELETE FROM lane_credits")
+        if not active:
+            return None
+        total = sum(self.lanes[lane] for lane in active)
+        current = {lane: credits.get(lane, 0) + self.lanes[lane] for lane in self.lanes if lane in active}
+        best = max(current, key=lambda lane: current[lane])
+        current[best] -= total
+        conn.executemany("INSERT INTO lane_credits (lane, credit) VALUES (?, ?)", current.items())
+        return best
+
+    def _pop_task(self, conn: sqlite3.Connection) -> Optional[str]:
+        lane = self._pick_lane(conn)
+        if lane is None:
+            return None
+        row = conn.execute(
+            "SELECT q.task_id, q.flow_id FROM queue q"
+            " JOIN flow_turns t ON t.lane = q.lane AND t.flow_id = q.flow_id"
+            " WHERE q.state = 'ready' AND q.lane = ?"
+            " ORDER BY t.turn, q.position LIMIT 1",
+            (lane,),
+        ).fetchone()
+        if row is None:
+            # Кольцо flow разошлось с очередью: восстанавливаем его
+            conn.execute(
+                "INSERT OR IGNORE INTO flow_turns (lane, flow_id, turn)"
+                " SELECT lane, flow_id, 0 FROM queue WHERE state = 'ready' AND lane = ?",
+                (lane,),
+            )
+            return None
+        task_id, flow_id = row
+
+        if self.reliable:
+            conn.execute(
+                "UPDATE queue SET state = 'processing', due = ?, owner = ? WHERE task_id = ?",
+                (time.time() + self.visibility_timeout, self.worker_id, task_id),
+            )
+        else:
+            conn.execute("DELETE FROM queue WHERE task_id = ?", (task_id,))
+        # Обслуженный flow уходит в конец кольца или покидает его, если задач больше нет
+        if conn.execute(
+            "SELECT 1 FROM queue WHERE state = 'ready' AND lane = ? AND flow_id = ? LIMIT 1", (lane, flow_id)
+        ).fetchone():
+            conn.execute(
+                "UPDATE flow_turns SET turn = (SELECT MAX(turn) + 1 FROM flow_turns WHERE lane = ?)"
+                " WHERE lane = ? AND flow_id = ?",
+                (lane, lane, flow_id),
+            )
+        else:
+            conn.execute("DELETE FROM flow_turns WHERE lane = ? AND flow_id = ?", (lane, flow_id))
+        return task_id
+
+    def _purge_expired(self, conn: sqlite3.Connection) -> None:
+        now = time.time()
+        if now - self._purged_at < self.purge_interval:
+            return
+        self._purged_at = now
+        for table in ("tasks", "events", "parsed_events", "dedup", "followers", "dead_letters"):
+            conn.execute(f"DELETE FROM {table} WHERE expires < ?", (now,))
+        conn.execute("DELETE FROM workers WHERE updated < ?", (now - self.worker_stats_ttl,))
+
+    def _update_task(
+        self, conn: sqlite3.Connection, task_id: str, updates: dict, unless_status: Collection[str] = ()
+    ) -> bool:
+        """Обновляет запись, если она есть и её статус не входит в unless_status."""
+        blocked = tuple(unless_status)
+        row = conn.execute(
+            "SELECT fields FROM tasks WHERE task_id = ? AND expires >= ?"
+            f" AND status NOT IN ({', '.join('?' * len(blocked))})",
+            (task_id, time.time(), *blocked),
+        ).fetchone()
+        if row is None:
+            return False
+        fields = self.codec.loads_field(row[0])
+        values = dict(updates)
+        if "response" in values:
+            response = values.pop("response")
+            conn.execute(
+                "UPDATE tasks SET response = ? WHERE task_id = ?",
+                (None if response is None else self.codec.dumps(response), task_id),
+            )
+        fields.update(values)
+        conn.execute(
+            "UPDATE tasks SET fields = ?, status = ?, expires = ? WHERE task_id = ?",
+            (
+                self.codec.dumps_field(fields),
+                fields.get("status") or "pending",
+                time.time() + self.ttl_seconds,
+                task_id,
+            ),
+        )
+        return True
+
+    def _delay(self, conn: sqlite3.Connection, task_id: str, due: float) -> None:
+        """Переводит задачу в отложенные до момента due, снимая её с обработки."""
+        row = conn.execute("SELECT fields, NULL FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        record = self._record(row, False) or {}
+        conn.execute(
+            "INSERT OR REPLACE INTO queue (task_id, lane, flow_id, position, state, due, owner)"
+            " VALUES (?, ?, ?, 0, 'delayed', ?, NULL)",
+            (task_id, record.get("priority") or self.default_lane, record.get("flow_id") or "", due),
+        )
+
+    @staticmethod
+    def _replay_fields() -> dict:
+        """Поля записи, сбрасываемые при повторном запуске задачи из очереди недоставленных."""
+        return {
+            "status": "pending",
+            "attempts": 0,
+            "error": None,
+            "deadline": None,
+            "retry_at": None,
+            "events_summary": None,
+            "replayed_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+    def _append_event(self, conn: sqlite3.Connection, task_id: str, kind: str, value: str) -> str:
+        cursor = conn.execute(
+            "INSERT INTO events (task_id, kind, value, expires) VALUES (?, ?, ?, ?)",
+            (task_id, kind, value, time.time() + self.ttl_seconds),
+        )
+        return str(cursor.lastrowid)
+
+    def _store_parsed_events(
+        self,
+        conn: sqlite3.Connection,
+        task_id: str,
+        events: list,
+        status_code: Optional[int] = None,
+    ) -> dict:
+        """Сохраняет разобранные события задачи. Returns: сводка для поля events_summary."""
+        expires = time.time() + self.ttl_seconds
+        types = [event_type(event) for event in events]
+        conn.execute("DELETE FROM parsed_events WHERE task_id = ?", (task_id,))
+        conn.executemany(
+            "INSERT INTO parsed_events (task_id, idx, type, event, expires) VALUES (?, ?, ?, ?, ?)",
+            (
+                (task_id, idx, name, json.dumps(event, ensure_ascii=False), expires)
+                for idx, (name, event) in enumerate(zip(types, events))
+            ),
+        )
+        counts: dict[str, int] = {}
+        for name in types:
+            counts[name] = counts.get(name, 0) + 1
+        return {"count": len(events), "types": counts, "status_code": status_code}
+
+    @staticmethod
+    def _event_id(last_event_id: str) -> int:
+        try:
+            return int(str(last_event_id).split("-", 1)[0])
+        except ValueError:
+            return 0
+
+    def _enqueue(self, conn: sqlite3.Connection, task_record: dict, dedup_key: Optional[str]) -> None:
+        task_id = task_record["task_id"]
+        leader_task_id = None
+        if dedup_key:
+            task_record["dedup_key"] = dedup_key
+            now = time.time()
+            conn.execute("DELETE FROM dedup WHERE dedup_key = ? AND expires < ?", (dedup_key, now))
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO dedup (dedup_key, task_id, expires) VALUES (?, ?, ?)",
+                (dedup_key, task_id, now + self.dedup_ttl),
+            ).rowcount
+            if not inserted:
+                (leader_task_id,) = conn.execute(
+                    "SELECT task_id FROM dedup WHERE dedup_key = ?", (dedup_key,)
+                ).fetchone()
+                conn.execute(
+                    "INSERT INTO followers (leader_id, task_id, expires) VALUES (?, ?, ?)",
+                    (leader_task_id, task_id, now + self.dedup_ttl),
+                )
+                task_record["leader_task_id"] = leader_task_id
+        self._insert_task(conn, task_record)
+        if leader_task_id is None:
+            self._push_task(conn, task_id, task_record["priority"], task_record.get("flow_id") or "", False)
+
+    def enqueue(self, task_record: dict, *, dedup_key: Optional[str] = None) -> str:
+        """Сохраняет запись задачи и добавляет её в очередь одной транзакцией.
+
+        Задача ставится в дорожку из поля priority записи (по умолчанию - первую).
+        Если передан dedup_key и задача с тем же ключом уже ждёт или выполняется,
+        новая задача не ставится в очередь, а в запись добавляется leader_task_id.
+        """
+        return self.enqueue_many([task_record], dedup_keys=[dedup_key])[0]
+
+    def enqueue_many(self, task_records: list[dict], *, dedup_keys: Optional[list[Optional[str]]] = None) -> list[str]:
+        """Ставит несколько задач в очередь одной транзакцией.
+
+        dedup_keys, если переданы, соответствуют task_records по порядку.
+        Дорожки проверяются до записи: при неизвестной дорожке не ставится ни одна задача.
+        """
+        if dedup_keys is None:
+            dedup_keys = [None] * len(task_records)
+        if len(dedup_keys) != len(task_records):
+            raise ValueError("dedup_keys must have one entry per task record")
+        for task_record in task_records:
+            task_record.setdefault("status", "pending")
+            self._assign_lane(task_record)
+        if not task_records:
+            return []
+        with self._transaction() as conn:
+            for task_record, dedup_key in zip(task_records, dedup_keys):
+                self._enqueue(conn, task_record, dedup_key)
+        return [task_record["task_id"] for task_record in task_records]
+
+    def store_task(self, task_record: dict, *, events: Optional[list] = None) -> str:
+        """Сохраняет готовую запись задачи без постановки в очередь.
+
+        Если переданы events, они записываются в поток событий задачи вместе
+        с маркером конца и в разобранные события, как если бы задачу выполнил воркер.
+        """
+        task_id = task_record["task_id"]
+        with self._transaction() as conn:
+            if events is not None:
+                summary = self._store_parsed_events(
+                    conn, task_id, events, response_status_code(task_record.get("response"))
+                )
+                task_record = {**task_record, "events_summary": summary}
+                for event in events:
+                    self._append_event(conn, task_id, "event", json.dumps(event, ensure_ascii=False))
+                self._append_event(conn, task_id, "end", task_record.get("status") or "completed")
+            self._insert_task(conn, task_record)
+        return task_id
+
+    def get_task(self, task_id: str, *, include_response: bool = True) -> Optional[dict]:
+        with self._lock:
+            row = self.conn.execute(
+                f"SELECT fields, {'response' if include_response else 'NULL'} FROM tasks"
+                " WHERE task_id = ? AND expires >= ?",
+                (task_id, time.time()),
+            ).fetchone()
+        return self._record(row, include_response)
+
+    def get_tasks(self, task_ids: list[str], *, include_response: bool = True) -> list[Optional[dict]]:
+        """Читает несколько записей задач одним запросом; для отсутствующих - None."""
+        rows: dict[str, tuple] = {}
+        with self._lock:
+            # Ограничение SQLite на число параметров запроса
+            for start in range(0, len(task_ids), 500):
+                chunk = task_ids[start:start + 500]
+                rows.update(
+                    (row[0], row[1:])
+                    for row in self.conn.execute(
+                        f"SELECT task_id, fields, {'response' if include_response else 'NULL'} FROM tasks"
+                        f" WHERE task_id IN ({', '.join('?' * len(chunk))}) AND expires >= ?",
+                        (*chunk, time.time()),
+                    )
+                )
+        return [self._record(rows.get(task_id), include_response) for task_id in task_ids]
+
+    def list_tasks(
+        self,
+        *,
+        status: Optional[str] = None,
+        flow_id: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 50,
+        include_response: bool = True,
+    ) -> tuple[list[dict], Optional[str]]:
+        """Возвращает страницу задач (новые первыми) и курсор следующей страницы."""
+        where, params = ["expires >= ?"], [time.time()]
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        if flow_id:
+            where.append("flow_id = ?")
+            params.append(flow_id)
+        if cursor:
+            try:
+                raw_created, cursor_task_id = cursor.split(":", 1)
+                cursor_created = float(raw_created)
+            except ValueError:
+                raise ValueError(f"Invalid cursor: {cursor}") from None
+            where.append("(created < ? OR (created = ? AND task_id < ?))")
+            params.extend((cursor_created, cursor_created, cursor_task_id))
+
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT fields, {'response' if include_response else 'NULL'}, created, task_id FROM tasks"
+                f" WHERE {' AND '.join(where)} ORDER BY created DESC, task_id DESC LIMIT ?",
+                (*params, limit + 1),
+            ).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f"{rows[-1][2]!r}:{rows[-1][3]}"
+        return [self._record(row[:2], include_response) for row in rows], next_cursor
+
+    def update_task(self, task_id: str, updates: dict, *, unless_status: Collection[str] = ()) -> bool:
+        """Обновляет только переданные поля записи, если её статус не входит в unless_status."""
+        return bool(self.update_many([task_id], updates, unless_status=unless_status))
+
+    def update_many(
+        self, task_ids: list[str], updates: dict, *, unless_status: Collection[str] = ()
+    ) -> list[str]:
+        """Применяет одни и те же обновления к нескольким задачам одной транзакцией.
+
+        Возвращает id обновлённых задач.
+        """
+        if not task_ids or not updates:
+            return []
+        with self._transaction() as conn:
+            return [task_id for task_id in task_ids if self._update_task(conn, task_id, updates, unless_status)]
+
+    def release_dedup(self, dedup_key: str, task_id: str) -> list[str]:
+        """Снимает ведущую задачу с ключа объединения и возвращает id её ведомых задач."""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM dedup WHERE dedup_key = ? AND task_id = ?", (dedup_key, task_id))
+            followers = [
+                follower
+                for (follower,) in conn.execute(
+                    "SELECT task_id FROM followers WHERE leader_id = ? ORDER BY rowid", (task_id,)
+                )
+            ]
+            conn.execute("DELETE FROM followers WHERE leader_id = ?", (task_id,))
+        return followers
+
+    def hand_over_dedup(self, dedup_key: str, task_id: str) -> Optional[str]:
+        """Передаёт роль прерванной ведущей задачи первой незавершённой ведомой.
+
+        Новая ведущая задача ставится в голову своей дорожки, остальные ведомые
+        ждут уже её. Возвращает id новой ведущей задачи или None, если ждущих нет.
+        """
+        now = time.time()
+        terminal = tuple(TERMINAL_STATUSES)
+        with self._transaction() as conn:
+            waiting = conn.execute(
+                "SELECT tasks.task_id, tasks.fields FROM followers"
+                " JOIN tasks ON tasks.task_id = followers.task_id"
+                " WHERE followers.leader_id = ? AND tasks.expires >= ?"
+                f" AND tasks.status NOT IN ({', '.join('?' * len(terminal))})"
+                " ORDER BY followers.rowid",
+                (task_id, now, *terminal),
+            ).fetchall()
+            conn.execute("DELETE FROM followers WHERE leader_id = ?", (task_id,))
+            conn.execute("DELETE FROM dedup WHERE dedup_key = ? AND task_id = ?", (dedup_key, task_id))
+            if not waiting:
+                return None
+
+            leader_id = waiting[0][0]
+            conn.execute(
+                "INSERT OR IGNORE INTO dedup (dedup_key, task_id, expires) VALUES (?, ?, ?)",
+                (dedup_key, leader_id, now + self.dedup_ttl),
+            )
+            conn.executemany(
+                "INSERT INTO followers (leader_id, task_id, expires) VALUES (?, ?, ?)",
+                ((leader_id, follower, now + self.dedup_ttl) for follower, _ in waiting[1:]),
+            )
+            for follower, raw in waiting:
+                fields = self.codec.loads_field(raw)
+                if follower == leader_id:
+                    fields.pop("leader_task_id", None)
+                else:
+                    fields["leader_task_id"] = leader_id
+                conn.execute(
+                    "UPDATE tasks SET fields = ? WHERE task_id = ?", (self.codec.dumps_field(fields), follower)
+                )
+            record = self.codec.loads_field(waiting[0][1])
+            lane = record.get("priority") or self.default_lane
+            self._push_task(conn, leader_id, lane, record.get("flow_id") or "", True)
+        return leader_id
+
+    def dequeue(self, timeout: int = 0) -> Optional[dict]:
+        """Извлекает задачу из очереди. Возвращает None, если очередь пуста.
+
+        Args:
+            timeout: Таймаут блокировки в секундах. 0 означает неблокирующий режим.
+                    Если > 0, ждёт появления задачи в любой из дорожек.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._transaction() as conn:
+                task_id = self._pop_task(conn)
+                row = None
+                if task_id is not None:
+                    row = conn.execute(
+                        "SELECT fields, NULL FROM tasks WHERE task_id = ? AND expires >= ?", (task_id, time.time())
+                    ).fetchone()
+                    if row is None:
+                        # Запись истекла по TTL, пока задача ждала в очереди
+                        conn.execute("DELETE FROM queue WHERE task_id = ?", (task_id,))
+            if task_id is not None:
+                return self._record(row, False)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            self._wait_changed(remaining)
+
+    def queue_depths(self) -> dict[str, int]:
+        """Возвращает число задач, ожидающих в каждой дорожке очереди."""
+        with self._lock:
+            depths = dict(
+                self.conn.execute("SELECT lane, COUNT(*) FROM queue WHERE state = 'ready' GROUP BY lane").fetchall()
+            )
+        return {lane: depths.get(lane, 0) for lane in self.lanes}
+
+    def report_worker_stats(self, stats: dict) -> None:
+        """Публикует текущие показатели этого воркера (лимит параллелизма и т.п.)."""
+        now = time.time()
+        value = json.dumps({**stats, "updated_at": now}, ensure_ascii=False)
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO workers (worker_id, stats, updated) VALUES (?, ?, ?)",
+                (self.worker_id, value, now),
+            )
+
+    def worker_stats(self) -> dict[str, dict]:
+        """Возвращает последние показатели живых воркеров по их worker_id."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT worker_id, stats FROM workers WHERE updated >= ?", (time.time() - self.worker_stats_ttl,)
+            ).fetchall()
+        return {worker_id: json.loads(stats) for worker_id, stats in rows}
+
+    def ack(self, task_id: str) -> None:
+        """Подтверждает завершение обработки задачи (только в надёжном режиме)."""
+        if not self.reliable:
+            return
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM queue WHERE task_id = ? AND state = 'processing'", (task_id,))
+
+    def defer(self, task_id: str, delay: float) -> None:
+        """Откладывает извлечённую задачу на delay секунд и снимает её с обработки."""
+        with self._transaction() as conn:
+            self._delay(conn, task_id, time.time() + delay)
+
+    def promote_delayed(self, limit: int = 100) -> list[str]:
+        """Возвращает в очередь отложенные задачи, время которых наступило."""
+        with self._transaction() as conn:
+            self._purge_expired(conn)
+            due = [
+                task_id
+                for (task_id,) in conn.execute(
+                    "SELECT task_id FROM queue WHERE state = 'delayed' AND due <= ? ORDER BY due LIMIT ?",
+                    (time.time(), limit),
+                )
+            ]
+            self._requeue(conn, due)
+        return due
+
+    def reap_expired(self, limit: int = 100) -> list[str]:
+        """Возвращает в очередь задачи с истёкшим таймаутом видимости."""
+        with self._transaction() as conn:
+            expired = [
+                task_id
+                for (task_id,) in conn.execute(
+                    "SELECT task_id FROM queue WHERE state = 'processing' AND due < ? ORDER BY due LIMIT ?",
+                    (time.time(), limit),
+                )
+            ]
+            self._requeue(conn, expired)
+        return expired
+
+    def dead_letter(self, task_id: str) -> None:
+        """Переносит задачу, исчерпавшую повторные попытки, в очередь недоставленных."""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO dead_letters (task_id, created, expires) VALUES (?, ?, ?)",
+                (task_id, now, now + self.ttl_seconds),
+            )
+
+    def list_dead_letters(
+        self,
+        *,
+        offset: int = 0,
+        limit: int = 50,
+        include_response: bool = True,
+    ) -> tuple[list[dict], int]:
+        """Возвращает страницу недоставленных задач (новые первыми) и их общее число."""
+        now = time.time()
+        with self._lock:
+            task_ids = [
+                task_id
+                for (task_id,) in self.conn.execute(
+                    "SELECT task_id FROM dead_letters WHERE expires >= ? ORDER BY created DESC LIMIT ? OFFSET ?",
+                    (now, limit, offset),
+                )
+            ]
+            (total,) = self.conn.execute("SELECT COUNT(*) FROM dead_letters WHERE expires >= ?", (now,)).fetchone()
+        records = self.get_tasks(task_ids, include_response=include_response)
+        return [record for record in records if record is not None], total
+
+    def replay_dead_letter(self, task_id: str) -> bool:
+        """Снимает задачу из очереди недоставленных и снова ставит её в очередь.
+
+        Возвращает False, если задачи нет в очереди недоставленных.
+        """
+        with self._transaction() as conn:
+            if not conn.execute("DELETE FROM dead_letters WHERE task_id = ?", (task_id,)).rowcount:
+                return False
+            if not self._update_task(conn, task_id, {**self._replay_fields(), "response": None}):
+                return False
+            conn.execute("DELETE FROM events WHERE task_id = ?", (task_id,))
+            conn.execute("DELETE FROM parsed_events WHERE task_id = ?", (task_id,))
+            self._delay(conn, task_id, time.time())
+        return True
+
+    def list_archivable(
+        self,
+        statuses: Collection[str],
+        *,
+        older_than: float,
+        limit: int = 100,
+    ) -> list[dict]:
+        """Возвращает полные записи задач в статусах statuses, завершённых более older_than секунд назад.
+
+        Возраст считается от finished_at; задачи без него не возвращаются. Старые
+        задачи первыми. Задачи из очереди недоставленных не возвращаются: они ждут
+        разбора и повторного запуска.
+        """
+        statuses = list(statuses)
+        if not statuses:
+            return []
+        now = time.time()
+        cutoff = now - older_than
+        records: list[dict] = []
+        offset = 0
+        with self._lock:
+            # Задача, созданная давно, могла завершиться недавно: такие пропускаем и читаем дальше
+            while len(records) < limit:
+                rows = self.conn.execute(
+                    "SELECT fields, response FROM tasks"
+                    f" WHERE status IN ({', '.join('?' * len(statuses))}) AND created <= ? AND expires >= ?"
+                    " AND task_id NOT IN (SELECT task_id FROM dead_letters)"
+                    " ORDER BY created, task_id LIMIT ? OFFSET ?",
+                    (*statuses, cutoff, now, limit, offset),
+                ).fetchall()
+                records.extend(
+                    record
+                    for record in (self._record(row, True) for row in rows)
+                    if self._finished_before(record.get("finished_at"), cutoff)
+                )
+                if len(rows) < limit:
+                    break
+                offset += limit
+        return records[:limit]
+
+    @staticmethod
+    def _finished_before(finished_at: Optional[str], cutoff: float) -> bool:
+        """Завершилась ли задача раньше cutoff; задача без finished_at ещё не завершена окончательно."""
+        try:
+            return datetime.fromisoformat(finished_at).timestamp() <= cutoff
+        except (TypeError, ValueError):
+            return False
+
+    def delete_tasks(self, task_ids: list[str], *, statuses: Collection[str]) -> list[str]:
+        """Удаляет задачи со всеми их данными, если они всё ещё в одном из статусов statuses.
+
+        Возвращает id удалённых задач.
+        """
+        statuses = list(statuses)
+        deleted = []
+        with self._transaction() as conn:
+            for task_id in task_ids:
+                removed = conn.execute(
+                    f"DELETE FROM tasks WHERE task_id = ? AND status IN ({', '.join('?' * len(statuses))})"
+                    " AND task_id NOT IN (SELECT task_id FROM dead_letters)",
+                    (task_id, *statuses),
+                ).rowcount
+                if removed:
+                    conn.execute("DELETE FROM events WHERE task_id = ?", (task_id,))
+                    conn.execute("DELETE FROM parsed_events WHERE task_id = ?", (task_id,))
+                    deleted.append(task_id)
+        return deleted
+
+    def recover_processing(self) -> int:
+        """Возвращает в очередь задачи, числящиеся в обработке у этого воркера."""
+        with self._transaction() as conn:
+            task_ids = [
+                task_id
+                for (task_id,) in conn.execute(
+                    "SELECT task_id FROM queue WHERE state = 'processing' AND owner = ? ORDER BY position",
+                    (self.worker_id,),
+                )
+            ]
+            self._requeue(conn, task_ids)
+        return len(task_ids)
+
+    def append_event(self, task_id: str, event: Any) -> str:
+        """Добавляет событие выполнения в поток событий задачи. Возвращает id записи."""
+        with self._transaction() as conn:
+            return self._append_event(conn, task_id, "event", json.dumps(event, ensure_ascii=False))
+
+    def end_events(self, task_id: str, status: str) -> None:
+        """Закрывает поток событий задачи маркером конца с итоговым статусом."""
+        with self._transaction() as conn:
+            self._append_event(conn, task_id, "end", status)
+
+    def read_events(
+        self,
+        task_id: str,
+        last_event_id: str = "0",
+        *,
+        block_ms: Optional[int] = None,
+        count: int = 100,
+    ) -> list[tuple[str, dict]]:
+        """Читает события задачи, записанные после last_event_id."""
+        after = self._event_id(last_event_id)
+        deadline = time.monotonic() + (block_ms or 0) / 1000
+        while True:
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT id, kind, value FROM events WHERE task_id = ? AND id > ? ORDER BY id LIMIT ?",
+                    (task_id, after, count),
+                ).fetchall()
+            remaining = deadline - time.monotonic()
+            if rows or not block_ms or remaining <= 0:
+                break
+            self._wait_changed(remaining)
+
+        entries: list[tuple[str, dict]] = []
+        for entry_id, kind, value in rows:
+            if kind == "end":
+                entries.append((str(entry_id), {"end": value}))
+                continue
+            try:
+                event = json.loads(value)
+            except json.JSONDecodeError:
+                event = {"raw": value}
+            entries.append((str(entry_id), {"event": event}))
+        return entries
+
+    def store_events(self, task_id: str, events: list, *, status_code: Optional[int] = None) -> dict:
+        """Сохраняет разобранные события задачи, заменяя ранее сохранённые."""
+        with self._transaction() as conn:
+            return self._store_parsed_events(conn, task_id, events, status_code)
+
+    def get_events(
+        self,
+        task_id: str,
+        *,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        types: Optional[list[str]] = None,
+    ) -> tuple[list, int]:
+        """Читает страницу разобранных событий задачи."""
+        where, params = "task_id = ?", [task_id]
+        if types:
+            where += f" AND type IN ({', '.join('?' * len(types))})"
+            params.extend(types)
+        with self._lock:
+            (total,) = self.conn.execute(f"SELECT COUNT(*) FROM parsed_events WHERE {where}", params).fetchone()
+            rows = self.conn.execute(
+                f"SELECT event FROM parsed_events WHERE {where} ORDER BY idx LIMIT ? OFFSET ?",
+                (*params, -1 if limit is None else max(limit, 0), max(offset, 0)),
+            ).fetchall()
+        return [json.loads(event) for (event,) in rows], total
+
+    def ping(self) -> None:
+        """Проверяет доступность базы."""
+        with self._lock:
+            self.conn.execute("SELECT 1").fetchone()
+
+    def close(self) -> None:
+        """Закрывает соединение с базой."""
+        with self._lock:
+            self.conn.close()
+
+
+def create_sqlite_queue_connector(**settings: Any) -> SqliteQueueConnector:
+    return SqliteQueueConnector(**settings)
+
+
+__all__ = ["SqliteQueueConnector", "create_sqlite_queue_connector"]
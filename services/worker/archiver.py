@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Архиватор: переносит завершённые задачи из бэкенда очереди в архив на диске."""
+import asyncio
+import logging
+import os
+from typing import Any, Collection, Optional
+
+from langflow_queue.archive import TaskArchive
+from langflow_queue.base import TERMINAL_STATUSES
+from langflow_queue.factory import init_queue_connector, init_task_archive
+from langflow_queue.metrics import TASKS_ARCHIVED
+from prometheus_client import start_http_server
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATUSES = tuple(sorted(TERMINAL_STATUSES))
+
+
+async def archive_batch(
+    queue_connector,
+    archive: TaskArchive,
+    *,
+    statuses: Collection[str],
+    older_than: float,
+    batch_size: int,
+) -> tuple[int, int]:
+    """Архивирует одну пачку задач и удаляет их из бэкенда очереди.
+
+    Задача удаляется, только если она уже записана в архив и её статус не
+    изменился с момента чтения. Возвращает число прочитанных и перенесённых задач.
+    """
+    records = await queue_connector.list_archivable(statuses, older_than=older_than, limit=batch_size)
+    if not records:
+        return 0, 0
+    await asyncio.to_thread(archive.append, records)
+
+    task_ids = [record["task_id"] for record in records]
+    deleted = await queue_connector.delete_tasks(task_ids, statuses=statuses)
+    TASKS_ARCHIVED.inc(len(deleted))
+    deleted_ids = set(deleted)
+    kept = [task_id for task_id in task_ids if task_id not in deleted_ids]
+    if kept:
+        # Задачи, изменившиеся после чтения, остаются в бэкенде очереди и будут
+        # заархивированы позже; исчезнувшие по TTL остаются только в архиве
+        current = await queue_connector.get_tasks(kept, include_response=False)
+        await asyncio.to_thread(
+            archive.forget, [task_id for task_id, record in zip(kept, current) if record is not None]
+        )
+    return len(records), len(deleted)
+
+
+async def run_archiver(
+    queue_connector: Optional[Any] = None,
+    archive: Optional[TaskArchive] = None,
+    stop: Optional[asyncio.Event] = None,
+) -> None:
+    """Основной цикл архиватора: пачками переносит завершённые задачи старше ARCHIVE_AFTER_SECONDS.
+
+    Пока переносятся полные пачки, следующая берётся сразу, иначе архиватор
+    ждёт ARCHIVE_INTERVAL секунд. В один каталог архива должен писать один архиватор.
+    """
+    if archive is None:
+        archive = init_task_archive()
+        if archive is None:
+            raise RuntimeError("ARCHIVE_DIR is required to run the archiver")
+    if queue_connector is None:
+        queue_connector = init_queue_connector()
+    statuses = [
+        status.strip()
+        for status in os.getenv("ARCHIVE_STATUSES", ",".join(DEFAULT_STATUSES)).split(",")
+        if status.strip()
+    ]
+    older_than = float(os.getenv("ARCHIVE_AFTER_SECONDS", "300"))
+    batch_size = int(os.getenv("ARCHIVE_BATCH_SIZE", "100"))
+    interval = float(os.getenv("ARCHIVE_INTERVAL", "10"))
+
+    metrics_port = int(os.getenv("ARCHIVER_METRICS_PORT", "9101"))
+    if metrics_port > 0:
+        start_http_server(metrics_port)
+    logger.info(f"Archiver started: {archive.directory}, tasks {statuses} older than {older_than:.0f}s")
+
+    try:
+        while stop is None or not stop.is_set():
+            try:
+                read, archived = await archive_batch(
+                    queue_connector, archive, statuses=statuses, older_than=older_than, batch_size=batch_size
+                )
+            except Exception as e:
+                logger.error(f"Error archiving tasks: {e}", exc_info=True)
+                archived = 0
+            else:
+                if archived:
+                    logger.info(f"Archived {archived} of {read} tasks")
+            if archived < batch_size:
+                if stop is None:
+                    await asyncio.sleep(interval)
+                else:
+                    try:
+                        await asyncio.wait_for(stop.wait(), interval)
+                    except asyncio.TimeoutError:
+                        pass
+    finally:
+        await queue_connector.close()
+        archive.close()
+
+
+def main():
+    """Точка входа архиватора."""
+    try:
+        asyncio.run(run_archiver())
+    except KeyboardInterrupt:
+        logger.info("Archiver stopped by user")
+
+
+if __name__ == "__main__":
+    main()
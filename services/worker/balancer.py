@@ -0,0 +1,175 @@
+"""Балансировка запросов воркера между несколькими экземплярами Langflow."""
+import asyncio
+import hashlib
+import logging
+import random
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Collection, Optional
+
+import httpx
+
+from langflow_queue.metrics import LANGFLOW_BACKEND_HEALTHY, LANGFLOW_BACKEND_IN_FLIGHT
+
+logger = logging.getLogger(__name__)
+
+
+class LangflowBackend:
+    """Один экземпляр Langflow: свой пул keep-alive соединений и состояние здоровья."""
+
+    def __init__(self, url: str, client: httpx.AsyncClient) -> None:
+        self.url = url
+        self.client = client
+        self.in_flight = 0
+        # Подряд идущие ошибки соединения и 5xx; сбрасываются первым успешным ответом
+        self.failures = 0
+        # До какого момента (time.monotonic) экземпляр исключён пассивной проверкой
+        self.ejected_until = 0.0
+        # Результат последней активной проверки
+        self.check_passed = True
+
+    @property
+    def healthy(self) -> bool:
+        return self.check_passed and time.monotonic() >= self.ejected_until
+
+    def stats(self) -> dict:
+        return {"healthy": self.healthy, "in_flight": self.in_flight, "failures": self.failures}
+
+
+class LangflowBalancer:
+    """Выбирает экземпляр Langflow для каждого запроса воркера.
+
+    Обычный запрос уходит на исправный экземпляр с наименьшим числом
+    выполняемых этим воркером запросов (при равенстве - на случайный из них).
+    Запрос с ключом сессии всегда попадает на один и тот же исправный экземпляр
+    (rendezvous hashing): при исключении экземпляра переезжают только его сессии.
+    Запросы событий запуска (/api/v1/build/{job_id}/events) направляются на
+    экземпляр, который этот запуск создал, если воркер его помнит.
+
+    Экземпляр исключается из ротации пассивно - после failure_threshold ошибок
+    подряд на eject_seconds, и активно - пока не проходит проверку health_path.
+    Если исправных экземпляров не осталось, запросы распределяются между всеми:
+    лучше попытаться, чем гарантированно не выполнить задачу.
+    """
+
+    def __init__(
+        self,
+        backends: list[LangflowBackend],
+        *,
+        failure_threshold: int = 3,
+        eject_seconds: float = 30.0,
+        health_path: str = "/health",
+        health_timeout: float = 5.0,
+        job_routes_size: int = 10000,
+    ) -> None:
+        if not backends:
+            raise ValueError("At least one Langflow backend is required")
+        self.backends = backends
+        self.failure_threshold = failure_threshold
+        self.eject_seconds = eject_seconds
+        self.health_path = health_path
+        self.health_timeout = health_timeout
+        self._job_routes: OrderedDict[str, LangflowBackend] = OrderedDict()
+        self._job_routes_size = job_routes_size
+        for backend in backends:
+            LANGFLOW_BACKEND_HEALTHY.labels(backend.url).set_function(lambda b=backend: float(b.healthy))
+            LANGFLOW_BACKEND_IN_FLIGHT.labels(backend.url).set_function(lambda b=backend: b.in_flight)
+
+    @property
+    def key(self) -> str:
+        """Имя группы экземпляров для общих лимитов Langflow; для одного экземпляра - его адрес."""
+        return ",".join(sorted(backend.url for backend in self.backends))
+
+    def _available(self, exclude: Collection[LangflowBackend] = ()) -> list[LangflowBackend]:
+        candidates = [backend for backend in self.backends if backend not in exclude]
+        return [backend for backend in candidates if backend.healthy] or candidates
+
+    @staticmethod
+    def _weight(backend: LangflowBackend, session_id: str) -> bytes:
+        return hashlib.blake2b(f"{backend.url}\0{session_id}".encode(), digest_size=8).digest()
+
+    def pick(
+        self,
+        *,
+        session_id: Optional[str] = None,
+        job_id: Optional[str] = None,
+        exclude: Collection[LangflowBackend] = (),
+    ) -> Optional[LangflowBackend]:
+        """Выбирает экземпляр для запроса; None, если все экземпляры исключены через exclude."""
+        if job_id is not None:
+            backend = self._job_routes.get(job_id)
+            if backend is not None and backend not in exclude:
+                return backend
+        candidates = self._available(exclude)
+        if not candidates:
+            return None
+        if session_id:
+            return max(candidates, key=lambda backend: self._weight(backend, session_id))
+        least = min(backend.in_flight for backend in candidates)
+        return random.choice([backend for backend in candidates if backend.in_flight == least])
+
+    @asynccontextmanager
+    async def use(self, backend: LangflowBackend) -> AsyncIterator[httpx.AsyncClient]:
+        """Учитывает запрос к экземпляру как выполняемый, пока открыт контекст."""
+        backend.in_flight += 1
+        try:
+            yield backend.client
+        finally:
+            backend.in_flight -= 1
+
+    def record(self, backend: LangflowBackend, *, failed: bool) -> None:
+        """Учитывает результат запроса для пассивной проверки здоровья."""
+        if not failed:
+            backend.failures = 0
+            return
+        backend.failures += 1
+        if backend.failures >= self.failure_threshold and backend.healthy:
+            backend.ejected_until = time.monotonic() + self.eject_seconds
+            logger.warning(
+                f"Langflow backend {backend.url} ejected for {self.eject_seconds:.0f}s "
+                f"after {backend.failures} consecutive failures"
+            )
+
+    def remember_job(self, job_id: str, backend: LangflowBackend) -> None:
+        """Запоминает экземпляр, создавший запуск, для последующего чтения его событий."""
+        self._job_routes[job_id] = backend
+        self._job_routes.move_to_end(job_id)
+        while len(self._job_routes) > self._job_routes_size:
+            self._job_routes.popitem(last=False)
+
+    async def check(self, backend: LangflowBackend) -> None:
+        """Активная проверка: экземпляр исправен, если health_path отвечает 2xx."""
+        try:
+            response = await backend.client.get(self.health_path, timeout=self.health_timeout)
+            passed = response.is_success
+        except httpx.HTTPError:
+            passed = False
+        if passed != backend.check_passed:
+            logger.warning(f"Langflow backend {backend.url} is {'up' if passed else 'down'}")
+        backend.check_passed = passed
+        if passed and backend.failures >= self.failure_threshold:
+            # Экземпляр снова отвечает: не ждём окончания исключения
+            backend.failures = 0
+            backend.ejected_until = 0.0
+
+    async def run_health_checks(self, interval: float) -> None:
+        """Периодически проверяет все экземпляры."""
+        while True:
+            await asyncio.gather(*(self.check(backend) for backend in self.backends))
+            await asyncio.sleep(interval)
+
+    def stats(self) -> dict[str, dict]:
+        return {backend.url: backend.stats() for backend in self.backends}
+
+    async def aclose(self) -> None:
+        await asyncio.gather(*(backend.client.aclose() for backend in self.backends))
+
+    async def __aenter__(self) -> "LangflowBalancer":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+
+__all__ = ["LangflowBackend", "LangflowBalancer"]
@@ -0,0 +1,91 @@
+"""Адаптивный лимит числа задач, одновременно выполняемых воркером."""
+import asyncio
+import math
+
+
+class AdaptiveConcurrency:
+    """Лимит параллелизма, подстраивающийся под задержку ответов Langflow.
+
+    Работает как семафор (acquire/release), но его размер меняется после каждого
+    измерения (алгоритм градиента, как Gradient2 в Netflix concurrency-limits):
+
+    - долгосрочная средняя задержка служит базой "без очереди", краткосрочная -
+      текущей; пока текущая не превышает базу больше чем в tolerance раз, лимит
+      растёт примерно на sqrt(limit) за измерение, а при росте задержки
+      уменьшается пропорционально их отношению (но не больше чем вдвое);
+    - перегрузка (429, 5xx, таймаут) сразу уменьшает лимит в backoff раз;
+    - лимит не растёт, пока воркер не использует хотя бы половину текущего
+      лимита, иначе при простое он ушёл бы в max_limit.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int,
+        *,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        tolerance: float = 1.5,
+        smoothing: float = 0.2,
+        backoff: float = 0.9,
+        long_window: int = 100,
+        short_window: int = 10,
+    ) -> None:
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.backoff = backoff
+        self._long_alpha = 2 / (long_window + 1)
+        self._short_alpha = 2 / (short_window + 1)
+        self._estimate = float(min(max(initial_limit, min_limit), self.max_limit))
+        self._long_latency = 0.0
+        self._short_latency = 0.0
+        self.in_flight = 0
+        self._changed = asyncio.Event()
+
+    @property
+    def limit(self) -> int:
+        return int(self._estimate)
+
+    async def acquire(self) -> None:
+        """Ждёт, пока число выполняемых задач станет меньше текущего лимита."""
+        while self.in_flight >= self.limit:
+            self._changed.clear()
+            await self._changed.wait()
+        self.in_flight += 1
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._changed.set()
+
+    def record(self, latency: float, *, overloaded: bool = False) -> None:
+        """Учитывает результат запроса к Langflow и пересчитывает лимит."""
+        if overloaded:
+            self._estimate = max(self.min_limit, self._estimate * self.backoff)
+            return
+
+        if self._long_latency == 0.0:
+            self._long_latency = self._short_latency = latency
+        self._short_latency += self._short_alpha * (latency - self._short_latency)
+        self._long_latency += self._long_alpha * (latency - self._long_latency)
+        if self._short_latency <= 0:
+            return
+
+        gradient = max(0.5, min(1.0, self.tolerance * self._long_latency / self._short_latency))
+        # Запас на рост очереди: при неизменной задержке лимит продолжает расти
+        headroom = math.sqrt(self._estimate) if gradient >= 1.0 else 0.0
+        target = self._estimate * gradient + headroom
+        if target > self._estimate and self.in_flight < self._estimate / 2:
+            return
+        estimate = self._estimate * (1 - self.smoothing) + target * self.smoothing
+        self._estimate = min(self.max_limit, max(self.min_limit, estimate))
+
+        # Если задержка резко упала (например, в Ollama загружена модель поменьше),
+        # база быстрее опускается к ней, чтобы следующий рост задержки был заметен сразу
+        if self._long_latency / self._short_latency > 2:
+            self._long_latency *= 0.95
+
+        self._changed.set()
+
+
+__all__ = ["AdaptiveConcurrency"]
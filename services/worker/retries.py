@@ -0,0 +1,72 @@
+"""Политика повторных попыток задач после временных ошибок Langflow."""
+import random
+from typing import Iterable, Optional
+
+import httpx
+
+# Ошибки, после которых запрос заведомо не дошёл до выполнения flow
+DEFAULT_STATUS_CODES = (429, 503)
+DEFAULT_EXCEPTIONS = ("ConnectError", "ConnectTimeout", "PoolTimeout")
+
+
+class RetryPolicy:
+    """Решает, повторять ли задачу после ошибки, и через сколько секунд.
+
+    Повторяются ответы с кодами из status_codes и ошибки запроса, тип которых
+    является одним из exceptions (имена классов httpx, с учётом наследования:
+    NetworkError покрывает ConnectError, ReadError и т.п.). Задержка перед
+    попыткой n выбирается случайно из [0, min(max_delay, base_delay * 2^(n-1))]
+    (full jitter): после сбоя Langflow повторы многих задач растягиваются во
+    времени, а не возвращаются одной волной. Заголовок Retry-After ответа
+    задаёт нижнюю границу задержки.
+
+    Набор по умолчанию включает только ошибки, после которых flow заведомо не
+    запускался: отказ в соединении, таймаут соединения или ожидания пула и
+    ответы 429/503. Таймаут чтения, обрыв ответа и 500/502/504 не доказывают,
+    что Langflow ничего не выполнил, поэтому повтор неидемпотентного flow
+    после них может выполнить его дважды; их стоит добавлять явно.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_retries: int = 3,
+        status_codes: Iterable[int] = DEFAULT_STATUS_CODES,
+        exceptions: Iterable[str] = DEFAULT_EXCEPTIONS,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ) -> None:
+        self.max_retries = max_retries
+        self.status_codes = frozenset(status_codes)
+        self.exceptions = tuple(self._exception_type(name) for name in exceptions)
+        self.base_delay = base_delay
+        self.max_delay = max(max_delay, base_delay)
+
+    @staticmethod
+    def _exception_type(name: str) -> type:
+        exception = getattr(httpx, name, None)
+        if not (isinstance(exception, type) and issubclass(exception, Exception)):
+            raise ValueError(f"Unknown httpx exception: {name}")
+        return exception
+
+    def is_retryable(self, response_data: dict) -> bool:
+        """Признак временной ошибки в результате запроса к Langflow."""
+        exception = getattr(httpx, response_data.get("exception") or "", None)
+        if isinstance(exception, type) and issubclass(exception, self.exceptions):
+            return True
+        return response_data.get("status_code") in self.status_codes and "error" in response_data
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Задержка перед попыткой номер attempt (первый повтор - 1), в секундах."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if retry_after:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+def retry_reason(response_data: dict) -> str:
+    """Причина повтора для метрик: тип ошибки запроса или код ответа."""
+    return str(response_data.get("exception") or response_data.get("status_code") or "error")
+
+
+__all__ = ["DEFAULT_EXCEPTIONS", "DEFAULT_STATUS_CODES", "RetryPolicy", "retry_reason"]
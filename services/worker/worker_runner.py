@@ -1,10 +1,35 @@
 #!/usr/bin/env python3
 """Воркер, который извлекает задачи из очереди Redis и обрабатывает их."""
+import asyncio
+import json
 import os
 import logging
+import re
 import httpx
+import time
+from dataclasses import dataclass
 from datetime import datetime, timezone
-from langflow_queue.factory import init_queue_connector
+from typing import Any, Awaitable, Callable, Optional
+from langflow_queue.base import TERMINAL_STATUSES
+from langflow_queue.cache import ResultCache
+from langflow_queue.events import parse_event_text, response_text
+from langflow_queue.factory import init_langflow_limiter, init_queue_connector, init_result_cache
+from langflow_queue.limits import LangflowLimiter
+from langflow_queue.metrics import (
+    LANGFLOW_CALL,
+    QUEUE_WAIT,
+    TASK_DURATION,
+    TASKS_FINISHED,
+    TASKS_RETRIED,
+    WORKER_CONCURRENCY_LIMIT,
+    WORKER_IN_FLIGHT,
+    observe_redis,
+    seconds_between,
+)
+from prometheus_client import start_http_server
+from balancer import LangflowBackend, LangflowBalancer
+from concurrency import AdaptiveConcurrency
+from retries import DEFAULT_EXCEPTIONS, DEFAULT_STATUS_CODES, RetryPolicy, retry_reason
 
 logging.basicConfig(
     level=logging.INFO,
@@ -14,136 +39,865 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def process_task(task_record: dict, queue_connector) -> dict:
-    """Обрабатывает задачу, выполняя HTTP запрос к API Langflow"""
+@dataclass
+class WorkerContext:
+    """Общие для всех задач воркера зависимости."""
+
+    queue_connector: Any
+    balancer: LangflowBalancer
+    result_cache: Optional[ResultCache] = None
+    limiter: Optional[LangflowLimiter] = None
+    concurrency: Optional[AdaptiveConcurrency] = None
+    # Как часто перечитывать запись выполняемой задачи в поисках отмены, в секундах;
+    # обычно об отмене сообщает уведомление о смене статуса, не дожидаясь перечитывания
+    cancel_check_interval: float = 5.0
+    # Повторы задач после временных ошибок Langflow; None - ошибки не повторяются
+    retry_policy: Optional[RetryPolicy] = None
+    # flow_id, запуски которых с одной сессией должны попадать на один экземпляр Langflow;
+    # "*" - все flow
+    sticky_flows: frozenset[str] = frozenset()
+
+
+class TaskAborted(Exception):
+    """Выполнение задачи прервано: её отменили или истёк её дедлайн."""
+
+    def __init__(self, status: str) -> None:
+        super().__init__(status)
+        self.status = status
+
+
+def create_http_client(langflow_url: str, concurrency: int) -> httpx.AsyncClient:
+    """Создаёт долгоживущий HTTP клиент с пулом keep-alive соединений к экземпляру Langflow."""
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("LANGFLOW_MAX_CONNECTIONS", str(concurrency))),
+        max_keepalive_connections=int(
+            os.getenv("LANGFLOW_MAX_KEEPALIVE_CONNECTIONS", str(concurrency))
+        ),
+        keepalive_expiry=float(os.getenv("LANGFLOW_KEEPALIVE_EXPIRY", "30")),
+    )
+    timeout = float(os.getenv("LANGFLOW_TIMEOUT", "300"))
+    return httpx.AsyncClient(base_url=langflow_url, timeout=timeout, limits=limits)
+
+
+def init_langflow_balancer(concurrency: int) -> LangflowBalancer:
+    """Создаёт балансировщик по экземплярам Langflow из LANGFLOW_URLS (или LANGFLOW_URL).
+
+    У каждого экземпляра свой пул соединений на concurrency соединений.
+    """
+    urls = os.getenv("LANGFLOW_URLS") or os.getenv("LANGFLOW_URL", "http://langflow:7860")
+    backends = [
+        LangflowBackend(url, create_http_client(url, concurrency))
+        for url in dict.fromkeys(url.strip().rstrip("/") for url in urls.split(","))
+        if url
+    ]
+    return LangflowBalancer(
+        backends,
+        failure_threshold=max(1, int(os.getenv("LANGFLOW_FAILURE_THRESHOLD", "3"))),
+        eject_seconds=float(os.getenv("LANGFLOW_EJECT_SECONDS", "30")),
+        health_path=os.getenv("LANGFLOW_HEALTH_PATH", "/health"),
+    )
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _mark(timings: Optional[dict], name: str) -> None:
+    """Запоминает первый момент наступления этапа выполнения задачи."""
+    if timings is not None:
+        timings.setdefault(name, _now())
+
+
+async def process_task(task_record: dict, client: httpx.AsyncClient, timings: Optional[dict] = None) -> dict:
+    """Обрабатывает задачу, выполняя HTTP запрос к API Langflow.
+
+    В timings записывается first_byte_at - момент получения заголовков ответа.
+    """
     request = task_record.get("request", {})
     method = request.get("method", "POST").upper()
     endpoint = request.get("endpoint", "")
     payload = request.get("payload", {})
     task_id = task_record.get("task_id")
-    
-    langflow_url = os.getenv("LANGFLOW_URL", "http://langflow:7860")
-    langflow_url = langflow_url.rstrip("/")
-    
-    full_url = f"{langflow_url}{endpoint}"
-    
+
     logger.info(f"Processing task {task_id}", extra={"task_id": task_id})
-    logger.debug(f"Request details: method={method}, url={full_url}, payload={payload}", extra={"task_id": task_id})
-    
+    logger.debug(f"Request details: method={method}, url={client.base_url}{endpoint}, payload={payload}", extra={"task_id": task_id})
+
     try:
-        with httpx.Client(timeout=300.0) as client:
-            match method:
-                case "POST":
-                    body_data = payload.get("body", {})
-                    query_params = payload.get("query_params", {})
-                    response = client.post(
-                        full_url,
-                        json=body_data,
-                        params=query_params,
-                    )
-                case "GET":
-                    query_params = payload.get("query_params", payload)
-                    response = client.get(
-                        full_url,
-                        params=query_params,
-                    )
-                case _:
-                    return {"error": f"Unsupported HTTP method: {method}"}
-            
-            response.raise_for_status()
-            
-            try:
-                response_data = response.json()
-            except Exception:
-                response_data = {"text": response.text}
-            
-            logger.info(
-                f"Task {task_id} completed: status={response.status_code}",
-                extra={"task_id": task_id, "status_code": response.status_code}
-            )
-            logger.debug(f"Response data: {response_data}", extra={"task_id": task_id})
-            
-            return {
-                "status_code": response.status_code,
-                "data": response_data,
-            }
-            
-    except httpx.HTTPStatusError as e:
+        match method:
+            case "POST":
+                body_data = payload.get("body", {})
+                query_params = payload.get("query_params", {})
+                http_request = client.build_request(
+                    "POST",
+                    endpoint,
+                    json=body_data,
+                    params=query_params,
+                )
+            case "GET":
+                query_params = payload.get("query_params", payload)
+                http_request = client.build_request(
+                    "GET",
+                    endpoint,
+                    params=query_params,
+                )
+            case _:
+                return {"error": f"Unsupported HTTP method: {method}"}
+
+        response = await client.send(http_request, stream=True)
+        try:
+            _mark(timings, "first_byte_at")
+            await response.aread()
+        finally:
+            await response.aclose()
+
+        response.raise_for_status()
+
+        try:
+            response_data = response.json()
+        except Exception:
+            response_data = {"text": response.text}
+
+        logger.info(
+            f"Task {task_id} completed: status={response.status_code}",
+            extra={"task_id": task_id, "status_code": response.status_code}
+        )
+        logger.debug(f"Response data: {response_data}", extra={"task_id": task_id})
+
+        return {
+            "status_code": response.status_code,
+            "data": response_data,
+        }
+
+    except Exception as e:
+        return _request_error(task_id, e)
+
+
+def _request_error(task_id: str, e: Exception) -> dict:
+    """Логирует ошибку запроса к Langflow и возвращает её в виде результата задачи."""
+    if isinstance(e, httpx.HTTPStatusError):
         error_msg = f"HTTP {e.response.status_code}: {e.response.text}"
         logger.error(
             f"HTTP error for task {task_id}: {error_msg}",
             extra={"task_id": task_id, "status_code": e.response.status_code},
             exc_info=True
         )
-        return {
+        result = {
             "status_code": e.response.status_code,
             "error": error_msg,
         }
+        retry_after = _retry_after(e.response)
+        if retry_after is not None:
+            result["retry_after"] = retry_after
+        return result
+
+    if isinstance(e, httpx.TimeoutException):
+        logger.error(
+            f"Timeout for task {task_id}: {e!r}",
+            extra={"task_id": task_id},
+        )
+        return {
+            "error": f"Timeout: {e!r}",
+            "exception": type(e).__name__,
+            "timeout": True,
+        }
+
+    error_msg = str(e)
+    logger.error(
+        f"Error making request for task {task_id}: {error_msg}",
+        extra={"task_id": task_id},
+        exc_info=True
+    )
+    return {
+        "error": error_msg,
+        "exception": type(e).__name__,
+    }
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Задержка из заголовка Retry-After в секундах; дата вместо числа не поддерживается."""
+    try:
+        return max(float(response.headers["Retry-After"]), 0.0)
+    except (KeyError, ValueError):
+        return None
+
+
+def _is_overload(response_data: dict) -> bool:
+    """Признак того, что Langflow не справляется с нагрузкой: 429, 5xx или таймаут."""
+    status_code = response_data.get("status_code") or 0
+    return bool(response_data.get("timeout")) or status_code == 429 or status_code >= 500
+
+
+def _is_backend_failure(response_data: dict) -> bool:
+    """Признак неисправности экземпляра Langflow: ошибка соединения или 502/503/504."""
+    exception = getattr(httpx, response_data.get("exception") or "", None)
+    if isinstance(exception, type) and issubclass(exception, httpx.TransportError):
+        return True
+    return response_data.get("status_code") in (502, 503, 504)
+
+
+_EVENTS_ENDPOINT = re.compile(r"^/api/v1/build/([^/]+)/events$")
+
+
+def _events_job_id(task_record: dict) -> Optional[str]:
+    """job_id запуска, события которого читает задача, или None для других запросов."""
+    match = _EVENTS_ENDPOINT.match(task_record.get("request", {}).get("endpoint", ""))
+    return match.group(1) if match else None
+
+
+def _session_id(task_record: dict, sticky_flows: frozenset[str]) -> Optional[str]:
+    """Ключ сессии запуска flow, если flow требует закрепления сессии за экземпляром Langflow."""
+    flow_id = task_record.get("flow_id")
+    if not flow_id or not ({flow_id, "*"} & sticky_flows):
+        return None
+    payload = task_record.get("request", {}).get("payload", {})
+    body = payload.get("body") or {}
+    inputs = body.get("inputs") if isinstance(body.get("inputs"), dict) else {}
+    session_id = inputs.get("session") or body.get("session_id") or payload.get("query_params", {}).get("session_id")
+    return str(session_id) if session_id else None
+
+
+def _event_delivery(task_record: dict) -> str | None:
+    payload = task_record.get("request", {}).get("payload", {})
+    value = payload.get("query_params", {}).get("event_delivery")
+    return value[-1] if isinstance(value, list) else value
+
+
+async def process_streaming_task(
+    task_record: dict,
+    client: httpx.AsyncClient,
+    queue_connector,
+    timings: Optional[dict] = None,
+) -> dict:
+    """Выполняет задачу в потоковом режиме.
+
+    Для запуска flow сначала получает job_id, затем тем же клиентом читает поток
+    событий Langflow и по мере поступления дописывает каждое событие в поток
+    событий задачи. Так же выполняются запуски с chain_events: результат задачи
+    содержит все события, и второй запрос через очередь не нужен.
+
+    В timings записывается first_byte_at - момент получения первого события.
+    """
+    request = task_record.get("request", {})
+    method = request.get("method", "POST").upper()
+    endpoint = request.get("endpoint", "")
+    payload = request.get("payload", {})
+    task_id = task_record.get("task_id")
+
+    logger.info(f"Processing streaming task {task_id}", extra={"task_id": task_id})
+
+    try:
+        job_id = None
+        events_params = payload.get("query_params", {})
+        if method == "POST":
+            response = await client.post(
+                endpoint,
+                json=payload.get("body", {}),
+                params=payload.get("query_params", {}),
+            )
+            response.raise_for_status()
+            job_id = response.json()["job_id"]
+            endpoint = f"/api/v1/build/{job_id}/events"
+            events_params = {"event_delivery": "streaming"}
+
+        chunks: list[str] = []
+        async with client.stream("GET", endpoint, params=events_params) as response:
+            if response.is_error:
+                await response.aread()
+            response.raise_for_status()
+
+            async for line in response.aiter_lines():
+                line = line.strip()
+                if not line:
+                    continue
+                _mark(timings, "first_byte_at")
+                chunks.append(line)
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    event = {"raw": line}
+                with observe_redis("append_event"):
+                    await queue_connector.append_event(task_id, event)
+
+        logger.info(
+            f"Task {task_id} streamed {len(chunks)} events",
+            extra={"task_id": task_id, "status_code": response.status_code}
+        )
+        return {
+            "status_code": response.status_code,
+            "data": {"job_id": job_id, "text": "\n\n".join(chunks)},
+        }
+
+    except Exception as e:
+        return _request_error(task_id, e)
+
+
+async def call_langflow(
+    task_record: dict,
+    ctx: WorkerContext,
+    streaming: bool,
+    timings: Optional[dict] = None,
+) -> tuple[dict, LangflowBackend]:
+    """Выполняет запрос задачи на выбранном балансировщиком экземпляре Langflow.
+
+    Запуск, события которого читает задача, мог создать другой экземпляр (например,
+    через другой воркер): на ответ 404 запрос повторяется на следующем экземпляре.
+    Возвращает результат запроса и экземпляр, который его выполнил.
+    """
+    balancer = ctx.balancer
+    job_id = _events_job_id(task_record)
+    session_id = _session_id(task_record, ctx.sticky_flows)
+    tried: list[LangflowBackend] = []
+    while True:
+        backend = balancer.pick(session_id=session_id, job_id=job_id, exclude=tried)
+        tried.append(backend)
+        async with balancer.use(backend) as client:
+            if streaming:
+                response_data = await process_streaming_task(task_record, client, ctx.queue_connector, timings)
+            else:
+                response_data = await process_task(task_record, client, timings)
+        balancer.record(backend, failed=_is_backend_failure(response_data))
+        if job_id is None or response_data.get("status_code") != 404 or len(tried) >= len(balancer.backends):
+            break
+
+    data = response_data.get("data")
+    if isinstance(data, dict) and data.get("job_id"):
+        balancer.remember_job(data["job_id"], backend)
+    return response_data, backend
+
+
+async def handle_task(task_record: dict, ctx: WorkerContext) -> None:
+    """Выполняет одну задачу и сохраняет её результат в бэкенде очереди."""
+    queue_connector = ctx.queue_connector
+    task_id = task_record.get("task_id")
+    streaming = _event_delivery(task_record) == "streaming" or bool(task_record.get("chain_events"))
+    status = "failed"
+    final_updates = None
+    retried = False
+    aborted = False
+    timings = {"dequeued_at": _now()}
+    logger.info(f"Dequeued task: {task_id}", extra={"task_id": task_id})
+
+    # Сколько секунд осталось до дедлайна; None - задача без дедлайна
+    remaining = seconds_between(timings["dequeued_at"], task_record.get("deadline"))
+    if task_record.get("cancelled_at") or (remaining is not None and remaining <= 0):
+        await drop_task(task_record, ctx, "cancelled" if task_record.get("cancelled_at") else "expired", streaming)
+        return
+
+    if not await acquire_limits(task_record, ctx):
+        return
+
+    created_at = (task_record.get("request") or {}).get("created_at")
+    wait = seconds_between(created_at, timings["dequeued_at"])
+    if wait is not None:
+        QUEUE_WAIT.observe(max(wait, 0.0))
+
+    try:
+        timings["started_at"] = _now()
+        with observe_redis("update_task"):
+            claimed = await queue_connector.update_task(
+                task_id, {"status": "processing", **timings}, unless_status=TERMINAL_STATUSES
+            )
+        if not claimed:
+            # Задачу отменили между извлечением из очереди и запуском
+            raise TaskAborted("cancelled")
+
+        started = time.monotonic()
+        work = call_langflow(task_record, ctx, streaming, timings)
+        response_data, backend = await run_until_aborted(work, task_id, ctx, remaining)
+        duration = time.monotonic() - started
+        LANGFLOW_CALL.labels("streaming" if streaming else "polling").observe(duration)
+        if ctx.concurrency is not None:
+            ctx.concurrency.record(duration, overloaded=_is_overload(response_data))
+
+        exhausted = False
+        if ctx.retry_policy is not None and ctx.retry_policy.is_retryable(response_data):
+            # Потоковую задачу, уже отдавшую события, не повторяем: события задвоятся
+            if "first_byte_at" not in timings or not streaming:
+                retried = await schedule_retry(task_record, ctx, response_data, remaining, duration)
+                if retried:
+                    return
+                exhausted = True
+
+        response = {
+            "data": response_data,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        final_updates = {
+            "status": "completed",
+            "response": response,
+        }
+        if exhausted:
+            final_updates.update(status="failed", error=response_data.get("error"))
+        events_summary = await store_parsed_events(queue_connector, task_id, response_data)
+        if events_summary is not None:
+            final_updates["events_summary"] = events_summary
+        timings["finished_at"] = _now()
+        final_updates.update(
+            first_byte_at=timings.get("first_byte_at"),
+            finished_at=timings["finished_at"],
+            langflow_backend=backend.url,
+        )
+        with observe_redis("update_task"):
+            finished = await queue_connector.update_task(task_id, final_updates, unless_status=TERMINAL_STATUSES)
+        if not finished:
+            # Отмена успела раньше результата: задача остаётся отменённой,
+            # а полученный результат всё равно достаётся ведомым задачам
+            status = "cancelled"
+            logger.info(f"Task {task_id} cancelled before its result was saved", extra={"task_id": task_id})
+        elif exhausted:
+            status = final_updates["status"]
+            await dead_letter_task(queue_connector, task_id)
+        else:
+            status = final_updates["status"]
+            logger.info(f"Task {task_id} completed successfully", extra={"task_id": task_id})
+
+        if ctx.result_cache is not None and task_record.get("cache_key") and "error" not in response_data:
+            await cache_result(ctx.result_cache, task_record, response)
+
+    except TaskAborted as e:
+        aborted = True
+        logger.info(f"Task {task_id} {e.status}, Langflow request aborted", extra={"task_id": task_id})
+        timings["finished_at"] = _now()
+        final_updates = {
+            "status": e.status,
+            "first_byte_at": timings.get("first_byte_at"),
+            "finished_at": timings["finished_at"],
+        }
+        status = await finish_aborted(queue_connector, task_id, final_updates)
+
     except Exception as e:
-        error_msg = str(e)
         logger.error(
-            f"Error making request for task {task_id}: {error_msg}",
+            f"Error processing task {task_id}: {e}",
             extra={"task_id": task_id},
             exc_info=True
         )
-        return {
-            "error": error_msg,
+        timings["finished_at"] = _now()
+        final_updates = {
+            "status": "failed",
+            "error": str(e),
+            "response": {
+                "error": str(e),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+            },
+            "first_byte_at": timings.get("first_byte_at"),
+            "finished_at": timings["finished_at"],
         }
+        if not await queue_connector.update_task(task_id, final_updates, unless_status=TERMINAL_STATUSES):
+            status = "cancelled"
 
+    finally:
+        if ctx.limiter is not None:
+            await release_limits(task_record, ctx)
+        # Задача, отложенная до следующей попытки, не завершена: defer уже снял её с обработки
+        if not retried:
+            TASKS_FINISHED.labels(status).inc()
+            total = seconds_between(created_at, timings.get("finished_at"))
+            if total is not None:
+                TASK_DURATION.labels(status).observe(max(total, 0.0))
+            if task_record.get("dedup_key"):
+                # Отмена или дедлайн ведущей задачи не относятся к ведомым: они ждут новую ведущую
+                if aborted:
+                    await hand_over_dedup(queue_connector, task_record)
+                elif final_updates is not None:
+                    await fan_out_result(queue_connector, task_record, final_updates)
+            if streaming:
+                await queue_connector.end_events(task_id, status)
+            with observe_redis("ack"):
+                await queue_connector.ack(task_id)
 
-def main():
-    """Основной цикл воркера, который извлекает задачи из очереди."""
-    queue_connector = init_queue_connector()
-    dequeue_timeout = int(os.getenv("WORKER_DEQUEUE_TIMEOUT", "5"))
-    
-    logger.info("Worker started, waiting for tasks from queue...")
-    
+
+async def schedule_retry(
+    task_record: dict,
+    ctx: WorkerContext,
+    response_data: dict,
+    remaining: Optional[float],
+    elapsed: float,
+) -> bool:
+    """Откладывает задачу до следующей попытки через отложенное множество очереди.
+
+    Воркер не ждёт задержку сам: задачу вернёт в очередь promote_delayed, и её
+    выполнит первый свободный воркер. Возвращает False, если попытки исчерпаны,
+    следующая попытка не успевает к дедлайну задачи или отложить её не удалось.
+    """
+    policy = ctx.retry_policy
+    task_id = task_record.get("task_id")
+    attempt = int(task_record.get("attempts") or 0) + 1
+    if attempt > policy.max_retries:
+        return False
+    delay = policy.delay(attempt, response_data.get("retry_after"))
+    if remaining is not None and delay >= remaining - elapsed:
+        logger.info(f"Task {task_id} retry would miss its deadline", extra={"task_id": task_id})
+        return False
+
+    retry_at = datetime.fromtimestamp(time.time() + delay, timezone.utc).isoformat()
+    try:
+        pending = await ctx.queue_connector.update_task(
+            task_id,
+            {
+                "status": "pending",
+                "attempts": attempt,
+                "retry_at": retry_at,
+                "last_error": response_data.get("error"),
+            },
+            unless_status=TERMINAL_STATUSES,
+        )
+        if not pending:
+            # Задачу отменили во время запуска: повторять её не нужно
+            return False
+        await ctx.queue_connector.defer(task_id, delay)
+    except Exception as e:
+        logger.error(f"Failed to schedule retry of task {task_id}: {e}", extra={"task_id": task_id}, exc_info=True)
+        return False
+
+    TASKS_RETRIED.labels(retry_reason(response_data)).inc()
+    logger.warning(
+        f"Task {task_id} failed ({response_data.get('error')}), retry {attempt}/{policy.max_retries} in {delay:.2f}s",
+        extra={"task_id": task_id},
+    )
+    return True
+
+
+async def dead_letter_task(queue_connector, task_id: str) -> None:
+    """Переносит задачу, исчерпавшую попытки, в очередь недоставленных для разбора и повтора."""
+    logger.error(f"Task {task_id} exhausted retries, moved to dead letters", extra={"task_id": task_id})
+    try:
+        await queue_connector.dead_letter(task_id)
+    except Exception as e:
+        logger.error(f"Failed to dead-letter task {task_id}: {e}", extra={"task_id": task_id}, exc_info=True)
+
+
+async def drop_task(task_record: dict, ctx: WorkerContext, status: str, streaming: bool) -> None:
+    """Завершает отменённую задачу или задачу с истёкшим дедлайном, не вызывая Langflow."""
+    queue_connector = ctx.queue_connector
+    task_id = task_record.get("task_id")
+    logger.info(f"Task {task_id} {status} before start, skipping", extra={"task_id": task_id})
+    updates = {"status": status, "finished_at": _now()}
+    try:
+        status = await finish_aborted(queue_connector, task_id, updates)
+        if task_record.get("dedup_key"):
+            await hand_over_dedup(queue_connector, task_record)
+        if streaming:
+            await queue_connector.end_events(task_id, status)
+    finally:
+        TASKS_FINISHED.labels(status).inc()
+        with observe_redis("ack"):
+            await queue_connector.ack(task_id)
+
+
+async def finish_aborted(queue_connector, task_id: str, updates: dict) -> str:
+    """Сохраняет итог прерванной задачи и возвращает её итоговый статус.
+
+    Статус expired записывается, только если задачу не успели завершить иначе;
+    у задачи, которую уже отменили, отмечается только время завершения.
+    """
+    if await queue_connector.update_task(task_id, updates, unless_status=TERMINAL_STATUSES):
+        return updates["status"]
+    await queue_connector.update_task(task_id, {k: v for k, v in updates.items() if k != "status"})
+    return "cancelled"
+
+
+async def run_until_aborted(work: Awaitable[Any], task_id: str, ctx: WorkerContext, timeout: Optional[float]) -> Any:
+    """Выполняет запрос к Langflow, пока задачу не отменили и не истёк её дедлайн.
+
+    Иначе отменяет запрос (httpx при этом закрывает соединение с Langflow)
+    и выбрасывает TaskAborted с итоговым статусом задачи.
+    """
+    request = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(watch_abort(ctx.queue_connector, task_id, timeout, ctx.cancel_check_interval))
+    try:
+        await asyncio.wait((request, watcher), return_when=asyncio.FIRST_COMPLETED)
+        if request.done():
+            return request.result()
+        raise TaskAborted(watcher.result())
+    finally:
+        request.cancel()
+        watcher.cancel()
+        await asyncio.gather(request, watcher, return_exceptions=True)
+
+
+async def watch_abort(queue_connector, task_id: str, timeout: Optional[float], interval: float) -> str:
+    """Ждёт отмены задачи или истечения её дедлайна через timeout секунд.
+
+    Возвращает итоговый статус: cancelled или expired. Без дедлайна ждёт только отмены.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
     while True:
+        wait = interval
+        if deadline is not None:
+            wait = min(wait, deadline - time.monotonic())
+            if wait <= 0:
+                return "expired"
         try:
-            task_record = queue_connector.dequeue(timeout=dequeue_timeout)
-            
-            if task_record is None:
-                logger.debug("No tasks in queue, continuing to wait...")
-                continue
-            
-            task_id = task_record.get("task_id")
-            logger.info(f"Dequeued task: {task_id}", extra={"task_id": task_id})
-            
-            try:
-                queue_connector.update_task(task_id, {"status": "processing"})
-                
-                response_data = process_task(task_record, queue_connector)
-                
-                queue_connector.update_task(task_id, {
-                    "status": "completed",
-                    "response": {
-                        "data": response_data,
-                        "created_at": datetime.now(timezone.utc).isoformat(),
-                    },
-                })
-                logger.info(f"Task {task_id} completed successfully", extra={"task_id": task_id})
-                
-            except Exception as e:
-                logger.error(
-                    f"Error processing task {task_id}: {e}",
-                    extra={"task_id": task_id},
-                    exc_info=True
-                )
-                queue_connector.update_task(task_id, {
-                    "status": "failed",
-                    "error": str(e),
-                    "response": {
-                        "error": str(e),
-                        "created_at": datetime.now(timezone.utc).isoformat(),
-                    },
-                })
-                
-        except KeyboardInterrupt:
-            logger.info("Worker stopped by user")
-            break
+            record = await queue_connector.wait_for_task(
+                task_id, timeout=wait, statuses={"cancelled"}, include_response=False
+            )
         except Exception as e:
-            logger.error(f"Error in worker loop: {e}", exc_info=True)
+            logger.warning(f"Failed to check cancellation of task {task_id}: {e}", extra={"task_id": task_id})
+            await asyncio.sleep(wait)
             continue
+        # Отмена, пришедшая до перевода задачи в processing, видна только по cancelled_at
+        if record is not None and (record.get("status") == "cancelled" or record.get("cancelled_at")):
+            return "cancelled"
+
+
+async def store_parsed_events(queue_connector, task_id: str, response_data: dict) -> Optional[dict]:
+    """Один раз разбирает события Langflow из ответа и сохраняет их для постраничного чтения.
+
+    Возвращает сводку для записи задачи или None, если ответ не содержит событий
+    или сохранить их не удалось (тогда события разбираются из ответа при чтении).
+    """
+    text = response_text({"data": response_data})
+    if text is None:
+        return None
+    try:
+        events = parse_event_text(text)
+        with observe_redis("store_events"):
+            return await queue_connector.store_events(
+                task_id, events, status_code=response_data.get("status_code")
+            )
+    except Exception as e:
+        logger.warning(f"Failed to store parsed events of task {task_id}: {e}", extra={"task_id": task_id})
+        return None
+
+
+def _limits_endpoint(ctx: WorkerContext) -> str:
+    return ctx.balancer.key
+
+
+async def acquire_limits(task_record: dict, ctx: WorkerContext) -> bool:
+    """Занимает слоты и токены задачи. Если лимит исчерпан, откладывает задачу.
+
+    Возвращает False, если задача отложена и выполнять её сейчас не нужно.
+    Ошибки ограничителя не должны останавливать обработку: задача выполняется без лимитов.
+    """
+    if ctx.limiter is None:
+        return True
+    task_id = task_record.get("task_id")
+    try:
+        retry_after = await ctx.limiter.acquire(task_record, _limits_endpoint(ctx))
+        if retry_after <= 0:
+            return True
+        await ctx.queue_connector.defer(task_id, retry_after)
+    except Exception as e:
+        logger.warning(f"Failed to apply limits to task {task_id}: {e}", extra={"task_id": task_id})
+        return True
+
+    logger.info(f"Task {task_id} deferred for {retry_after:.2f}s by limits", extra={"task_id": task_id})
+    return False
+
+
+async def release_limits(task_record: dict, ctx: WorkerContext) -> None:
+    task_id = task_record.get("task_id")
+    try:
+        await ctx.limiter.release(task_record, _limits_endpoint(ctx))
+    except Exception as e:
+        logger.warning(f"Failed to release limits of task {task_id}: {e}", extra={"task_id": task_id})
+
+
+async def fan_out_result(queue_connector, task_record: dict, updates: dict) -> None:
+    """Раздаёт итог ведущей задачи всем объединённым с ней ведомым задачам."""
+    task_id = task_record.get("task_id")
+    try:
+        followers = await queue_connector.release_dedup(task_record["dedup_key"], task_id)
+        if followers:
+            # Ведомые задачи, которые клиент уже отменил, не перезаписываются
+            delivered = await queue_connector.update_many(followers, updates, unless_status=TERMINAL_STATUSES)
+            logger.info(
+                f"Task {task_id} result delivered to {len(delivered)} coalesced tasks",
+                extra={"task_id": task_id},
+            )
+    except Exception as e:
+        logger.error(f"Failed to deliver result of task {task_id} to coalesced tasks: {e}", exc_info=True)
+
+
+async def hand_over_dedup(queue_connector, task_record: dict) -> None:
+    """Передаёт роль прерванной ведущей задачи одной из ждущих ведомых задач."""
+    task_id = task_record.get("task_id")
+    try:
+        leader = await queue_connector.hand_over_dedup(task_record["dedup_key"], task_id)
+        if leader:
+            logger.info(f"Task {task_id} handed coalesced tasks over to {leader}", extra={"task_id": task_id})
+    except Exception as e:
+        logger.error(f"Failed to hand coalesced tasks of task {task_id} over: {e}", exc_info=True)
+
+
+async def cache_result(result_cache: ResultCache, task_record: dict, response: dict) -> None:
+    """Сохраняет успешный результат задачи в кэш. Ошибки кэша не влияют на задачу."""
+    task_id = task_record.get("task_id")
+    try:
+        await result_cache.set(task_record["cache_key"], response, flow_id=task_record.get("flow_id"))
+    except Exception as e:
+        logger.warning(f"Failed to cache result of task {task_id}: {e}", extra={"task_id": task_id})
+
+
+async def reap_expired_tasks(queue_connector, interval: float) -> None:
+    """Периодически возвращает в очередь задачи, чей таймаут видимости истёк."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            requeued = await queue_connector.reap_expired()
+            if requeued:
+                logger.warning(f"Requeued {len(requeued)} expired tasks: {requeued}")
+        except Exception as e:
+            logger.error(f"Error reaping expired tasks: {e}", exc_info=True)
+
+
+async def promote_delayed_tasks(queue_connector, interval: float) -> None:
+    """Периодически возвращает в очередь отложенные задачи, время которых наступило."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await queue_connector.promote_delayed()
+        except Exception as e:
+            logger.error(f"Error promoting delayed tasks: {e}", exc_info=True)
+
+
+async def report_worker_stats(queue_connector, stats: Callable[[], dict], interval: float) -> None:
+    """Периодически публикует показатели воркера, чтобы их было видно в /queue_stats."""
+    while True:
+        try:
+            await queue_connector.report_worker_stats(stats())
+        except Exception as e:
+            logger.warning(f"Failed to report worker stats: {e}")
+        await asyncio.sleep(interval)
+
+
+def init_retry_policy() -> Optional[RetryPolicy]:
+    """Создаёт политику повторов из окружения; TASK_MAX_RETRIES=0 отключает повторы."""
+    max_retries = int(os.getenv("TASK_MAX_RETRIES", "3"))
+    if max_retries <= 0:
+        return None
+    status_codes = os.getenv("TASK_RETRY_STATUS_CODES", ",".join(map(str, DEFAULT_STATUS_CODES)))
+    exceptions = os.getenv("TASK_RETRY_EXCEPTIONS", ",".join(DEFAULT_EXCEPTIONS))
+    return RetryPolicy(
+        max_retries=max_retries,
+        status_codes=[int(code) for code in status_codes.split(",") if code.strip()],
+        exceptions=[name.strip() for name in exceptions.split(",") if name.strip()],
+        base_delay=float(os.getenv("TASK_RETRY_BASE_DELAY", "1")),
+        max_delay=float(os.getenv("TASK_RETRY_MAX_DELAY", "60")),
+    )
+
+
+async def run_worker(queue_connector: Optional[Any] = None, stop: Optional[asyncio.Event] = None) -> None:
+    """Основной цикл воркера: держит в работе до WORKER_CONCURRENCY задач одновременно.
+
+    Запросы распределяются между экземплярами Langflow из LANGFLOW_URLS.
+
+    При WORKER_CONCURRENCY_MODE=adaptive WORKER_CONCURRENCY - только начальный
+    лимит, дальше он подстраивается под задержку и перегрузку Langflow.
+    Коннектор очереди по умолчанию создаётся из окружения; бенчмарк передаёт свой.
+    После установки stop воркер перестаёт брать задачи, дожидается выполняемых и завершается.
+    """
+    if queue_connector is None:
+        queue_connector = init_queue_connector()
+    dequeue_timeout = int(os.getenv("WORKER_DEQUEUE_TIMEOUT", "5"))
+    concurrency = max(1, int(os.getenv("WORKER_CONCURRENCY", "1")))
+
+    adaptive = None
+    if os.getenv("WORKER_CONCURRENCY_MODE", "fixed").strip().lower() == "adaptive":
+        adaptive = AdaptiveConcurrency(
+            concurrency,
+            min_limit=max(1, int(os.getenv("WORKER_MIN_CONCURRENCY", "1"))),
+            max_limit=int(os.getenv("WORKER_MAX_CONCURRENCY", str(max(64, concurrency)))),
+            tolerance=float(os.getenv("WORKER_LATENCY_TOLERANCE", "1.5")),
+        )
+        slots = adaptive
+        pool_size = adaptive.max_limit
+    else:
+        slots = asyncio.Semaphore(concurrency)
+        pool_size = concurrency
+    in_flight: set[asyncio.Task] = set()
+    balancer = init_langflow_balancer(pool_size)
+
+    def _stats() -> dict:
+        return {
+            "mode": "adaptive" if adaptive is not None else "fixed",
+            "concurrency_limit": adaptive.limit if adaptive is not None else concurrency,
+            "in_flight": len(in_flight),
+            "langflow_backends": balancer.stats(),
+        }
+
+    WORKER_IN_FLIGHT.set_function(lambda: len(in_flight))
+    WORKER_CONCURRENCY_LIMIT.set_function(lambda: _stats()["concurrency_limit"])
+    metrics_port = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+    if metrics_port > 0:
+        start_http_server(metrics_port)
+
+    def _release(task: asyncio.Task) -> None:
+        in_flight.discard(task)
+        slots.release()
+
+    reaper = None
+    if queue_connector.reliable:
+        recovered = await queue_connector.recover_processing()
+        if recovered:
+            logger.warning(f"Recovered {recovered} unacknowledged tasks from previous run")
+        reaper_interval = float(os.getenv("QUEUE_REAPER_INTERVAL", "30"))
+        reaper = asyncio.create_task(reap_expired_tasks(queue_connector, reaper_interval))
+
+    delayed_interval = float(os.getenv("QUEUE_DELAYED_POLL_INTERVAL", "1"))
+    promoter = asyncio.create_task(promote_delayed_tasks(queue_connector, delayed_interval))
+    stats_interval = float(os.getenv("WORKER_STATS_INTERVAL", "10"))
+    reporter = asyncio.create_task(report_worker_stats(queue_connector, _stats, stats_interval))
+    health_checker = None
+    health_interval = float(os.getenv("LANGFLOW_HEALTH_INTERVAL", "10"))
+    if health_interval > 0:
+        health_checker = asyncio.create_task(balancer.run_health_checks(health_interval))
+
+    logger.info(f"Worker started ({_stats()}), waiting for tasks from queue...")
+
+    async with balancer:
+        ctx = WorkerContext(
+            queue_connector=queue_connector,
+            balancer=balancer,
+            result_cache=init_result_cache(getattr(queue_connector, "redis", None)),
+            limiter=init_langflow_limiter(getattr(queue_connector, "redis", None)),
+            concurrency=adaptive,
+            cancel_check_interval=float(os.getenv("WORKER_CANCEL_CHECK_INTERVAL", "5")),
+            retry_policy=init_retry_policy(),
+            sticky_flows=frozenset(
+                flow_id.strip() for flow_id in os.getenv("LANGFLOW_STICKY_FLOWS", "").split(",") if flow_id.strip()
+            ),
+        )
+        try:
+            while stop is None or not stop.is_set():
+                # Новую задачу забираем только при наличии свободного слота
+                await slots.acquire()
+                # Свободные слоты, включая только что занятый: больше задач бэкенд за воркером не держит
+                free = (adaptive.limit if adaptive is not None else concurrency) - len(in_flight)
+                try:
+                    task_record = await queue_connector.dequeue(timeout=dequeue_timeout, prefetch=max(1, free))
+                except Exception as e:
+                    slots.release()
+                    logger.error(f"Error in worker loop: {e}", exc_info=True)
+                    continue
+
+                if task_record is None:
+                    slots.release()
+                    logger.debug("No tasks in queue, continuing to wait...")
+                    continue
+
+                task = asyncio.create_task(handle_task(task_record, ctx))
+                in_flight.add(task)
+                task.add_done_callback(_release)
+        finally:
+            promoter.cancel()
+            reporter.cancel()
+            if health_checker is not None:
+                health_checker.cancel()
+            if reaper is not None:
+                reaper.cancel()
+            if in_flight:
+                await asyncio.gather(*in_flight, return_exceptions=True)
+            await queue_connector.close()
+
+
+def main():
+    """Точка входа воркера."""
+    try:
+        asyncio.run(run_worker())
+    except KeyboardInterrupt:
+        logger.info("Worker stopped by user")
 
 
 if __name__ == "__main__":